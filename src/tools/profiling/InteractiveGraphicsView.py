@@ -19,13 +19,16 @@
 
 import copy
 from PySide6.QtWidgets import QGraphicsView, QGraphicsScene, QApplication
-from PySide6.QtCore import Qt, QPointF
+from PySide6.QtCore import Qt, QPointF, QTimer
 from PySide6.QtCore import Signal as pyqtSignal
 from PySide6.QtGui import QResizeEvent, QMouseEvent, QPainter, QBrush, QPen, QCursor, QFont
 from PySide6.QtGui import QImage, QColor
 import numpy as np
 import math
-from const import GENERIC_OK, QUALITY_COLOURS_16BIT
+from const import QUALITY_COLOURS_16BIT
+from cht_data_calcs import PatchGridTransformer
+
+DEFAULT_REFRESH_RATE = 60.  # Hz, used when the screen does not report its refresh rate
 
 
 class InteractiveGraphicsView(QGraphicsView):
@@ -111,6 +114,15 @@ class InteractiveGraphicsView(QGraphicsView):
         self.corner_on_drag_color = Qt.GlobalColor.red  # Point color during drag
         self.corner_idx = None            # corner index
 
+        self._grid_transformer = None   # PatchGridTransformer for the current chart
+        self._metrics_scale = None      # view scale the pens and fonts were computed for
+
+        # Drag updates are coalesced to one grid transform per display frame
+        self._pending_corner = None     # (corner_idx, position) waiting for the next frame
+        self._drag_timer = QTimer(self)
+        self._drag_timer.setSingleShot(True)
+        self._drag_timer.timeout.connect(self._flush_corner_position)
+
     def set_background_image(self, img_array, record , is_demo = True,  background_brightness: int = 100):
         """Get an image as a NumPy-array, converts it and save for future use."""
         cht_data = record["cht_data"]
@@ -133,6 +145,7 @@ class InteractiveGraphicsView(QGraphicsView):
         self.half_patch  = copy.copy(self.patch_wh) / 2
 
         self.rgb = cht_data['RGB']
+        self._grid_transformer = PatchGridTransformer(self.uv, self.uv_wh)
 
         from cht_data_calcs import adopt_corner_target
         adopt_corner_target(self.corner, width , height)
@@ -399,6 +412,10 @@ class InteractiveGraphicsView(QGraphicsView):
         self.dragging = True
         self.dragged_corner = corner_idx
 
+        screen = self.screen()
+        refresh_rate = screen.refreshRate() if screen else 0
+        self._drag_timer.setInterval(int(1000 / (refresh_rate or DEFAULT_REFRESH_RATE)))
+
         # Change cursor to "move"
         self.setCursor(QCursor(Qt.CursorShape.ClosedHandCursor))
 
@@ -415,24 +432,42 @@ class InteractiveGraphicsView(QGraphicsView):
     def update_corner_position(self, corner_idx, new_position):
         """Update reference point position during drag.
 
+        The corner moves immediately, the grid is recalculated and repainted
+        at most once per display frame.
+
         Args:
             corner_idx (int): Reference point name
             new_position (QPointF): New position
         """
         self.corner[corner_idx][:] = [new_position.x(), new_position.y()]
 
-        # Recalculate patch centers
-        self.apply_grid_transform()
+        self._pending_corner = (corner_idx, QPointF(new_position))
+        if not self._drag_timer.isActive():
+            self._drag_timer.start()
+
+    def _flush_corner_position(self):
+        """Apply the last corner position collected during the current frame."""
+        if self._pending_corner is None:
+            return
+        corner_idx, position = self._pending_corner
+        self._pending_corner = None
+
+        # Recalculate patch centers, zoom is locked during drag
+        self._transform_grid()
 
         # Update display
         self.viewport().update()
 
         # Notify about position change
-        self.corner_position_changed.emit(corner_idx, new_position)
+        self.corner_position_changed.emit(corner_idx, position)
 
     def finish_corner_drag(self):
         """Finish dragging reference point."""
         if self.dragging and self.dragged_corner is not None:
+            # Apply the last position that is still waiting for a frame
+            self._drag_timer.stop()
+            self._flush_corner_position()
+
             # Return cursor to normal
             self.setCursor(QCursor(Qt.CursorShape.ArrowCursor))
 
@@ -568,15 +603,21 @@ class InteractiveGraphicsView(QGraphicsView):
         if self.uv is None or self.uv.size == 0:
             return
 
-        from cht_data_calcs import compute_patch_wh_aligned
-        ret, centers, wh = compute_patch_wh_aligned(self.uv, self.uv_wh, self.corner, self.patch_scale)
-        if ret == GENERIC_OK:
-            self.points[:] = centers
-            self.patch_wh[:] = wh
-            self.half_patch[:] =  wh / 2
+        self._transform_grid()
+        self._update_zoom_metrics()
+
+    def _transform_grid(self):
+        """Project the UV grid through the corner quad into points/patch_wh in place."""
+        self._grid_transformer.transform(self.corner, self.patch_scale,
+                                         self.points, self.patch_wh, self.half_patch)
 
+    def _update_zoom_metrics(self):
+        """Rebuild pens, radii and font size when the zoom level changes."""
         # Minimum scale
         c_scale = self.get_current_scale()
+        if c_scale == self._metrics_scale:
+            return
+        self._metrics_scale = c_scale
         image_scale = max(1., -math.log2(c_scale))
 
         self.gridpoint_radius = int(self.gridpoint_radius_ref * image_scale)
@@ -2,6 +2,7 @@ import sys
 import os
 import traceback
 import copy
+import struct
 from pathlib import Path
 import numpy as np
 
@@ -449,7 +450,37 @@ class MainApp(QtWidgets.QMainWindow):
     def action_create_cube_lut(self):
         """Create .cube LUT"""
         print("Action: Create Cube LUT")
-        # TODO: Implement create cube LUT functionality
+        from cube_lut import CUBE_SIZES, DEFAULT_CUBE_SIZE, create_cube_lut, dcp_cube_transform, icc_cube_transform
+
+        source_file = open_file_dialog('lut_source', self.project_directory)
+        if not source_file:
+            self.log(self.tr("Create LUT canceled"))
+            return
+
+        size_text, ok = QtWidgets.QInputDialog.getItem(
+            self, self.tr("Create .cube LUT"), self.tr("LUT size:"),
+            [str(size) for size in CUBE_SIZES], CUBE_SIZES.index(DEFAULT_CUBE_SIZE), False)
+        if not ok:
+            self.log(self.tr("Create LUT canceled"))
+            return
+
+        lut_file = save_file_dialog('cube', os.path.splitext(source_file)[0] + '.cube')
+        if not lut_file:
+            self.log(self.tr("Create LUT canceled"))
+            return
+
+        try:
+            if source_file.lower().endswith('.dcp'):
+                from create_dcp_profile import read_dcp_profile
+                transform = dcp_cube_transform(read_dcp_profile(source_file))
+            else:
+                transform = icc_cube_transform(source_file)
+            create_cube_lut(lut_file, transform, int(size_text))
+        except (OSError, ValueError, KeyError, IndexError, struct.error) as e:
+            self.log(self.tr("Create LUT failed: {0}").format(e))
+            return
+
+        self.log(self.tr("LUT saved: {0}").format(lut_file))
 
     def action_about(self):
         """Show about dialog"""
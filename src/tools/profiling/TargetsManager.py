@@ -73,25 +73,9 @@ def get_tiff_physical_size(tiff_path):
             'height_mm': 508.0
         }
     """
+    from create_target_preview import image_physical_size
     with Image.open(tiff_path) as img:
-        width_px, height_px = img.size
-
-        # Try to extract DPI (dots per inch)
-        dpi = img.info.get('dpi', (300, 300))  # default 300 DPI
-        dpi_x, dpi_y = dpi
-
-        # Convert pixels to mm: 1 inch = 25.4 mm
-        width_mm = width_px / dpi_x * 25.4
-        height_mm = height_px / dpi_y * 25.4
-
-        return {
-            "width_px": width_px,
-            "height_px": height_px,
-            "dpi_x": dpi_x,
-            "dpi_y": dpi_y,
-            "width_mm": width_mm,
-            "height_mm": height_mm
-        }
+        return image_physical_size(img)
 
 class TargetsManager:
     def __init__(self, create_new_project_dict: dict|None = None):
@@ -134,8 +118,7 @@ class TargetsManager:
 
         cht = new_project_dict["targets"]["cht_names"]
         self.header['markers'] = new_project_dict["targets"]["markers"]
-        for cht_name in cht:
-            self.add_cht_file(cht_name)
+        self.add_cht_files(cht)
 
         self.set_cht("")
         return True
@@ -167,29 +150,41 @@ class TargetsManager:
     def add_cht_file(self, cht_file: str) ->bool:
         """Read cht file and tiff additions. Build cht_data from them,
         return True on success, False on error."""
-        from create_target_preview import create_color_target_tiff , resize_tiff_to_96dpi
-        if not cht_file:
-            print(tr("Empty file name passed to add_cht_file"))
-            return False
+        return self.add_cht_files([cht_file])
+
+    def add_cht_files(self, cht_files: list[str]) -> bool:
+        """Read cht files and tiff additions, previews are built concurrently.
+        return True if all files were added, False on any error."""
+        from create_target_preview import build_target_previews
+        is_ok = True
+        jobs = []
+        for cht_file in cht_files:
+            if not cht_file:
+                print(tr("Empty file name passed to add_cht_file"))
+                is_ok = False
+                continue
 
-        ret, cht_data = parse_cht_file(cht_file)
-        if ret != GENERIC_OK:
-            print(tr("Error: parsing error: {0}").format(cht_file))
-            return False
+            ret, cht_data = parse_cht_file(cht_file)
+            if ret != GENERIC_OK:
+                print(tr("Error: parsing error: {0}").format(cht_file))
+                is_ok = False
+                continue
+
+            # create a preview file based on cht or on the original target
+            preview_file = Path(cht_file).stem + "_preview.tif"
+            jobs.append((cht_file, cht_data, preview_file))
 
-        # create a preview file based on cht or on the original target
-        spare_tif_file= get_tif_file(cht_file)
-        cht_file_path = Path(cht_file)
-        cht_name = cht_file_path.stem
-        preview_file = cht_name + "_preview.tif"
-        if  spare_tif_file:
-            resize_tiff_to_96dpi(spare_tif_file, preview_file)
-        else:
-            create_color_target_tiff(cht_data, preview_file, cht_file_path.stem)
+        for (cht_file, cht_data, preview_file), (ret, s_size) in zip(jobs, build_target_previews(jobs)):
+            if ret != GENERIC_OK:
+                print(tr("Error: preview creation error: {0}").format(cht_file))
+                is_ok = False
+                continue
+            self._add_cht_data(cht_file, cht_data, preview_file, s_size)
 
-        spare_tif_file = preview_file
+        return is_ok
 
-        s_size = get_tiff_physical_size(spare_tif_file)
+    def _add_cht_data(self, cht_file: str, cht_data: dict, preview_file: str, s_size: dict):
+        """Map cht_data onto the preview and register it for every marker."""
         # Get image width and height
         image_width = s_size["width_px"]
         image_height = s_size["height_px"]
@@ -224,8 +219,6 @@ class TargetsManager:
                 self.data[nme] = copy.deepcopy(data)
                 self.data[nme]['tag']= marker
 
-        return True
-
     def get_outputs(self):
         """Provide the list of target artifacts of the project (ICC, LUT ....)"""
         return self.header.get("outputs")
@@ -1,40 +1,22 @@
 import sys
+import os
+import shutil
 import subprocess
-from typing import List, Optional, Callable
-from PySide6.QtCore import QThread, QTimer
+import threading
+import queue
+import time
+import atexit
+import itertools
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import Any, List, Optional, Callable, Iterable, Tuple
+from PySide6.QtCore import QThread, QTimer, QObject, QEventLoop, QCoreApplication
 from PySide6.QtCore import Signal as pyqtSignal
 from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QProgressBar, QApplication
 from PySide6.QtCore import Qt
 
 
-class BackgroundProcessThread(QThread):
-    """Thread for executing subprocess commands in background."""
-    finished = pyqtSignal(int, str, str)  # return_code, stdout, stderr
-    error = pyqtSignal(str)
-
-    def __init__(self, cmd: List[str], timeout: int = 300, stdin_handle = None):
-        super().__init__()
-        self.cmd = cmd
-        self.timeout = timeout
-        self.stdin_handle = stdin_handle
-
-    def run(self):
-        try:
-            result = subprocess.run(
-                self.cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=self.timeout,
-                stdin = self.stdin_handle  or sys.stdin
-            )
-            self.finished.emit(result.returncode, result.stdout, result.stderr)
-        except subprocess.TimeoutExpired:
-            self.error.emit("timeout")
-        except Exception as e:
-            self.error.emit(str(e))
-
-
 class LoadingDialog(QDialog):
     """Animated loading dialog with spinner."""
 
@@ -91,12 +73,330 @@ class LoadingDialog(QDialog):
         super().closeEvent(event)
 
 
+class JobError(RuntimeError):
+    """Job could not run (timeout, start failure, failed dependency)."""
+
+
+class JobCancelledError(JobError):
+    """Job was cancelled before or while running."""
+
+
+class JobSignals(QObject):
+    """Carries job completion from worker threads to the thread that created the job."""
+    finished = pyqtSignal(object)  # Job
+
+
+class Job:
+    """
+    One external command run by JobScheduler.
+
+    future holds (return_code, stdout, stderr) or JobError. Done callbacks run in the
+    thread that created the job (UI thread) once it has finished, in registration order.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    _ids = itertools.count(1)
+
+    def __init__(self, cmd: List[str], timeout: int = 300, stdin_handle=None,
+                 depends_on: Iterable['Job'] = (), name: str = '', cwd: Optional[str] = None):
+        self.id = next(self._ids)
+        self.cmd = list(cmd)
+        self.name = name or os.path.basename(str(cmd[0]))
+        self.timeout = timeout
+        self.stdin_handle = stdin_handle
+        self.depends_on = list(depends_on)
+        self.cwd = cwd
+
+        self.state = Job.PENDING
+        self.return_code = None
+        self.stdout = ''
+        self.stderr = ''
+        self.error = ''
+        self.future = Future()
+
+        self.process = None
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+        self._delivered = False
+
+        # Без Qt приложения колбэки вызываются прямо из рабочего потока
+        self._direct = QCoreApplication.instance() is None
+        self.signals = JobSignals()
+        self.signals.finished.connect(self._deliver)
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.name}, {self.state})"
+
+    @property
+    def succeeded(self) -> bool:
+        return self.state == Job.DONE and self.return_code == 0
+
+    def done(self) -> bool:
+        return self._delivered
+
+    def result(self, timeout: Optional[float] = None) -> Tuple[int, str, str]:
+        """(return_code, stdout, stderr); raises JobError / JobCancelledError."""
+        return self.future.result(timeout)
+
+    def add_done_callback(self, callback: Callable[['Job'], None]):
+        """Call callback(job) after the job finished (immediately if it already has)."""
+        with self._callback_lock:
+            if not self._delivered:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self) -> bool:
+        """Cancel pending job or kill running process. Returns False if already finished."""
+        with self._lock:
+            if self.state == Job.PENDING:
+                self._finish(Job.CANCELLED, error='cancelled')
+            elif self.state == Job.RUNNING:
+                self.state = Job.CANCELLED
+                if self.process is not None and self.process.poll() is None:
+                    self.process.kill()
+                return True
+            else:
+                return False
+        self._notify()
+        return True
+
+    # --- Выполнение (рабочий поток) ---
+
+    def _run(self):
+        with self._lock:
+            if self.state != Job.PENDING:
+                return
+            self.state = Job.RUNNING
+            try:
+                process = subprocess.Popen(
+                    self.cmd,
+                    stdin=self.stdin_handle or sys.stdin,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    cwd=self.cwd
+                )
+            except Exception as e:
+                process = None
+                self._finish(Job.FAILED, error=str(e))
+            self.process = process
+
+        if process is not None:
+            timed_out = False
+            try:
+                stdout, stderr = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                stdout, stderr = process.communicate()
+                timed_out = True
+
+            with self._lock:
+                if self.state == Job.CANCELLED:
+                    self._finish(Job.CANCELLED, error='cancelled', stdout=stdout, stderr=stderr)
+                elif timed_out:
+                    self._finish(Job.FAILED, error='timeout', stdout=stdout, stderr=stderr)
+                else:
+                    self.return_code = process.returncode
+                    self._finish(Job.DONE, stdout=stdout, stderr=stderr)
+        self._notify()
+
+    def _finish(self, state: str, error: str = '', stdout: str = '', stderr: str = ''):
+        """Set final state and future (called with _lock held, _notify follows outside it)."""
+        self.state = state
+        self.error = error
+        self.stdout = stdout or ''
+        self.stderr = stderr or ''
+        self.process = None
+        if state == Job.DONE:
+            self.future.set_result((self.return_code, self.stdout, self.stderr))
+        elif state == Job.CANCELLED:
+            self.future.set_exception(JobCancelledError(error))
+        else:
+            self.future.set_exception(JobError(error))
+
+    def _notify(self):
+        if self._direct:
+            self._deliver(self)
+        else:
+            self.signals.finished.emit(self)
+
+    def _deliver(self, _job=None):
+        with self._callback_lock:
+            self._delivered = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class JobScheduler:
+    """
+    Bounded worker pool for external commands.
+
+    Independent jobs run concurrently (up to max_workers). A job with depends_on starts
+    only after all of its dependencies succeeded (return code 0); if any of them fails
+    or is cancelled, the job is cancelled too, so chains like
+    targen -> printtarg -> txt2ti3 -> colprof stop at the first failed step.
+    Callbacks of the cancelled job run after those of the failed dependency.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='job')
+        self._jobs = []
+        self._lock = threading.Lock()
+
+    def submit(
+            self,
+            cmd: List[str],
+            timeout: int = 300,
+            depends_on: Iterable[Job] = (),
+            stdin_handle=None,
+            on_finished: Optional[Callable[[Job], None]] = None,
+            name: str = '',
+            cwd: Optional[str] = None
+    ) -> Job:
+        """
+        Queue command.
+
+        Args:
+            cmd: Command list (started without shell)
+            timeout: Timeout in seconds
+            depends_on: Jobs that must succeed first
+            stdin_handle: File object for stdin
+            on_finished: Callback(job), runs in the creating (UI) thread
+            name: Display name, defaults to executable name
+            cwd: Working directory of the command
+
+        Returns:
+            Job
+        """
+        job = Job(cmd, timeout, stdin_handle, depends_on, name, cwd)
+        if on_finished is not None:
+            job.add_done_callback(on_finished)
+
+        with self._lock:
+            self._jobs = [j for j in self._jobs if not j.future.done()]
+            self._jobs.append(job)
+
+        pending = [dep for dep in job.depends_on if not dep.future.done()]
+        if not pending:
+            self._start_when_ready(job)
+        else:
+            remaining = [len(pending)]
+            counter_lock = threading.Lock()
+
+            def dependency_done(_future):
+                with counter_lock:
+                    remaining[0] -= 1
+                    ready = remaining[0] == 0
+                if ready:
+                    self._start_when_ready(job)
+
+            for dep in pending:
+                dep.future.add_done_callback(dependency_done)
+        return job
+
+    def chain(self, cmds: Iterable[List[str]], timeout: int = 300,
+              depends_on: Iterable[Job] = ()) -> List[Job]:
+        """Submit commands so that each one depends on the previous."""
+        jobs = []
+        previous = list(depends_on)
+        for cmd in cmds:
+            job = self.submit(cmd, timeout=timeout, depends_on=previous)
+            jobs.append(job)
+            previous = [job]
+        return jobs
+
+    def _start_when_ready(self, job: Job):
+        for dep in job.depends_on:
+            if not dep.succeeded:
+                with job._lock:
+                    if job.state != Job.PENDING:
+                        return
+                    job._finish(Job.CANCELLED, error=f"dependency {dep.name} did not succeed")
+                # Future зависимости уже завершен, а ее колбэки еще не вызваны - сначала они
+                dep.add_done_callback(lambda _dep: job._notify())
+                return
+        self._executor.submit(job._run)
+
+    def cancel_all(self):
+        """Cancel every pending and running job."""
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+
+    def active_jobs(self) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs if not job.future.done()]
+
+    def shutdown(self, cancel: bool = True):
+        if cancel:
+            self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def wait_jobs(jobs: Iterable[Job], timeout: Optional[float] = None) -> bool:
+    """
+    Wait until jobs finished and their callbacks ran.
+
+    In the UI thread a local QEventLoop runs until the last job reports back, so the UI
+    stays responsive without polling; elsewhere the job futures are awaited.
+
+    Returns:
+        True if all jobs finished in time
+    """
+    jobs = list(jobs)
+    app = QCoreApplication.instance()
+    if app is None or QThread.currentThread() is not app.thread():
+        wait_futures([job.future for job in jobs], timeout)
+        return all(job.future.done() for job in jobs)
+
+    pending = [job for job in jobs if not job.done()]
+    if not pending:
+        return True
+
+    loop = QEventLoop()
+    remaining = [len(pending)]
+
+    def job_done(_job):
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            loop.quit()
+
+    for job in pending:
+        job.add_done_callback(job_done)
+    if timeout is not None:
+        QTimer.singleShot(int(timeout * 1000), loop.quit)
+    loop.exec()
+    return all(job.done() for job in jobs)
+
+
+_job_scheduler = None
+
+
+def get_job_scheduler() -> JobScheduler:
+    """Process-wide scheduler shared by BackgroundProcessManager instances."""
+    global _job_scheduler
+    if _job_scheduler is None:
+        _job_scheduler = JobScheduler()
+    return _job_scheduler
+
+
 class BackgroundProcessManager:
-    """Manager for executing subprocess commands with loading dialog."""
+    """Manager for executing subprocess commands with loading dialog (jobs run on JobScheduler)."""
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, scheduler: Optional[JobScheduler] = None):
         self.parent = parent
-        self.thread = None
+        self.scheduler = scheduler or get_job_scheduler()
+        self.jobs = []
         self.dialog = None
         self.is_runing = False
         self.use_loading_dialog = True
@@ -108,8 +408,10 @@ class BackgroundProcessManager:
             message: str = "Processing...",
             timeout: int = 300,
             on_success: Optional[Callable[[int, str, str], None]] = None,
-            on_error: Optional[Callable[[str], None]] = None
-    ):
+            on_error: Optional[Callable[[str], None]] = None,
+            depends_on: Iterable[Job] = (),
+            cwd: Optional[str] = None
+    ) -> Job:
         """
         Execute command in background with loading dialog.
 
@@ -119,46 +421,363 @@ class BackgroundProcessManager:
             timeout: Timeout in seconds
             on_success: Callback for successful completion (return_code, stdout, stderr)
             on_error: Callback for error (error_message)
+            depends_on: Jobs that must succeed before this one starts
+            cwd: Working directory of the command
+
+        Returns:
+            Job - can be waited for (wait), cancelled or used as a dependency
         """
         self.is_runing = True
 
         # Create and show loading dialog
-        if self.use_loading_dialog:
+        if self.use_loading_dialog and self.dialog is None:
             self.dialog = LoadingDialog(message, self.parent)
             self.dialog.show()
             QApplication.processEvents()
 
-        # Create and start thread
-        self.thread = BackgroundProcessThread(cmd, timeout, self.stdin_handle)
-        self.thread.finished.connect(lambda rc, stdout, stderr: self._on_finished(rc, stdout, stderr, on_success))
-        self.thread.error.connect(lambda error: self._on_error(error, on_error, timeout))
-        self.thread.start()
+        job = self.scheduler.submit(
+            cmd,
+            timeout=timeout,
+            depends_on=depends_on,
+            stdin_handle=self.stdin_handle,
+            on_finished=lambda job: self._on_job_finished(job, on_success, on_error, timeout),
+            cwd=cwd
+        )
+        self.jobs.append(job)
+        return job
 
-    def _on_finished(self, return_code: int, stdout: str, stderr: str, callback: Optional[Callable]):
-        """Handle thread completion."""
-        if self.use_loading_dialog and self.dialog:
+    def _on_job_finished(self, job: Job, on_success: Optional[Callable], on_error: Optional[Callable], timeout: int):
+        """Handle job completion (UI thread)."""
+        if job in self.jobs:
+            self.jobs.remove(job)
+        if not self.jobs and self.use_loading_dialog and self.dialog:
             self.dialog.close()
             self.dialog = None
 
-        if callback:
-            callback(return_code, stdout, stderr)
-        self.is_runing = False
-
+        if job.state == Job.DONE:
+            if on_success:
+                on_success(job.return_code, job.stdout, job.stderr)
+        elif on_error:
+            if job.error == "timeout":
+                on_error(f"Process timed out after {timeout // 60} minutes")
+            else:
+                on_error(f"Process error: {job.error}")
+        self.is_runing = bool(self.jobs)
 
-    def _on_error(self, error: str, callback: Optional[Callable], timeout: int):
-        """Handle thread error."""
-        if self.use_loading_dialog and self.dialog:
-            self.dialog.close()
-            self.dialog = None
+    def cancel(self):
+        """Cancel all jobs started by this manager."""
+        for job in list(self.jobs):
+            job.cancel()
 
-        if callback:
-            if error == "timeout":
-                callback(f"Process timed out after {timeout // 60} minutes")
-            else:
-                callback(f"Process error: {error}")
-        self.is_runing = False
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for this manager's jobs without spinning the UI thread (see wait_jobs),
+        including jobs started from callbacks while waiting.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.jobs:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not wait_jobs(list(self.jobs), remaining):
+                return False
+        return True
 
     def is_running(self) -> bool:
-        """Check if process is currently running."""
-        # return self.thread is not None and self.thread.isRunning()
-        return self.is_runing
\ No newline at end of file
+        """Check if any job of this manager is pending or running."""
+        return self.is_runing
+
+
+class ToolSessionError(RuntimeError):
+    """Tool process exited, was cancelled or did not answer in time."""
+
+
+def parse_float_line(line: str) -> Optional[Tuple[float, ...]]:
+    """Whitespace separated numbers (xicclu -v0 output) or None for non-numeric lines."""
+    try:
+        return tuple(float(part) for part in line.split())
+    except ValueError:
+        return None
+
+
+class ToolSession:
+    """
+    Long-lived command line tool fed through pipes (e.g. xicclu).
+
+    Input lines go to stdin through a bounded queue and a writer thread. A reader
+    thread parses stdout line by line as it arrives (parse_line, lines returning None
+    are skipped) into a bounded result queue, so a slow consumer throttles the tool
+    instead of buffering everything. One input line is expected to produce one result.
+    """
+
+    def __init__(
+            self,
+            cmd: List[str],
+            parse_line: Callable[[str], Any] = parse_float_line,
+            max_pending: int = 4096,
+            line_buffered: bool = True
+    ):
+        """
+        Args:
+            cmd: Command list (started without shell)
+            parse_line: stdout line -> result or None to skip the line
+            max_pending: Size of input and result queues
+            line_buffered: Force line buffered stdout with stdbuf where available
+                (C tools fully buffer stdout when it is a pipe)
+        """
+        self.cmd = list(cmd)
+        self.parse_line = parse_line
+        self.line_buffered = line_buffered
+        self.process = None
+        self._input = queue.Queue(max_pending)
+        self._output = queue.Queue(max_pending)
+        self._stderr = deque(maxlen=50)
+        self._cancelled = threading.Event()
+        self._request_lock = threading.Lock()
+        # All results of the current request have been handed out
+        self._drained = True
+        self._threads = []
+
+    # --- Lifecycle ---
+
+    def start(self) -> 'ToolSession':
+        if self.process is not None:
+            return self
+
+        cmd = self.cmd
+        if self.line_buffered and os.name != 'nt' and shutil.which('stdbuf'):
+            cmd = ['stdbuf', '-oL'] + cmd
+
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        for target in (self._write_loop, self._read_loop, self._stderr_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def is_alive(self) -> bool:
+        return (self.process is not None and self.process.poll() is None
+                and not self._cancelled.is_set())
+
+    def cancel(self):
+        """Stop the tool immediately; pending and future requests fail."""
+        self._cancelled.set()
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+        # Unblock the writer thread
+        try:
+            self._input.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def close(self, timeout: float = 5.0):
+        """Close stdin and let the tool finish, kill it after timeout."""
+        if self.process is None:
+            return
+        try:
+            self._input.put(None, timeout=timeout)
+        except queue.Full:
+            self.process.kill()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._cancelled.set()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def stderr(self) -> str:
+        """Last stderr lines of the tool."""
+        return '\n'.join(self._stderr)
+
+    # --- Pipe threads ---
+
+    def _write_loop(self):
+        stdin = self.process.stdin
+        try:
+            while True:
+                line = self._input.get()
+                if line is None or self._cancelled.is_set():
+                    break
+                stdin.write(line + '\n')
+                # Flush only when the queue is drained - batches go out in one write
+                if self._input.empty():
+                    stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        finally:
+            try:
+                stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def _read_loop(self):
+        try:
+            for line in self.process.stdout:
+                line = line.strip()
+                if not line:
+                    continue
+                value = self.parse_line(line)
+                if value is not None:
+                    self._put_output(value)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._put_output(_SESSION_EOF)
+
+    def _put_output(self, value):
+        while not self._cancelled.is_set():
+            try:
+                self._output.put(value, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _stderr_loop(self):
+        try:
+            for line in self.process.stderr:
+                self._stderr.append(line.rstrip())
+        except (OSError, ValueError):
+            pass
+
+    # --- Requests ---
+
+    def _take_output(self, timeout: float):
+        try:
+            value = self._output.get(timeout=timeout)
+        except queue.Empty:
+            return _SESSION_EMPTY
+        if value is _SESSION_EOF:
+            raise ToolSessionError(f"{self.cmd[0]} exited: {self.stderr or self.process.poll()}")
+        return value
+
+    def stream(self, lines: Iterable[str], timeout: float = 60.0):
+        """
+        Send lines and yield parsed results in order as they arrive.
+
+        Args:
+            lines: Input lines (without newline)
+            timeout: Seconds without any progress before the session is cancelled
+
+        Raises:
+            ToolSessionError: tool exited, session cancelled or timed out
+        """
+        with self._request_lock:
+            self.start()
+            self._drained = False
+            try:
+                yield from self._stream(lines, timeout)
+            finally:
+                # Abandoned or failed request leaves unread results - the stream is out of sync.
+                # A consumer that stops right after the last result (zip) leaves it in sync.
+                if not self._drained:
+                    self.cancel()
+
+    def _stream(self, lines: Iterable[str], timeout: float):
+        """stream() body, called with the request lock held."""
+        pending = 0
+        deadline = time.monotonic() + timeout
+
+        for line in lines:
+            while True:
+                try:
+                    self._input.put_nowait(line)
+                    pending += 1
+                    break
+                except queue.Full:
+                    pass
+                # Input is full - wait for results so the tool can proceed
+                value = self._take_output(0.05)
+                if value is _SESSION_EMPTY:
+                    self._check_progress(deadline)
+                    continue
+                pending -= 1
+                deadline = time.monotonic() + timeout
+                yield value
+
+        while pending:
+            value = self._take_output(0.05)
+            if value is _SESSION_EMPTY:
+                self._check_progress(deadline)
+                continue
+            pending -= 1
+            deadline = time.monotonic() + timeout
+            self._drained = not pending
+            yield value
+
+        self._drained = True
+
+    def _check_progress(self, deadline: float):
+        if self._cancelled.is_set():
+            raise ToolSessionError(f"{self.cmd[0]} session cancelled")
+        if time.monotonic() > deadline:
+            self.cancel()
+            raise ToolSessionError(f"{self.cmd[0]} timed out")
+
+    def request(self, lines: Iterable[str], timeout: float = 60.0) -> list:
+        """Send lines and return all parsed results (see stream)."""
+        return list(self.stream(lines, timeout))
+
+
+_SESSION_EOF = object()
+_SESSION_EMPTY = object()
+
+# Running sessions: tuple(cmd) -> (stamps of input_files, ToolSession)
+_tool_sessions = {}
+_tool_sessions_lock = threading.Lock()
+
+
+def _file_stamps(paths: Iterable[str]) -> Tuple:
+    """(st_mtime_ns, st_size) of each file, None for missing files."""
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+def get_tool_session(cmd: List[str], input_files: Iterable[str] = (), **kwargs) -> ToolSession:
+    """
+    Shared running session for cmd, restarted if the previous one has exited.
+
+    Args:
+        cmd: Command list, also the session key
+        input_files: Files the tool reads once at start-up (e.g. the ICC profile of
+            xicclu); the session is restarted when their modification time or size changes
+        **kwargs: ToolSession arguments for a new session
+    """
+    key = tuple(cmd)
+    stamps = _file_stamps(input_files)
+    stale = None
+    with _tool_sessions_lock:
+        entry = _tool_sessions.get(key)
+        session = entry[1] if entry is not None else None
+        if session is None or not session.is_alive() or entry[0] != stamps:
+            stale = session
+            session = ToolSession(cmd, **kwargs).start()
+            _tool_sessions[key] = (stamps, session)
+    if stale is not None:
+        stale.cancel()
+    return session
+
+
+@atexit.register
+def close_tool_sessions():
+    """Close all shared tool sessions."""
+    with _tool_sessions_lock:
+        sessions = [session for _, session in _tool_sessions.values()]
+        _tool_sessions.clear()
+    for session in sessions:
+        session.close(timeout=1.0)
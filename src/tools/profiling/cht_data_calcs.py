@@ -237,69 +237,166 @@ def _transform_uv_to_screen(uv, corner):
     return GENERIC_OK, screen_pts
 
 
-def compute_patch_wh_aligned(uv, uv_wh, corner, scale_percent=100):
+_UV_QUAD = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float32)
+
+# Centre, +U and +V probes used to find how the UV axes land on the screen
+_UV_AXIS_PROBE = np.array([[[0.5, 0.5]], [[0.51, 0.5]], [[0.5, 0.51]]], dtype=np.float32)
+
+
+def uv_to_screen_matrix(corner):
     """
-    Патчи адаптируются к ориентации сетки.
-    Width всегда горизонтален в экране, height всегда вертикален.
+    Build the UV -> screen perspective matrix for a corner quad.
+
+    Args:
+        corner (numpy.ndarray): Quadrilateral (4, 2) in screen coordinates
+
+    Returns:
+        tuple: (GENERIC_OK, 3x3 matrix) or (GENERIC_ERROR, None) for a degenerate quad
+    """
+    if not _is_valid_quad(corner) or not _quad_area(corner):
+        return GENERIC_ERROR, None
+
+    return GENERIC_OK, getPerspectiveTransform(_UV_QUAD, np.asarray(corner, dtype=np.float32))
+
+
+def is_u_axis_horizontal(H) -> bool:
+    """Check whether the U axis of the grid is mostly horizontal on the screen."""
+    probe = perspectiveTransform(_UV_AXIS_PROBE, H).reshape(-1, 2)
+    u_screen = probe[1] - probe[0]
+    return abs(u_screen[0]) > abs(u_screen[1])
+
+
+def fill_patch_points(uv, uv_wh, scale_percent, u_is_horizontal, out):
+    """
+    Fill a (3N, 1, 2) UV buffer with patch centres, width probes and height probes.
+
+    Width is always laid along the axis that is horizontal on the screen,
+    height along the vertical one.
+
+    Args:
+        uv (numpy.ndarray): Patch centres (N, 1, 2)
+        uv_wh (numpy.ndarray): Patch sizes (N, 1, 2)
+        scale_percent (int): Patch scale in percent
+        u_is_horizontal (bool): Result of is_u_axis_horizontal()
+        out (numpy.ndarray): Destination buffer (3N, 1, 2), float32
     """
-    scale = scale_percent / 100.0
-    uv_wh_scaled = uv_wh * scale
     n = len(uv)
+    scale = scale_percent / 100.0
+    w_axis, h_axis = (0, 1) if u_is_horizontal else (1, 0)
 
-    # 1. Определяем, как оси UV отображаются в экранное пространство
-    test_points = np.array([
-        [[0.5, 0.5]],  # центр
-        [[0.51, 0.5]],  # +U направление
-        [[0.5, 0.51]]  # +V направление
-    ])
+    out[:n] = uv
+    out[n:2 * n] = uv
+    out[2 * n:] = uv
+    out[n:2 * n, :, w_axis] += uv_wh[:, :, 0] * scale
+    out[2 * n:, :, h_axis] += uv_wh[:, :, 1] * scale
 
-    ret, screen_test = _transform_uv_to_screen(test_points, corner)
-    if ret != GENERIC_OK:
-        return GENERIC_ERROR, None, None
 
-    center_screen = screen_test[0]
-    u_screen = screen_test[1] - center_screen  # как U отображается в экране
-    v_screen = screen_test[2] - center_screen  # как V отображается в экране
+def measure_patch_wh(screen_points, centers, patch_wh):
+    """
+    Split a transformed (3N, 1, 2) buffer into patch centres and sizes.
 
-    # 2. Определяем, какая ось более горизонтальная/вертикальная
-    u_is_horizontal = abs(u_screen[0]) > abs(u_screen[1])
+    The width/height probe part of screen_points is used as scratch space.
 
-    # 3. Создаем смещения в UV в зависимости от ориентации
-    width_values = uv_wh_scaled[:, :, 0:1]
-    height_values = uv_wh_scaled[:, :, 1:2]
-    zeros = np.zeros_like(width_values)
+    Args:
+        screen_points (numpy.ndarray): Output of perspectiveTransform over fill_patch_points()
+        centers (numpy.ndarray): Destination (N, 2) for patch centres
+        patch_wh (numpy.ndarray): Destination (N, 2) for patch width/height
+    """
+    pts = screen_points.reshape(3, -1, 2)
+    np.subtract(pts[1], pts[0], out=pts[1])
+    np.subtract(pts[2], pts[0], out=pts[2])
+    centers[:] = pts[0]
+    np.hypot(pts[1, :, 0], pts[1, :, 1], out=patch_wh[:, 0])
+    np.hypot(pts[2, :, 0], pts[2, :, 1], out=patch_wh[:, 1])
 
-    if u_is_horizontal:
-        # U горизонтальная, V вертикальная (нормальная ориентация)
-        width_offset = np.concatenate([width_values, zeros], axis=2)  # width по U
-        height_offset = np.concatenate([zeros, height_values], axis=2)  # height по V
-    else:
-        # U вертикальная, V горизонтальная (поворот на 90°)
-        width_offset = np.concatenate([zeros, width_values], axis=2)  # width по V
-        height_offset = np.concatenate([height_values, zeros], axis=2)  # height по U
 
-    # 4. Объединяем все точки
-    all_points = np.concatenate([
-        uv,  # центры
-        uv + width_offset,  # точки ширины (горизонталь в экране)
-        uv + height_offset  # точки высоты (вертикаль в экране)
-    ], axis=0)
+class PatchGridTransformer:
+    """
+    Stateful UV -> screen transformer for the patches of one chart.
 
-    # 5. Одно преобразование для всех точек
-    ret, screen_points = _transform_uv_to_screen(all_points, corner)
-    if ret != GENERIC_OK:
-        return GENERIC_ERROR, None, None
+    Owns the (3N, 1, 2) UV and screen point buffers, writes patch centres and
+    sizes straight into caller-provided arrays and skips the projection when
+    neither the corner quad nor the patch scale has changed since the last call
+    into the same arrays.
+    """
 
-    # 6. Разделяем результат
-    centers = screen_points[:n].reshape(-1, 2)
-    screen_width_pts = screen_points[n:2 * n].reshape(-1, 2)
-    screen_height_pts = screen_points[2 * n:3 * n].reshape(-1, 2)
+    def __init__(self, uv, uv_wh):
+        """
+        Args:
+            uv (numpy.ndarray): Patch centres (N, 1, 2)
+            uv_wh (numpy.ndarray): Patch sizes (N, 1, 2)
+        """
+        self.uv = uv
+        self.uv_wh = uv_wh
+        n = len(uv)
+        self._uv_points = np.empty((3 * n, 1, 2), dtype=np.float32)
+        self._screen_points = np.empty((3 * n, 1, 2), dtype=np.float32)
+        self._uv_key = None                 # (scale_percent, u_is_horizontal) of _uv_points
+        self._corner = np.full((4, 2), np.nan, dtype=np.float32)
+        self._scale_percent = None
+        self._targets = None                # output arrays written by the last transform()
+
+    def __len__(self):
+        return len(self.uv)
+
+    def invalidate(self):
+        """Force the next transform() to recalculate."""
+        self._uv_key = None
+        self._scale_percent = None
+        self._targets = None
+
+    def transform(self, corner, scale_percent, centers, patch_wh, half_patch=None) -> int:
+        """
+        Project the patches through the corner quad.
+
+        Args:
+            corner (numpy.ndarray): Quadrilateral (4, 2) in screen coordinates
+            scale_percent (int): Patch scale in percent
+            centers (numpy.ndarray): Destination (N, 2) for patch centres
+            patch_wh (numpy.ndarray): Destination (N, 2) for patch width/height
+            half_patch (numpy.ndarray): Optional destination (N, 2) for patch_wh / 2
+
+        Returns:
+            GENERIC_OK on success (or nothing to do), GENERIC_ERROR for a degenerate quad
+        """
+        targets = (centers, patch_wh, half_patch)
+        if (scale_percent == self._scale_percent and np.array_equal(corner, self._corner)
+                and self._targets is not None and all(a is b for a, b in zip(targets, self._targets))):
+            return GENERIC_OK
+
+        ret, H = uv_to_screen_matrix(corner)
+        if ret != GENERIC_OK:
+            return GENERIC_ERROR
+
+        # UV points only depend on patch scale and grid orientation
+        uv_key = (scale_percent, is_u_axis_horizontal(H))
+        if uv_key != self._uv_key:
+            fill_patch_points(self.uv, self.uv_wh, scale_percent, uv_key[1], self._uv_points)
+            self._uv_key = uv_key
+
+        perspectiveTransform(self._uv_points, H, self._screen_points)
+        measure_patch_wh(self._screen_points, centers, patch_wh)
+        if half_patch is not None:
+            np.multiply(patch_wh, 0.5, out=half_patch)
+
+        self._corner[:] = corner
+        self._scale_percent = scale_percent
+        self._targets = targets
+        return GENERIC_OK
 
-    # 7. Вычисляем размеры
-    width = np.linalg.norm(screen_width_pts - centers, axis=1)
-    height = np.linalg.norm(screen_height_pts - centers, axis=1)
 
-    patch_wh = np.column_stack([width, height])
+def compute_patch_wh_aligned(uv, uv_wh, corner, scale_percent=100):
+    """
+    Патчи адаптируются к ориентации сетки.
+    Width всегда горизонтален в экране, height всегда вертикален.
+    """
+    n = len(uv)
+    centers = np.empty((n, 2), dtype=np.float32)
+    patch_wh = np.empty((n, 2), dtype=np.float32)
+
+    ret = PatchGridTransformer(uv, uv_wh).transform(corner, scale_percent, centers, patch_wh)
+    if ret != GENERIC_OK:
+        return GENERIC_ERROR, None, None
 
     return GENERIC_OK, centers, patch_wh
 
@@ -1,15 +1,18 @@
 import traceback
 import locale
+import os
+from functools import cached_property
 from datetime import datetime
 from ti3_calcs import chromatic_adaptation_brdf, illuminants, normalize_patch_data
+from spectral_calcs import STANDARD_OBSERVER, spectral_columns, spectral_to_xyz
 import numpy as np
 from colour import Lab_to_XYZ, XYZ_to_xy, xy_to_CCT
 
 from pyparsing import results
 
 from const import GENERIC_OK, GENERIC_ERROR
-from typing import Dict, Optional, Any
-import time
+from typing import Dict, List, Optional, Tuple, Any
+from collections.abc import Sequence
 
 def tr(text):
     """
@@ -91,7 +94,7 @@ def write_txt2ti3_patches(patches, field_to_output, input_cgats_filename, output
         use_sample_id_as_number = True
 
     patch_sequence, xyz, patch_loc = _get_patch_names(input_cgats_filename)
-    with_zero, without_zero = _create_patch_name_variants(patch_sequence)
+    with_zero, without_zero = read_cgats_table(input_cgats_filename).name_variants
     the_list = with_zero
 
     is_ok = True
@@ -255,162 +258,470 @@ def _export_patches_for_txt2ti3( patch_data, output_filename, is_rgb=True):
 
 def _get_patch_names(cgats_filename):
     """Extract patch names maintaining file order"""
-    result = parse_cgats_file(cgats_filename)
-    xyz = None
-    if 'xyz_target' in result['patches'][0].keys():
-        xyz = [result['xyz_target'] for result in result['patches']]
-    elif 'lab_target' in result['patches'][0].keys():
-        illuminant_xyz = detect_illuminant_from_patches(result['patches'])
-        add_xyz_targets(result['patches'], illuminant_xyz)
-        xyz = [result['xyz_target'] for result in result['patches']]
+    table = read_cgats_table(cgats_filename)
+    xyz = table.xyz_targets
+    xyz = xyz.tolist() if xyz is not None else None
 
-    return [result['patch_id'] for result in result['patches']], xyz, [str(result.get('sample_loc',0)) for result in result['patches']]
+    return list(table.patch_names), xyz, [loc or '0' for loc in table.sample_locs.tolist()]
 
-def parse_cgats_file(cgats_filename) -> dict[str: any]:
+# Колонки CGATS, которые распознает парсер
+CGATS_ID_COLUMNS = ('SAMPLE_ID', 'Sample_NAME', 'SAMPLE_NAME')
+CGATS_RGB_COLUMNS = ('RGB_R', 'RGB_G', 'RGB_B')
+CGATS_XYZ_COLUMNS = ('XYZ_X', 'XYZ_Y', 'XYZ_Z')
+CGATS_LAB_VARIANTS = (
+    ('LAB_L', 'LAB_A', 'LAB_B'),  # Argyll
+    ('Lab_L', 'Lab_a', 'Lab_b'),  # X-Rite variant 1
+    ('Lab_L', 'Lab_A', 'Lab_B'),  # X-Rite variant 2
+)
+CGATS_TEXT_COLUMNS = CGATS_ID_COLUMNS + ('SAMPLE_LOC',)
+
+
+def _load_columns(lines: List[str], usecols: List[int], dtype) -> np.ndarray:
     """
-    Universal CGATS file parser with automatic column detection.
+    Колонки usecols строк данных CGATS одним np.loadtxt → (rows, len(usecols)).
 
-    Supports:
-    - X-Rite: Sample_NAME, SAMPLE_NAME, Lab_L, Lab_a, Lab_b
-    - Argyll: SAMPLE_ID, SAMPLE_LOC, LAB_L, LAB_A, LAB_B
-    - Mixed formats with incorrect data ordering
+    Raises:
+        ValueError: короткая строка или значение не преобразуется в dtype
     """
-    patches = []
+    if not lines or not usecols:
+        return np.empty((len(lines), len(usecols)), dtype=dtype)
+    return np.loadtxt(lines, dtype=dtype, usecols=usecols, comments=None, ndmin=2)
 
-    # Data structure
-    data_format = {}
-    column_names = []
-    in_data_format = False
-    in_data = False
 
-    # File type detection
-    file_ext = cgats_filename.lower().split('.')[-1]
-    file_type = file_ext if file_ext in ['ti2', 'ti3', 'cie'] else 'cgats'
+def _to_float_column(values: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Строки колонки → float64 (запятая как десятичный разделитель допустима).
+    Запасной путь для блоков, которые не разобрал _load_columns.
 
-    with open(cgats_filename, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
+    Returns:
+        (values, ok): значения (NaN для нечисловых) и маска успешно преобразованных
+    """
+    try:
+        return np.array(values, dtype=np.float64), np.ones(len(values), dtype=bool)
+    except ValueError:
+        pass
 
-            # Parse data format section
-            if line == 'BEGIN_DATA_FORMAT':
-                in_data_format = True
+    values = [value.replace(',', '.') for value in values]
+    try:
+        return np.array(values, dtype=np.float64), np.ones(len(values), dtype=bool)
+    except ValueError:
+        # Редкий случай - мусор в колонке, разбираем поэлементно
+        result = np.full(len(values), np.nan)
+        ok = np.zeros(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            try:
+                result[i] = float(value)
+                ok[i] = True
+            except ValueError:
                 continue
+        return result, ok
 
-            if line == 'END_DATA_FORMAT':
-                in_data_format = False
-                for i, col_name in enumerate(column_names):
-                    data_format[col_name] = i
-                continue
 
-            if in_data_format and line:
-                column_names = line.split()
-                continue
+class CgatsPatchView(Sequence):
+    """
+    Ленивый legacy-вид патчей CGATS: список словарей строится при первом обращении
+    к элементам (len() их не строит). Словари изменяемые и кэшируются.
+    """
 
-            # Parse data section
-            if line == 'BEGIN_DATA':
-                in_data = True
-                continue
+    def __init__(self, table: 'CgatsTable'):
+        # Таблица может быть общей (кэш), словари - у каждого вида свои
+        self._table = table
+        self._patches = None
+
+    def _materialise(self) -> list:
+        if self._patches is None:
+            self._patches = self._table.build_patch_dicts()
+        return self._patches
+
+    def __len__(self):
+        return self._table.patch_count
+
+    def __getitem__(self, index):
+        return self._materialise()[index]
+
+    def __iter__(self):
+        return iter(self._materialise())
+
+    def __repr__(self):
+        return repr(self._materialise())
 
-            if line == 'END_DATA':
+
+class CgatsTable:
+    """
+    Колоночные данные первой таблицы CGATS файла.
+
+    Раскладка колонок определяется один раз (END_DATA_FORMAT), числовые колонки
+    разбираются одним срезом блока данных в float64 матрицу, текстовые - отдельно. Все массивы -
+    только строки патчей (технические записи и строки без ID отброшены, как в legacy парсере).
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.keywords = {}
+        self.column_names = []
+
+        with open(filename, 'r', encoding='utf-8') as f:
+            text = f.read()
+
+        self._split_columns(self._parse_text(text))
+        self._select_patches()
+
+    # --- Разбор текста ---
+
+    def _parse_text(self, text: str) -> List[str]:
+        """Заголовок построчно; возвращает непустые строки блока BEGIN_DATA..END_DATA."""
+        data_start = None
+        format_lines = None
+        position = 0
+        for line in text.splitlines(keepends=True):
+            position += len(line)
+            stripped = line.strip()
+            if format_lines is not None:
+                if stripped == 'END_DATA_FORMAT':
+                    self.column_names = ' '.join(format_lines).split()
+                    format_lines = None
+                elif stripped:
+                    format_lines.append(stripped)
+            elif stripped == 'BEGIN_DATA_FORMAT':
+                format_lines = []
+            elif stripped == 'BEGIN_DATA':
+                data_start = position
                 break
+            elif stripped and not stripped.startswith('#'):
+                key, _, value = stripped.partition(' ')
+                self.keywords.setdefault(key, value.strip().strip('"'))
+
+        if data_start is None or not self.column_names:
+            return []
+
+        data_end = text.find('END_DATA', data_start)
+        block = text[data_start:data_end if data_end >= 0 else len(text)]
+        return [line for line in block.splitlines() if line.strip()]
+
+    def _split_columns(self, lines: List[str]):
+        """
+        Блок данных → колонки. Числовые колонки разбираются одним np.loadtxt (usecols)
+        в float64 матрицу, текстовые (ID, SAMPLE_LOC) - отдельным вызовом как str.
+        """
+        # При дубликатах имен, как в legacy, используется последняя колонка
+        self._column_index = {name: i for i, name in enumerate(self.column_names)}
+        text_columns = {name: i for name, i in self._column_index.items() if name in CGATS_TEXT_COLUMNS}
+        numeric_columns = {name: i for name, i in self._column_index.items() if name not in CGATS_TEXT_COLUMNS}
+
+        usecols = list(numeric_columns.values())
+        try:
+            values, ok = _load_columns(lines, usecols, np.float64), None
+        except ValueError:
+            # Короткие строки отбрасываются; запятые или мусор в значениях - поколоночно
+            lines = self._regular_lines(lines)
+            try:
+                values, ok = _load_columns(lines, usecols, np.float64), None
+            except ValueError:
+                values, ok = self._convert_columns(_load_columns(lines, usecols, str))
+
+        text = _load_columns(lines, list(text_columns.values()), str)
+        self._row_count = len(lines)
+        self._text = {name: np.char.strip(text[:, j], '"') for j, name in enumerate(text_columns)}
+        self._numeric_values = values
+        self._numeric_ok = ok
+        self._numeric_position = {name: j for j, name in enumerate(numeric_columns)}
+
+    def _regular_lines(self, lines: List[str]) -> List[str]:
+        """Короткие строки пропускаются, лишние значения отбрасываются (как legacy)."""
+        n_columns = len(self.column_names)
+        rows = [line.split() for line in lines]
+        return [' '.join(parts[:n_columns]) for parts in rows if len(parts) >= n_columns]
+
+    @staticmethod
+    def _convert_columns(cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, k) str → (values, ok) по колонкам через _to_float_column."""
+        values = np.empty(cells.shape, dtype=np.float64)
+        ok = np.empty(cells.shape, dtype=bool)
+        for j in range(cells.shape[1]):
+            values[:, j], ok[:, j] = _to_float_column(cells[:, j])
+        return values, ok
+
+    def _numeric_column(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Числовая колонка (все строки данных) и маска успешно преобразованных значений."""
+        j = self._numeric_position[name]
+        values = self._numeric_values[:, j]
+        if self._numeric_ok is None:
+            return values, np.ones(len(values), dtype=bool)
+        return values, self._numeric_ok[:, j]
+
+    def _select_patches(self):
+        """ID патчей по правилам legacy парсера, отбор строк патчей."""
+        patch_id = np.full(self._row_count, '', dtype=object)
+        sample_loc = np.full(self._row_count, '', dtype=object)
+
+        # ID: первый найденный вариант; число - это позиция, текст - ID
+        for id_variant in CGATS_ID_COLUMNS:
+            if id_variant in self._text:
+                values = self._text[id_variant]
+                is_number = np.char.isdigit(values)
+                sample_loc = np.where(is_number, values, sample_loc)
+                patch_id = np.where(is_number, patch_id, values)
+                break
+
+        # SAMPLE_LOC: число - позиция, текст - ID (если ID еще не найден)
+        if 'SAMPLE_LOC' in self._text:
+            values = self._text['SAMPLE_LOC']
+            is_number = np.char.isdigit(values)
+            sample_loc = np.where(is_number, values, sample_loc)
+            patch_id = np.where(~is_number & (patch_id == ''), values, patch_id)
+
+        # Без ID и технические записи пропускаются
+        keep = (patch_id != '') & (patch_id != '0') & (patch_id != '00')
+
+        self.rows = np.flatnonzero(keep)
+        self.patch_ids = patch_id[keep].astype(str)
+        self.sample_locs = sample_loc[keep].astype(str)
+        for array in (self.rows, self.patch_ids, self.sample_locs):
+            array.flags.writeable = False
+
+    # --- Колоночный доступ ---
+
+    @property
+    def patch_count(self) -> int:
+        return len(self.rows)
+
+    def has_columns(self, names) -> bool:
+        return all(name in self._column_index for name in names)
+
+    def column(self, name: str) -> np.ndarray:
+        """Колонка по строкам патчей (float64 или str для текстовых)."""
+        if name in self._text:
+            return self._text[name][self.rows]
+        return self._numeric_column(name)[0][self.rows]
+
+    def columns(self, names) -> Optional[np.ndarray]:
+        """(N, len(names)) float64 (NaN для нечисловых значений) или None, если какой-то колонки нет."""
+        if not self.has_columns(names):
+            return None
+        return np.column_stack([self.column(name) for name in names]) if names else None
+
+    def checked_columns(self, names) -> Optional[np.ndarray]:
+        """
+        columns() без пропусков: нечисловое значение в строке патча - ошибка, как
+        float() в legacy парсере (построчный пропуск допустим только для Lab).
+
+        Raises:
+            ValueError: значение колонки не преобразуется в число
+        """
+        values = self.columns(names)
+        if values is None or self._numeric_ok is None:
+            return values
+        for name in names:
+            ok = self._numeric_column(name)[1][self.rows]
+            if not ok.all():
+                patch_id = self.patch_ids[np.argmin(ok)]
+                raise ValueError(f"{self.filename}: non-numeric {name} value for patch {patch_id}")
+        return values
+
+    def validate(self):
+        """Проверка RGB/XYZ строк патчей (legacy парсер падал на них сразу при разборе)."""
+        for names in (CGATS_RGB_COLUMNS, CGATS_XYZ_COLUMNS):
+            self.checked_columns(names)
+
+    @property
+    def rgb(self) -> Optional[np.ndarray]:
+        return self.checked_columns(CGATS_RGB_COLUMNS)
+
+    @property
+    def xyz(self) -> Optional[np.ndarray]:
+        return self.checked_columns(CGATS_XYZ_COLUMNS)
+
+    def lab(self) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Lab (N, 3) по первому варианту колонок, значения которого читаются (построчно, как legacy).
+
+        Returns:
+            (lab или None, маска строк с Lab)
+        """
+        lab = np.full((self.patch_count, 3), np.nan)
+        found = np.zeros(self.patch_count, dtype=bool)
+        any_variant = False
+        for lab_columns in CGATS_LAB_VARIANTS:
+            if not self.has_columns(lab_columns):
+                continue
+            any_variant = True
+            ok = np.logical_and.reduce([self._numeric_column(name)[1][self.rows] for name in lab_columns])
+            take = ok & ~found
+            lab[take] = self.columns(lab_columns)[take]
+            found |= take
+        return (lab if any_variant else None), found
+
+    @property
+    def detected_format(self) -> str:
+        return _detect_format_type(self.column_names)
+
+    # --- Производные виды (кэшируются вместе с таблицей) ---
+
+    @cached_property
+    def patch_names(self) -> Tuple[str, ...]:
+        return tuple(self.patch_ids.tolist())
+
+    @cached_property
+    def name_variants(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """(with_zero, without_zero), см. _create_patch_name_variants."""
+        with_zero, without_zero = _create_patch_name_variants(self.patch_names)
+        return tuple(with_zero), tuple(without_zero)
+
+    @cached_property
+    def lab_targets(self) -> Optional[np.ndarray]:
+        """Lab (N, 3), NaN для строк без Lab; None если Lab колонок нет. Только чтение."""
+        lab, _ = self.lab()
+        if lab is not None:
+            lab.flags.writeable = False
+        return lab
+
+    @cached_property
+    def xyz_targets(self) -> Optional[np.ndarray]:
+        """
+        XYZ (N, 3) патчей: колонки XYZ, иначе из Lab с определенным по белому патчу
+        illuminant (как add_xyz_targets). None если нет ни XYZ, ни Lab. Только чтение.
+        """
+        xyz = self.xyz
+        if xyz is None and self.lab_targets is not None and self.patch_count:
+            illuminant_xyz = detect_illuminant_from_patches(self.build_patch_dicts())
+            xyz = np.asarray(Lab_to_XYZ(self.lab_targets, illuminant_xyz), dtype=np.float64)
+        if xyz is not None:
+            xyz.flags.writeable = False
+        return xyz
+
+    @cached_property
+    def spectral_wavelengths(self) -> Optional[np.ndarray]:
+        """Длины волн колонок SPEC_* (nm, по возрастанию) или None."""
+        names, wavelengths = spectral_columns(self.column_names)
+        if not names:
+            return None
+        self._spectral_names = names
+        wavelengths.flags.writeable = False
+        return wavelengths
+
+    @cached_property
+    def spectral(self) -> Optional[np.ndarray]:
+        """
+        Спектры отражения (N, bands) 0..1 или None. Значения делятся на SPECTRAL_NORM
+        (Argyll пишет проценты, по умолчанию 100). Только чтение.
+        """
+        if self.spectral_wavelengths is None:
+            return None
+        try:
+            norm = float(self.keywords.get('SPECTRAL_NORM', 100.0))
+        except ValueError:
+            norm = 100.0
+        spectral = self.checked_columns(self._spectral_names) / norm
+        spectral.flags.writeable = False
+        return spectral
+
+    def spectral_xyz(self, illuminant='D50', observer: str = STANDARD_OBSERVER) -> Optional[np.ndarray]:
+        """
+        XYZ патчей из спектров под заданным источником (Y белого = 100).
+
+        Args:
+            illuminant: имя CIE источника, CCT ('3000K') или SPD на spectral_wavelengths
+            observer: наблюдатель из colour.MSDS_CMFS
+
+        Returns:
+            (N, 3) XYZ или None, если в файле нет SPEC_* колонок
+        """
+        if self.spectral is None:
+            return None
+        return spectral_to_xyz(self.spectral, self.spectral_wavelengths, illuminant, observer)
+
+    # --- Legacy вид ---
+
+    def build_patch_dicts(self) -> List[Dict[str, Any]]:
+        """Список словарей патчей в формате legacy parse_cgats_file."""
+        rgb = self.rgb
+        xyz = self.xyz
+        lab, has_lab = self.lab()
+
+        rgb = rgb.tolist() if rgb is not None else None
+        xyz = xyz.tolist() if xyz is not None else None
+        lab = lab.tolist() if lab is not None else None
+        has_lab = has_lab.tolist()
+
+        patches = []
+        for i, (patch_id, sample_loc) in enumerate(zip(self.patch_ids.tolist(), self.sample_locs.tolist())):
+            patch_data = {'patch_id': patch_id}
+            if sample_loc:
+                patch_data['sample_loc'] = sample_loc
+            if rgb is not None:
+                patch_data['rgb_reference'] = rgb[i]
+            if xyz is not None:
+                patch_data['xyz_target'] = xyz[i]
+            if has_lab[i]:
+                patch_data['lab_target'] = lab[i]
+            patches.append(patch_data)
+        return patches
+
+
+# Разобранные CGATS файлы: path -> (mtime_ns, size, CgatsTable)
+_reference_cache = {}
+
+
+def clear_reference_cache():
+    """Drop all cached CGATS parse results."""
+    _reference_cache.clear()
+
+
+def read_cgats_table(cgats_filename) -> CgatsTable:
+    """
+    Parse CGATS file into CgatsTable, cached by file modification time and size.
+
+    Args:
+        cgats_filename (str): Path to the CGATS file (.ti1/.ti2/.ti3/.cie/.txt)
+
+    Returns:
+        CgatsTable: shared between callers, its arrays and derived views are read-only
+
+    Raises:
+        OSError: file can not be read
+    """
+    stat = os.stat(cgats_filename)
+    key = os.path.abspath(cgats_filename)
+    cached = _reference_cache.get(key)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    table = CgatsTable(cgats_filename)
+    _reference_cache[key] = (stat.st_mtime_ns, stat.st_size, table)
+    return table
+
+
+def parse_cgats_file(cgats_filename) -> dict[str: any]:
+    """
+    Universal CGATS file parser with automatic column detection.
+
+    Supports:
+    - X-Rite: Sample_NAME, SAMPLE_NAME, Lab_L, Lab_a, Lab_b
+    - Argyll: SAMPLE_ID, SAMPLE_LOC, LAB_L, LAB_A, LAB_B
+    - Mixed formats with incorrect data ordering
 
-            if in_data and line:
-                parts = line.split()
-
-                if len(parts) < len(column_names):
-                    continue
-
-                # Universal patch ID extraction
-                patch_id = None
-                sample_loc = None
-                path_number = None
-
-                # Search for patch ID using various naming conventions
-                for id_variant in ['SAMPLE_ID', 'Sample_NAME', 'SAMPLE_NAME']:
-                    if id_variant in data_format:
-                        idx = data_format[id_variant]
-                        value = parts[idx].strip('"')
-
-                        # Determine if this is an ID or a number
-                        if value.isdigit():
-                            # This is a number - data might be mixed up
-                            sample_loc = value
-                        else:
-                            # This is a text ID
-                            patch_id = value
-                        break
-
-                # Search for SAMPLE_LOC if present
-                if 'SAMPLE_LOC' in data_format:
-                    idx = data_format['SAMPLE_LOC']
-                    loc_value = parts[idx].strip('"')
-
-                    if loc_value.isdigit():
-                        sample_loc = loc_value
-                    else:
-                        # SAMPLE_LOC contains text - this is the actual ID
-                        if not patch_id:  # If ID hasn't been found yet
-                            patch_id = loc_value
-
-                # Skip if ID still not found
-                if not patch_id:
-                    continue
-
-                # Skip technical records
-                if patch_id in ['0', '00']:
-                    continue
-
-                # Create patch data
-                patch_data = {'patch_id': patch_id}
-
-                if sample_loc:
-                    patch_data['sample_loc'] = sample_loc
-
-                # RGB values (standard naming)
-                if all(col in data_format for col in ['RGB_R', 'RGB_G', 'RGB_B']):
-                    patch_data['rgb_reference'] = [
-                        float(parts[data_format['RGB_R']]),
-                        float(parts[data_format['RGB_G']]),
-                        float(parts[data_format['RGB_B']])
-                    ]
-
-                # XYZ values (standard naming)
-                if all(col in data_format for col in ['XYZ_X', 'XYZ_Y', 'XYZ_Z']):
-                    patch_data['xyz_target'] = [
-                        float(parts[data_format['XYZ_X']]),
-                        float(parts[data_format['XYZ_Y']]),
-                        float(parts[data_format['XYZ_Z']])
-                    ]
-
-                # LAB values - universal search
-                lab_variants = [
-                    ['LAB_L', 'LAB_A', 'LAB_B'],  # Argyll
-                    ['Lab_L', 'Lab_a', 'Lab_b'],  # X-Rite variant 1
-                    ['Lab_L', 'Lab_A', 'Lab_B']  # X-Rite variant 2
-                ]
-
-                for lab_cols in lab_variants:
-                    if all(col in data_format for col in lab_cols):
-                        try:
-                            # Handle commas as decimal separators
-                            lab_values = []
-                            for col in lab_cols:
-                                val_str = parts[data_format[col]].replace(',', '.')
-                                lab_values.append(float(val_str))
-
-                            patch_data['lab_target'] = lab_values
-                            break
-                        except ValueError:
-                            continue
-
-                patches.append(patch_data)
+    Columnar data is in result['table'] (CgatsTable, shared via read_cgats_table),
+    including SPEC_* spectra (table.spectral, table.spectral_xyz(illuminant));
+    result['patches'] is a lazy legacy list of dicts built on first access and
+    owned by the caller.
+
+    Raises:
+        ValueError: non-numeric RGB/XYZ value in a patch row
+    """
+    table = read_cgats_table(cgats_filename)
+    table.validate()
+
+    # File type detection
+    file_ext = cgats_filename.lower().split('.')[-1]
+    file_type = file_ext if file_ext in ['ti2', 'ti3', 'cie'] else 'cgats'
 
     return {
-        'patches': patches,
-        'format': column_names,
+        'patches': CgatsPatchView(table),
+        'table': table,
+        'format': table.column_names,
         'file_type': file_type,
-        'total_columns': len(column_names),
-        'detected_format': _detect_format_type(column_names)
+        'total_columns': len(table.column_names),
+        'detected_format': table.detected_format
     }
 
 
@@ -466,13 +777,12 @@ def get_patch_names_universal(cgats_filename):
     - Argyll: SAMPLE_ID -> ['H6', 'M10', 'A01', ...]
     - Mixed: correctly identifies ID vs number
     """
-    result = parse_cgats_file(cgats_filename)
-    patches = result['patches']
+    table = read_cgats_table(cgats_filename)
 
     # Extract names - identical for all formats
-    patch_names = [patch['patch_id'] for patch in patches]
+    patch_names = list(table.patch_names)
 
-    print(tr(f"Format: {result['detected_format']}"))
+    print(tr(f"Format: {table.detected_format}"))
     print(tr(f"Patches found: {len(patch_names)}"))
     print(tr(f"First 10: {patch_names[:10]}"))
 
@@ -481,7 +791,6 @@ def get_patch_names_universal(cgats_filename):
 import platform
 from typing import List, Tuple, Optional, Callable
 from background_process import BackgroundProcessManager
-import tempfile
 import os
 from PySide6.QtWidgets import QApplication
 
@@ -596,30 +905,53 @@ def run_xicclu_with_background(
             on_error=on_error
         )
 
-        while manager.is_running():
-            QApplication.processEvents()  # Обновляем UI
-            time.sleep(0.15)  # 50ms пауза
+        manager.wait()
 
         for idx, result in enumerate(results):
             data[idx]['lab_reference_m'] = result
 
 def update_lab_data(ti3_data: List[Any], path_to_paper_profile:str) -> None:
+    """
+    lab_reference_m для каждого патча: rgb_reference (0..255) через профиль бумаги,
+    relative colorimetric → Lab (как xicclu -ir -pl -s255).
+
+    Профиль вычисляется в процессе (icc_calcs, профиль кэшируется); xicclu (постоянная
+    сессия, см. ToolSession) - только если профиль содержит неподдерживаемые теги.
+    """
+    from icc_calcs import IccProfileError, evaluate_icc
+
+    if not ti3_data:
+        return
+
     try:
-        temp_fd, temp_filename = tempfile.mkstemp(suffix='.txt', prefix='lab_data_')
-        with os.fdopen(temp_fd, 'w') as f:
-            for item in ti3_data:
-                r, g, b = item['rgb_reference'][0], item['rgb_reference'][1], item['rgb_reference'][2]
-                f.write(f"{r} {g} {b}\n")
-
-        run_xicclu_with_background(
-            ti3_data,
-            profile_path=path_to_paper_profile,
-            input_file=temp_filename,
-        )
+        rgb = np.array([item['rgb_reference'][:3] for item in ti3_data], dtype=np.float64)
+        lab = evaluate_icc(path_to_paper_profile, rgb, scale=255.0, intent='r', pcs='lab')
+        for item, value in zip(ti3_data, lab.tolist()):
+            item['lab_reference_m'] = tuple(value)
+        return
+    except IccProfileError as e:
+        print(tr("In-process ICC evaluation unavailable (%s), using xicclu") % str(e))
+    except Exception as e:
+        print(f"Error: int labB: {e}")
+        traceback.print_exc()
+        return
 
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
+    # xicclu остается запущенным между вызовами, данные идут через pipe
+    from background_process import ToolSessionError, get_tool_session
+    from locate_argyl import get_argyll_tool
 
+    try:
+        xicclu = get_argyll_tool('xicclu') or 'xicclu'
+        session = get_tool_session([xicclu, '-v0', '-ir', '-pl', '-s255', path_to_paper_profile],
+                                   input_files=[path_to_paper_profile])
+        lines = [f"{item['rgb_reference'][0]} {item['rgb_reference'][1]} {item['rgb_reference'][2]}"
+                 for item in ti3_data]
+        results = session.request(lines, timeout=300)
+        for item, result in zip(ti3_data, results):
+            item['lab_reference_m'] = result[:3]
+
+    except (ToolSessionError, OSError) as e:
+        print(f"Ошибка выполнения: {e}")
     except Exception as e:
         print(f"Error: int labB: {e}")
         traceback.print_exc()
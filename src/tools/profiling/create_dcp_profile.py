@@ -2,15 +2,69 @@
 import struct
 import json
 import datetime
+from functools import lru_cache
 import numpy as np
-from scipy.optimize import least_squares
 from scipy.spatial import ConvexHull
 
 from patch_calcs import expected_artifact_quality  # Твоя система!
+from hue_sat_calcs import select_table_configuration, HueSatTablePlan, generate_hue_sat_deltas_data
 
 from colour.difference import delta_E_CIE2000
 import colour
 
+# Официальные DNG коды источников освещения (Adobe DNG Specification)
+ILLUMINANT_TO_DNG = {
+    # Стандартные источники CIE
+    'A': 17,  # Incandescent / Tungsten (2856K)
+    'B': 18,  # Direct sunlight at noon (4874K)
+    'C': 19,  # Average / North sky daylight (6774K)
+    'D50': 23,  # ISO studio tungsten (5003K)
+    'D55': 20,  # Daylight D55 (5503K)
+    'D65': 21,  # Daylight D65 (6504K) - стандарт sRGB
+    'D75': 22,  # North sky daylight (7504K)
+
+    # Флуоресцентные источники
+    'F1': 24,  # Daylight fluorescent (6430K)
+    'F2': 25,  # Cool white fluorescent (4230K)
+    'F3': 26,  # White fluorescent (3450K)
+    'F4': 27,  # Warm white fluorescent (2940K)
+    'F5': 28,  # Daylight fluorescent (6350K)
+    'F6': 29,  # Lite white fluorescent (4150K)
+    'F7': 30,  # D65 simulator, daylight simulator (6500K)
+    'F8': 31,  # D50 simulator, Sylvania F40 Design 50 (5000K)
+    'F9': 32,  # Cool white deluxe fluorescent (4150K)
+    'F10': 33,  # Philips TL85, Ultralume 50 (5000K)
+    'F11': 34,  # Philips TL84, Ultralume 40 (4000K)
+    'F12': 35,  # Philips TL83, Ultralume 30 (3000K)
+
+    # Специальные источники
+    'ISO_STUDIO_TUNGSTEN': 24,  # Альтернативное название для D50
+
+    # Вспышки и студийное освещение
+    'FLASH': 4,  # Flash
+    'FINE_WEATHER': 9,  # Fine weather
+    'CLOUDY_WEATHER': 10,  # Cloudy weather
+    'SHADE': 11,  # Shade
+    'DAYLIGHT_FLUORESCENT': 12,  # Daylight fluorescent (D 5700 – 7100K)
+    'DAY_WHITE_FLUORESCENT': 13,  # Day white fluorescent (N 4600 – 5400K)
+    'COOL_WHITE_FLUORESCENT': 14,  # Cool white fluorescent (W 3900 – 4500K)
+    'WHITE_FLUORESCENT': 15,  # White fluorescent (WW 3200 – 3700K)
+    'STANDARD_LIGHT_A': 17,  # Standard light A
+    'STANDARD_LIGHT_B': 18,  # Standard light B
+    'STANDARD_LIGHT_C': 19,  # Standard light C
+
+    # Добавляем общепринятые альтернативные названия
+    'DAYLIGHT': 21,  # Часто используется как синоним D65
+    'TUNGSTEN': 17,  # Синоним источника A
+    'INCANDESCENT': 17,  # Синоним источника A
+    'SUNLIGHT': 18,  # Синоним источника B
+    'SKYLIGHT': 19,  # Синоним источника C
+}
+
+# Источники библиотеки colour, для которых есть DNG код (кандидаты для CalibrationIlluminant)
+DNG_CALIBRATION_ILLUMINANTS = ('A', 'B', 'C', 'D50', 'D55', 'D65', 'D75')
+
+
 def compare_camera_to_standard(camera_wb_dict, best_illuminant):
     """
     Сравнивает WB камеры со стандартным источником
@@ -49,110 +103,232 @@ def compare_camera_to_standard(camera_wb_dict, best_illuminant):
     result['best_illuminant'] = best_illuminant
     result['camera_relevance'] = round(relevance, 1)
 
-    # Официальные DNG коды источников освещения (Adobe DNG Specification)
-    ILLUMINANT_TO_DNG = {
-        # Стандартные источники CIE
-        'A': 17,  # Incandescent / Tungsten (2856K)
-        'B': 18,  # Direct sunlight at noon (4874K)
-        'C': 19,  # Average / North sky daylight (6774K)
-        'D50': 23,  # ISO studio tungsten (5003K)
-        'D55': 20,  # Daylight D55 (5503K)
-        'D65': 21,  # Daylight D65 (6504K) - стандарт sRGB
-        'D75': 22,  # North sky daylight (7504K)
-
-        # Флуоресцентные источники
-        'F1': 24,  # Daylight fluorescent (6430K)
-        'F2': 25,  # Cool white fluorescent (4230K)
-        'F3': 26,  # White fluorescent (3450K)
-        'F4': 27,  # Warm white fluorescent (2940K)
-        'F5': 28,  # Daylight fluorescent (6350K)
-        'F6': 29,  # Lite white fluorescent (4150K)
-        'F7': 30,  # D65 simulator, daylight simulator (6500K)
-        'F8': 31,  # D50 simulator, Sylvania F40 Design 50 (5000K)
-        'F9': 32,  # Cool white deluxe fluorescent (4150K)
-        'F10': 33,  # Philips TL85, Ultralume 50 (5000K)
-        'F11': 34,  # Philips TL84, Ultralume 40 (4000K)
-        'F12': 35,  # Philips TL83, Ultralume 30 (3000K)
-
-        # Специальные источники
-        'ISO_STUDIO_TUNGSTEN': 24,  # Альтернативное название для D50
-
-        # Вспышки и студийное освещение
-        'FLASH': 4,  # Flash
-        'FINE_WEATHER': 9,  # Fine weather
-        'CLOUDY_WEATHER': 10,  # Cloudy weather
-        'SHADE': 11,  # Shade
-        'DAYLIGHT_FLUORESCENT': 12,  # Daylight fluorescent (D 5700 – 7100K)
-        'DAY_WHITE_FLUORESCENT': 13,  # Day white fluorescent (N 4600 – 5400K)
-        'COOL_WHITE_FLUORESCENT': 14,  # Cool white fluorescent (W 3900 – 4500K)
-        'WHITE_FLUORESCENT': 15,  # White fluorescent (WW 3200 – 3700K)
-        'STANDARD_LIGHT_A': 17,  # Standard light A
-        'STANDARD_LIGHT_B': 18,  # Standard light B
-        'STANDARD_LIGHT_C': 19,  # Standard light C
-
-        # Добавляем общепринятые альтернативные названия
-        'DAYLIGHT': 21,  # Часто используется как синоним D65
-        'TUNGSTEN': 17,  # Синоним источника A
-        'INCANDESCENT': 17,  # Синоним источника A
-        'SUNLIGHT': 18,  # Синоним источника B
-        'SKYLIGHT': 19,  # Синоним источника C
-    }
-
     return ILLUMINANT_TO_DNG[best_illuminant]
 
 
-def find_best_illuminant(patches_data):
+STANDARD_OBSERVER = 'CIE 1931 2 Degree Standard Observer'
+
+
+def _patch_values(patch, *keys):
+    """Первое найденное поле патча из keys (поддержка 'RGB'/'rgb', 'XYZ'/'xyz_reference')"""
+    for key in keys:
+        if key in patch:
+            return patch[key]
+    raise KeyError(keys[0])
+
+
+@lru_cache(maxsize=8)
+def _illuminant_matrices(illuminant_names, colourspace='sRGB'):
+    """
+    Матрицы linear RGB → XYZ с хроматической адаптацией к каждому источнику.
+
+    Returns:
+        (names, matrices): источники, для которых матрица посчитана, и (I, 3, 3)
+    """
+    observer = colour.CCS_ILLUMINANTS[STANDARD_OBSERVER]
+    names = []
+    matrices = []
+    for name in illuminant_names:
+        with np.errstate(all='raise'):
+            try:
+                # Строки результата - XYZ основных цветов, матрица - транспонированная
+                primaries_xyz = colour.RGB_to_XYZ(np.eye(3), colourspace=colourspace,
+                                                  illuminant=observer[name])
+            except (ValueError, FloatingPointError, np.linalg.LinAlgError) as e:
+                print(f"⚠️  Illuminant {name} skipped: {e}")
+                continue
+        names.append(name)
+        matrices.append(np.asarray(primaries_xyz).T)
+
+    return tuple(names), np.array(matrices).reshape(-1, 3, 3)
+
+
+def rank_illuminants(patches_data, illuminants=None):
+    """
+    Оценка всех источников освещения разом: средний ΔE2000 по патчам.
+
+    Все патчи и все источники считаются одним тензором (I, N, 3),
+    CIEDE2000 - векторизованно.
+
+    Args:
+        patches_data: список словарей с 'RGB'/'rgb' и 'XYZ'/'xyz_reference'
+        illuminants: имена источников colour (None - все для стандартного наблюдателя)
+
+    Returns:
+        list: [(имя, средний ΔE), ...] по возрастанию ошибки
+    """
+    if not patches_data:
+        return []
+
+    if illuminants is None:
+        illuminants = colour.CCS_ILLUMINANTS[STANDARD_OBSERVER].keys()
+    names, matrices = _illuminant_matrices(tuple(illuminants))
+    if not names:
+        return []
+
+    rgb = np.array([_patch_values(patch, 'RGB', 'rgb') for patch in patches_data], dtype=np.float64)
+    rgb = np.where(rgb.max(axis=1, keepdims=True) > 1.0, rgb / 255.0, rgb)
+
+    xyz_reference = np.array([_patch_values(patch, 'XYZ', 'xyz_reference') for patch in patches_data],
+                             dtype=np.float64)
+    if xyz_reference.max() > 1.5:
+        # Эталоны в шкале Y=100 - к шкале 0-1, как у RGB_to_XYZ
+        xyz_reference = xyz_reference / 100.0
+
+    # (I, N, 3): RGB каждого патча под каждым источником
+    xyz_calculated = np.einsum('ikj,nj->ink', matrices, rgb)
+
+    lab_reference = colour.XYZ_to_Lab(xyz_reference)
+    lab_calculated = colour.XYZ_to_Lab(xyz_calculated)
+
+    with np.errstate(invalid='ignore'):
+        errors = np.mean(delta_E_CIE2000(lab_reference[np.newaxis], lab_calculated), axis=1)
+
+    order = np.argsort(errors, kind='stable')
+    return [(names[i], float(errors[i])) for i in order if np.isfinite(errors[i])]
+
+
+def find_best_illuminant(patches_data, illuminants=None):
     """
-    Брутфорс поиск лучшего источника освещения
+    Поиск лучшего источника освещения
     Args:
-        patches_data: список словарей с 'rgb' и 'xyz_reference'
+        patches_data: список словарей с 'RGB'/'rgb' и 'XYZ'/'xyz_reference'
+        illuminants: имена источников-кандидатов (None - все из библиотеки colour)
     Returns:
-        str: ID лучшего источника (библиотечный)
+        str: ID лучшего источника (библиотечный) или None
     """
+    ranking = rank_illuminants(patches_data, illuminants)
+    return ranking[0][0] if ranking else None
 
-    # Все доступные источники из библиотеки colour
-    illuminants = colour.CCS_ILLUMINANTS['CIE 1931 2 Degree Standard Observer'].keys()
 
-    best_illuminant = None
-    min_error = float('inf')
+class MatrixFitter:
+    """
+    Линейная подгонка 3x3 матрицы dst ≈ src @ M.T в замкнутой форме.
+
+    Произведения строк src считаются один раз, поэтому каждая новая подгонка
+    (другие веса, итерация уточнения) стоит одного решения 3x3 системы.
+    """
 
-    for illuminant_name in illuminants:
-        total_error = 0
+    def __init__(self, src, dst):
+        """
+        Args:
+            src: (N, 3) исходные значения (например, RGB камеры)
+            dst: (N, 3) целевые значения (например, XYZ)
+        """
+        self.src = np.asarray(src, dtype=np.float64)
+        self.dst = np.asarray(dst, dtype=np.float64)
+        self._gram_rows = np.einsum('ni,nj->nij', self.src, self.src)
+        self._cross_rows = np.einsum('ni,nj->nij', self.src, self.dst)
+
+    def fit(self, weights=None):
+        """
+        Взвешенный МНК: min sum(w_i * |src_i @ M.T - dst_i|^2).
+
+        Args:
+            weights: (N,) веса патчей или None
+
+        Returns:
+            np.ndarray (3, 3)
+        """
+        if weights is None:
+            gram = self._gram_rows.sum(axis=0)
+            cross = self._cross_rows.sum(axis=0)
+        else:
+            gram = np.einsum('n,nij->ij', weights, self._gram_rows)
+            cross = np.einsum('n,nij->ij', weights, self._cross_rows)
 
         try:
-            for patch in patches_data:
-                rgb = np.array(patch['rgb'])
-                if rgb.max() > 1.0:
-                    rgb = rgb / 255.0
+            return np.linalg.solve(gram, cross).T
+        except np.linalg.LinAlgError:
+            # Вырожденный набор патчей - решение с минимальной нормой
+            scale = np.ones(len(self.src)) if weights is None else np.sqrt(weights)
+            solution = np.linalg.lstsq(self.src * scale[:, None], self.dst * scale[:, None], rcond=None)[0]
+            return solution.T
 
-                xyz_reference = np.array(patch['xyz_reference'])
 
-                xyz_calculated = colour.RGB_to_XYZ(
-                    rgb,
-                    colourspace='sRGB',
-                    illuminant=colour.CCS_ILLUMINANTS['CIE 1931 2 Degree Standard Observer'][illuminant_name]
-                )
+def patch_fit_weights(patches_data):
+    """
+    Веса патчей для подгонки матриц по надежности измерения.
 
-                lab_ref = colour.XYZ_to_Lab(xyz_reference)
-                lab_calc = colour.XYZ_to_Lab(xyz_calculated)
+    w = 1 / (σ² + σ0²), где σ - средний std_rgb патча (0-1), ненадежные патчи
+    (reliable=False) получают 1/4 веса. Веса нормированы к среднему 1.
 
-                total_error += delta_E_CIE2000(lab_ref, lab_calc)
+    Returns:
+        np.ndarray (N,) или None, если в патчах нет std_rgb/reliable
+    """
+    if not any('std_rgb' in patch or 'reliable' in patch for patch in patches_data):
+        return None
+
+    sigma_floor = 1.0 / 255.0
+    weights = np.ones(len(patches_data))
+    for i, patch in enumerate(patches_data):
+        if 'std_rgb' in patch:
+            rgb_scale = 255.0 if np.max(patch['RGB']) > 1.0 else 1.0
+            sigma = float(np.mean(patch['std_rgb'])) / rgb_scale
+            weights[i] = 1.0 / (sigma ** 2 + sigma_floor ** 2)
+        if not patch.get('reliable', True):
+            weights[i] *= 0.25
 
-            avg_error = total_error / len(patches_data)
+    return weights / weights.mean()
 
-            if avg_error < min_error:
-                min_error = avg_error
-                best_illuminant = illuminant_name
 
-        except:
-            continue
+def _xyz_to_lab_batch(xyz):
+    """XYZ (N, 3) в 0-1 или 0-100 → Lab, отрицательные XYZ обрезаются"""
+    xyz = np.maximum(xyz, 0.0)
+    if xyz.max() > 1.5:
+        xyz = xyz / 100.0
+    return colour.XYZ_to_Lab(xyz)
+
+
+def fit_color_matrix(rgb, xyz, weights=None, refine_iterations=0, tolerance=1e-6):
+    """
+    ColorMatrix RGB→XYZ: взвешенный МНК + итеративное уточнение по ΔE2000.
+
+    Уточнение перевзвешивает патчи на (ΔE_i / |ΔXYZ_i|)², и МНК в XYZ
+    приближает минимизацию суммы ΔE². Факторизация патчей общая для всех итераций.
 
-    return best_illuminant
+    Args:
+        rgb: (N, 3) RGB камеры 0-1
+        xyz: (N, 3) эталонные XYZ
+        weights: (N,) веса надежности патчей или None
+        refine_iterations: число итераций ΔE-уточнения (0 - только МНК)
+        tolerance: остановка при изменении матрицы меньше tolerance
 
-def calculate_forward_matrix(color_matrix, rgb_array, xyz_array):
+    Returns:
+        np.ndarray (3, 3)
+    """
+    fitter = MatrixFitter(rgb, xyz)
+    base_weights = np.ones(len(fitter.src)) if weights is None else np.asarray(weights, dtype=np.float64)
+    matrix = fitter.fit(weights)
+    if refine_iterations <= 0:
+        return matrix
+
+    lab_reference = _xyz_to_lab_batch(fitter.dst)
+    for _ in range(refine_iterations):
+        xyz_predicted = fitter.src @ matrix.T
+        xyz_error = np.linalg.norm(xyz_predicted - fitter.dst, axis=1)
+        delta_e = delta_E_CIE2000(lab_reference, _xyz_to_lab_batch(xyz_predicted))
+
+        sensitivity = np.where(xyz_error > 1e-12, delta_e / np.maximum(xyz_error, 1e-12), 0.0)
+        sensitivity = np.nan_to_num(sensitivity)
+        if not np.any(sensitivity > 0):
+            break
+
+        refined = fitter.fit(base_weights * sensitivity ** 2)
+        converged = np.max(np.abs(refined - matrix)) < tolerance
+        matrix = refined
+        if converged:
+            break
+
+    return matrix
+
+
+def calculate_forward_matrix(color_matrix, rgb_array, xyz_array, weights=None):
     """
     Вычисляет ForwardMatrix1 для DCP профиля
     Не просто инверсия ColorMatrix!
+
+    Линейный МНК в замкнутой форме: Camera RGB → XYZ (ColorMatrix) → sRGB.
     """
 
     # 1. Преобразуем XYZ в цветовое пространство вывода (sRGB)
@@ -165,25 +341,20 @@ def calculate_forward_matrix(color_matrix, rgb_array, xyz_array):
     # 2. Целевые RGB значения в sRGB
     srgb_target = xyz_array @ xyz_to_srgb.T
 
-    # 3. Оптимизируем ForwardMatrix для минимизации ошибки
-    def forward_objective(forward_matrix_flat):
-        forward_matrix = forward_matrix_flat.reshape(3, 3)
-
-        # Camera RGB → XYZ → sRGB для отображения
-        xyz_predicted = rgb_array @ color_matrix.T  # RAW RGB → XYZ
-        srgb_predicted = xyz_predicted @ forward_matrix.T  # XYZ → sRGB (для показа)
-
-        return (srgb_predicted - srgb_target).flatten()
+    # 3. Camera RGB → XYZ считается один раз, ForwardMatrix: XYZ → sRGB (для показа)
+    xyz_predicted = rgb_array @ color_matrix.T
 
+    return MatrixFitter(xyz_predicted, srgb_target).fit(weights)
 
-    # Начальная матрица - комбинация ColorMatrix + XYZ→sRGB
-    initial_forward = xyz_to_srgb @ color_matrix
 
-    from scipy.optimize import least_squares
-    result = least_squares(forward_objective, initial_forward.flatten())
+def _patches_to_arrays(patches_data):
+    """Патчи → (rgb 0-1, xyz) массивы (N, 3), как в build_dcp_profile"""
+    rgb_array = np.array([patch['RGB'] for patch in patches_data], dtype=np.float64)
+    xyz_array = np.array([patch['XYZ'] for patch in patches_data], dtype=np.float64)
 
-    forward_matrix = result.x.reshape(3, 3)
-    return forward_matrix
+    # Нормализуем RGB к [0,1] (построчно, как для одиночного патча)
+    rgb_array = np.where(rgb_array.max(axis=1, keepdims=True) > 1.0, rgb_array / 255.0, rgb_array)
+    return rgb_array, xyz_array
 
 
 def calculate_reduction_matrices(color_matrix, forward_matrix):
@@ -198,10 +369,73 @@ def calculate_reduction_matrices(color_matrix, forward_matrix):
     return reduction_matrix1, reduction_matrix2
 
 
-def build_dcp_profile(patches_data, output_filename):
+def build_hue_sat_tables(patches_data, patches_data_2=None, look_patches=None,
+                         is_negative=False, method='hybrid', skip=(), parallel=False):
+    """
+    HueSatDeltas1/2 и LookTable по одному общему плану интерполяции.
+
+    Сетка общая (HueSatTablePlan). Привязка к ячейкам, поиск соседей и
+    факторизация RBF переиспользуются между таблицами с одинаковыми RGB камеры
+    (одна маска заполнения), например HueSatDeltas1 и LookTable. Второй источник
+    света с другой маской строит свой оператор.
+
+    Args:
+        patches_data: патчи источника 1 [{'RGB': ..., 'XYZ': ...}, ...]
+        patches_data_2: патчи источника 2 (None - нет HueSatDeltas2)
+        look_patches: патчи для LookTable (None - нет LookTable)
+        is_negative: негативная пленка
+        method: 'shepard', 'rbf' или 'hybrid'
+        skip: ключи таблиц, которые не нужно строить (берутся из готового профиля)
+        parallel: hybrid считает Shepard и RBF одновременно (время - по более медленному)
+
+    Returns:
+        dict: поля dcp_data для таблиц (None для отсутствующих)
+    """
+    config = select_table_configuration(is_color=True, is_negative=is_negative,
+                                        patches_count=len(patches_data))
+    plan = HueSatTablePlan(config)
+
+    tables = {
+        'hue_sat_map_dims': plan.shape,
+        'hue_sat_deltas_1': None,
+        'hue_sat_deltas_2': None,
+        'look_table_dims': None,
+        'look_table': None,
+    }
+
+    for key, patches, table_name in (('hue_sat_deltas_1', patches_data, 'HueSatDeltas1'),
+                                     ('hue_sat_deltas_2', patches_data_2, 'HueSatDeltas2'),
+                                     ('look_table', look_patches, 'LookTable')):
+        if patches and key not in skip:
+            table = plan.interpolate(patches, method, parallel=parallel)
+            tables[key] = generate_hue_sat_deltas_data(table, table_name=table_name)
+
+    if tables['look_table'] is not None:
+        tables['look_table_dims'] = plan.shape
+
+    return tables
+
+
+def build_dcp_profile(patches_data, output_filename, patches_data_2=None, look_patches=None,
+                      refine_iterations=0, base_profile=None, keep=()):
+    """
+    Строит DCP профиль по патчам и сохраняет его.
+
+    Args:
+        patches_data: патчи источника 1 [{'RGB': ..., 'XYZ': ..., 'SAMPLE_ID': ...}, ...]
+        output_filename: имя файла без расширения
+        patches_data_2: патчи того же таргета под вторым источником (ColorMatrix2, HueSatDeltas2)
+        look_patches: патчи для LookTable
+        refine_iterations: итерации ΔE2000-уточнения матриц (0 - чистый МНК)
+        base_profile: готовый профиль (путь к .dcp или dcp_data) для инкрементальной пересборки
+        keep: компоненты base_profile, которые не пересчитываются (см. DCP_REUSABLE_COMPONENTS)
+    """
 
     print(f"Обрабатываем {len(patches_data)} патчей...")
 
+    # Компоненты готового профиля, которые берутся без пересчета
+    reused = reusable_profile_fields(base_profile, keep)
+
     # Извлекаем данные
     rgb_values = []
     xyz_values = []
@@ -218,24 +452,34 @@ def build_dcp_profile(patches_data, output_filename):
     rgb_array = np.array(rgb_values)
     xyz_array = np.array(xyz_values)
 
-    # Строим матрицу преобразования RGB→XYZ
-    def build_color_matrix(rgb, xyz):
-        def objective(matrix_flat):
-            matrix = matrix_flat.reshape(3, 3)
-            xyz_pred = rgb @ matrix.T
-            return (xyz_pred - xyz).flatten()
-
-        initial_matrix = np.eye(3).flatten()
-        result = least_squares(objective, initial_matrix)
-        return result.x.reshape(3, 3)
+    # Веса патчей по надежности измерения (std_rgb / reliable), если есть
+    fit_weights = patch_fit_weights(patches_data)
 
     # Строим основную матрицу
-    color_matrix = build_color_matrix(rgb_array, xyz_array)
-
-    # После расчета color_matrix
-    print("Вычисляем ForwardMatrix...")
-    forward_matrix1 = calculate_forward_matrix(color_matrix, rgb_array, xyz_array)
-    forward_matrix2 = forward_matrix1  # Пока одинаковые для одного освещения
+    if 'color_matrix_1' in reused:
+        print("ColorMatrix1 / ForwardMatrix1 - из готового профиля")
+        color_matrix = reused['color_matrix_1']
+        forward_matrix1 = reused.get('forward_matrix_1')
+    else:
+        color_matrix = fit_color_matrix(rgb_array, xyz_array, fit_weights, refine_iterations)
+
+        # После расчета color_matrix
+        print("Вычисляем ForwardMatrix...")
+        forward_matrix1 = calculate_forward_matrix(color_matrix, rgb_array, xyz_array, fit_weights)
+    forward_matrix2 = None
+
+    # Второй источник света - тот же таргет под другим освещением
+    color_matrix_2 = None
+    if 'color_matrix_2' in reused:
+        print("ColorMatrix2 / ForwardMatrix2 - из готового профиля")
+        color_matrix_2 = reused['color_matrix_2']
+        forward_matrix2 = reused.get('forward_matrix_2')
+    elif patches_data_2:
+        print("Вычисляем ColorMatrix2 / ForwardMatrix2...")
+        rgb_array_2, xyz_array_2 = _patches_to_arrays(patches_data_2)
+        fit_weights_2 = patch_fit_weights(patches_data_2)
+        color_matrix_2 = fit_color_matrix(rgb_array_2, xyz_array_2, fit_weights_2, refine_iterations)
+        forward_matrix2 = calculate_forward_matrix(color_matrix_2, rgb_array_2, xyz_array_2, fit_weights_2)
 
     print("Вычисляем ReductionMatrix...")
     reduction_matrix1, reduction_matrix2 = calculate_reduction_matrices(
@@ -286,13 +530,29 @@ def build_dcp_profile(patches_data, output_filename):
     print(f"\nМатрица преобразования RGB→XYZ:")
     print(color_matrix)
 
-    best_il = find_best_illuminant(patches_data)
+    # CalibrationIlluminant пишется DNG кодом - ищем только среди источников с кодом
+    if 'illuminant_1' in reused:
+        illuminant_1 = reused['illuminant_1']
+    else:
+        illuminant_1 = ILLUMINANT_TO_DNG.get(find_best_illuminant(patches_data, DNG_CALIBRATION_ILLUMINANTS))
+    if 'illuminant_2' in reused:
+        illuminant_2 = reused['illuminant_2']
+    elif patches_data_2:
+        illuminant_2 = ILLUMINANT_TO_DNG.get(find_best_illuminant(patches_data_2, DNG_CALIBRATION_ILLUMINANTS))
+    else:
+        illuminant_2 = None
+
+    # HueSatDeltas1/2 и LookTable - один план интерполяции на все таблицы
+    print("Строим таблицы HueSatDeltas / LookTable...")
+    hue_sat_tables = build_hue_sat_tables(patches_data, patches_data_2, look_patches, skip=reused.keys(),
+                                          parallel=True)
+    hue_sat_tables.update((key, value) for key, value in reused.items() if key in hue_sat_tables)
 
     # Создаем DCP с оценкой качества
     dcp_data = {
         # === ОБЯЗАТЕЛЬНЫЕ ТЕГИ ===
         'color_matrix_1': color_matrix,  # ColorMatrix1 (ОБЯЗАТЕЛЬНО)
-        'illuminant_1': best_il,  # CalibrationIlluminant1 (D65)
+        'illuminant_1': illuminant_1,  # CalibrationIlluminant1 (21 = D65)
         'unique_camera_model': 'Generic Camera',  # UniqueCameraModel (ОБЯЗАТЕЛЬНО)
 
         # === МАТРИЦЫ ДЛЯ ИСТОЧНИКА 1 ===
@@ -300,12 +560,12 @@ def build_dcp_profile(patches_data, output_filename):
         'reduction_matrix_1': reduction_matrix1,  # ReductionMatrix1
         'camera_calibration_1': np.eye(3),  # CameraCalibration1
 
-        # === МАТРИЦЫ ДЛЯ ИСТОЧНИКА 2 (пока None) ===
-        'color_matrix_2': None,  # ColorMatrix2 (для второго освещения)
-        'illuminant_2': None,  # CalibrationIlluminant2 (17 = StdA)
-        'forward_matrix_2': None,  # ForwardMatrix2
-        'reduction_matrix_2': None,  # ReductionMatrix2
-        'camera_calibration_2': None,  # CameraCalibration2
+        # === МАТРИЦЫ ДЛЯ ИСТОЧНИКА 2 (None без patches_data_2) ===
+        'color_matrix_2': color_matrix_2,  # ColorMatrix2 (для второго освещения)
+        'illuminant_2': illuminant_2,  # CalibrationIlluminant2 (17 = StdA)
+        'forward_matrix_2': forward_matrix2,  # ForwardMatrix2
+        'reduction_matrix_2': reduction_matrix2 if color_matrix_2 is not None else None,  # ReductionMatrix2
+        'camera_calibration_2': np.eye(3) if color_matrix_2 is not None else None,  # CameraCalibration2
 
         # === МЕТАДАННЫЕ ПРОФИЛЯ ===
         'profile_name': 'AI Generated DCP',  # ProfileName
@@ -313,10 +573,12 @@ def build_dcp_profile(patches_data, output_filename):
         'profile_embed_policy': 3,  # ProfileEmbedPolicy (разрешить копирование)
         'profile_version': '1.0.0',  # Версия профиля (кастомное поле)
 
-        # === ТАБЛИЦЫ ПОИСКА (пока None) ===
-        'hue_sat_deltas_1': None,  # HueSatDeltas1 (HSL коррекция) **ID 50708** [[5]](https://exiftool.org/TagNames/DNG.html).
-        'hue_sat_deltas_2': None,  # HueSatDeltas2
-        'look_table': None,  # LookTable (творческий look)
+        # === ТАБЛИЦЫ ПОИСКА (float32 в порядке Adobe, общий план интерполяции) ===
+        'hue_sat_map_dims': hue_sat_tables['hue_sat_map_dims'],  # ProfileHueSatMapDims
+        'hue_sat_deltas_1': hue_sat_tables['hue_sat_deltas_1'],  # ProfileHueSatMapData1 (HSV коррекция)
+        'hue_sat_deltas_2': hue_sat_tables['hue_sat_deltas_2'],  # ProfileHueSatMapData2
+        'look_table_dims': hue_sat_tables['look_table_dims'],  # ProfileLookTableDims
+        'look_table': hue_sat_tables['look_table'],  # LookTable (творческий look)
 
         # === ИНФОРМАЦИЯ О КАЧЕСТВЕ ===
         'patches_count': len(patches_data),
@@ -336,6 +598,35 @@ def build_dcp_profile(patches_data, output_filename):
     return dcp_data
 
 
+# Маппинг: поле dcp_data → (тег_id, тип_данных TIFF)
+DCP_TAG_MAP = {
+    'color_matrix_1': (50714, 10),
+    'color_matrix_2': (50715, 10),
+    'forward_matrix_1': (50716, 10),
+    'forward_matrix_2': (50726, 10),
+    'reduction_matrix_1': (50719, 10),
+    'reduction_matrix_2': (50720, 10),
+    'camera_calibration_1': (50723, 10),
+    'camera_calibration_2': (50724, 10),
+
+    'illuminant_1': (50717, 3),
+    'illuminant_2': (50718, 3),
+    'profile_embed_policy': (50941, 4),
+
+    'profile_name': (50936, 2),
+    'profile_copyright': (50942, 2),
+    'unique_camera_model': (50727, 2),
+    'profile_version': (50725, 2),
+
+    # Таблицы HSV коррекции (FLOAT массивы, размеры - LONG x3)
+    'hue_sat_map_dims': (50937, 4),
+    'hue_sat_deltas_1': (50938, 11),
+    'hue_sat_deltas_2': (50939, 11),
+    'look_table_dims': (50981, 4),
+    'look_table': (50982, 11),
+}
+
+
 def save_dcp_profile(dcp_data, filename):
     """Сохраняет DCP с правильными типами данных для каждого тега"""
 
@@ -352,137 +643,289 @@ def save_dcp_profile(dcp_data, filename):
         return (dcp_data.get('illuminant_2') is not None and
                 dcp_data.get('color_matrix_2') is not None)
 
-    # Маппинг: поле → (тег_id, тип_данных, функция_записи)
-    DCP_TAG_MAP = {
-        'color_matrix_1': (50714, 10, write_matrix_srational),
-        'color_matrix_2': (50715, 10, write_matrix_srational),
-        'forward_matrix_1': (50716, 10, write_matrix_srational),
-        'forward_matrix_2': (50726, 10, write_matrix_srational),
-        'reduction_matrix_1': (50719, 10, write_matrix_srational),
-        'reduction_matrix_2': (50720, 10, write_matrix_srational),
-        'camera_calibration_1': (50723, 10, write_matrix_srational),
-        'camera_calibration_2': (50724, 10, write_matrix_srational),
-
-        'illuminant_1': (50717, 3, write_short),
-        'illuminant_2': (50718, 3, write_short),
-        'profile_embed_policy': (50941, 4, write_long),
-
-        'profile_name': (50936, 2, write_ascii_string),
-        'profile_copyright': (50942, 2, write_ascii_string),
-        'unique_camera_model': (50727, 2, write_ascii_string), #
-        'profile_version': (50725, 2, write_ascii_string),  # ✅ ДОБАВЛЕНО!
-        # Правильный HueSatDeltas1
-        'hue_sat_deltas_1': (50708, 5, write_matrix_srational),  # ✅ ИСПРАВЛЕНО!
-
-    }
-
     # Собираем теги для записи
     tags_to_write = []
     for key, value in dcp_data.items():
         if key in DCP_TAG_MAP and should_write_tag(key, value):
-            tag_id, data_type, write_func = DCP_TAG_MAP[key]
+            tag_id, data_type = DCP_TAG_MAP[key]
             tags_to_write.append({
                 'tag_id': tag_id,
                 'data_type': data_type,
                 'value': value,
-                'write_func': write_func
             })
 
     write_dcp_binary(filename + '.dcp', tags_to_write)
 
 
-# === ФУНКЦИИ ЗАПИСИ ДЛЯ КАЖДОГО ТИПА ===
+# === СЕРИАЛИЗАЦИЯ TIFF/DCP ===
+
+TIFF_MAGIC = 42
+
+# Тип TIFF → (dtype одного числа, чисел на значение)
+TIFF_TYPE_FORMATS = {
+    1: ('<u1', 1),  # BYTE
+    2: ('<u1', 1),  # ASCII
+    3: ('<u2', 1),  # SHORT
+    4: ('<u4', 1),  # LONG
+    5: ('<u4', 2),  # RATIONAL
+    7: ('<u1', 1),  # UNDEFINED
+    8: ('<i2', 1),  # SSHORT
+    9: ('<i4', 1),  # SLONG
+    10: ('<i4', 2),  # SRATIONAL
+    11: ('<f4', 1),  # FLOAT
+    12: ('<f8', 1),  # DOUBLE
+}
 
-def write_matrix_srational(f, matrix):
-    """Записывает 3x3 матрицу как 9 SRATIONAL значений"""
-    for value in matrix.flatten():
-        # Конвертируем float в рациональное число
-        numerator = int(value * 1000000)
-        denominator = 1000000
-        f.write(struct.pack('<l', numerator))  # signed int32
-        f.write(struct.pack('<l', denominator))  # signed int32
+RATIONAL_DENOMINATOR = 1000000
 
 
-def write_short(f, value):
-    """Записывает SHORT (2 байта)"""
-    f.write(struct.pack('<H', int(value)))
+def encode_tag_value(data_type, value):
+    """
+    Значение тега → (count, little-endian массив для записи).
+
+    Матрицы и таблицы кодируются целиком одной операцией numpy,
+    RATIONAL/SRATIONAL - как value * 1000000 / 1000000 (с отбрасыванием дробной части).
+    """
+    if data_type == 2:  # ASCII с null-terminator
+        raw = np.frombuffer(value.encode('ascii') + b'\0', dtype=np.uint8)
+        return len(raw), raw
+
+    dtype, per_value = TIFF_TYPE_FORMATS[data_type]
+    values = np.asarray(value).reshape(-1)
 
+    if per_value == 2:
+        pairs = np.empty((len(values), 2), dtype=dtype)
+        pairs[:, 0] = (values.astype(np.float64) * RATIONAL_DENOMINATOR).astype(np.int64)
+        pairs[:, 1] = RATIONAL_DENOMINATOR
+        return len(values), pairs
 
-def write_long(f, value):
-    """Записывает LONG (4 байта)"""
-    f.write(struct.pack('<L', int(value)))
+    return len(values), np.ascontiguousarray(values, dtype=dtype)
 
 
-def write_ascii_string(f, text):
-    """Записывает ASCII строку с null-terminator"""
-    text_bytes = text.encode('ascii') + b'\0'
-    f.write(text_bytes)
-    # Дополняем до четного количества байт
-    if len(text_bytes) % 2 == 1:
-        f.write(b'\0')
+def build_tiff_bytes(ifds, magic=TIFF_MAGIC):
+    """
+    Собирает TIFF/DCP файл целиком в одном заранее выделенном буфере.
+
+    Каждая IFD - список (tag_id, data_type, value); теги сортируются по id,
+    данные длиннее 4 байт идут сразу за своей IFD с выравниванием до слова,
+    IFD связаны в цепочку.
+
+    Returns:
+        bytearray: содержимое файла
+    """
+    encoded = [sorted((tag_id, data_type) + encode_tag_value(data_type, value)
+                      for tag_id, data_type, value in ifd)
+               for ifd in ifds]
+
+    # 1. Раскладка: смещения IFD и внешних данных
+    offset = 8
+    layouts = []
+    for entries in encoded:
+        ifd_offset = offset
+        offset += 2 + len(entries) * 12 + 4
+        data_offsets = []
+        for _, _, _, raw in entries:
+            if raw.nbytes <= 4:
+                data_offsets.append(None)
+            else:
+                data_offsets.append(offset)
+                offset += raw.nbytes + (raw.nbytes & 1)
+        layouts.append((ifd_offset, data_offsets))
+
+    # 2. Заполнение буфера
+    buffer = bytearray(offset)
+    struct.pack_into('<2sHL', buffer, 0, b'II', magic, layouts[0][0] if layouts else 0)
+
+    for i, (entries, (ifd_offset, data_offsets)) in enumerate(zip(encoded, layouts)):
+        struct.pack_into('<H', buffer, ifd_offset, len(entries))
+        position = ifd_offset + 2
+
+        for (tag_id, data_type, count, raw), data_offset in zip(entries, data_offsets):
+            struct.pack_into('<HHL', buffer, position, tag_id, data_type, count)
+            raw_bytes = raw.reshape(-1).view(np.uint8)
+
+            if data_offset is None:
+                # Значение помещается прямо в директорию (выравнивание влево)
+                buffer[position + 8:position + 8 + raw.nbytes] = raw_bytes.tobytes()
+            else:
+                struct.pack_into('<L', buffer, position + 8, data_offset)
+                np.frombuffer(buffer, dtype=np.uint8, count=raw.nbytes, offset=data_offset)[:] = raw_bytes
+            position += 12
+
+        next_ifd = layouts[i + 1][0] if i + 1 < len(layouts) else 0  # 0 = последняя
+        struct.pack_into('<L', buffer, position, next_ifd)
+
+    return buffer
+
+
+def write_tiff_ifds(filename, ifds, magic=TIFF_MAGIC):
+    """Записывает одну или несколько IFD в файл одним вызовом write"""
+    buffer = build_tiff_bytes(ifds, magic)
+    with open(filename, 'wb') as f:
+        f.write(buffer)
+    return len(buffer)
 
 
 def write_dcp_binary(filename, tags_to_write):
     """Записывает бинарный DCP файл с правильным форматированием"""
 
-    with open(filename, 'wb') as f:
-        # TIFF заголовок
-        f.write(b'II')  # Little endian
-        f.write(struct.pack('<H', 42))  # TIFF magic
-        f.write(struct.pack('<L', 8))  # Offset to IFD
-
-        # Вычисляем размеры и смещения
-        ifd_size = 2 + len(tags_to_write) * 12 + 4  # header + tags + next_offset
-        data_offset = 8 + ifd_size
-
-        # IFD заголовок
-        f.write(struct.pack('<H', len(tags_to_write)))
-
-        # === ЗАПИСЫВАЕМ ДИРЕКТОРИИ ТЕГОВ ===
-        current_data_offset = data_offset
-
-        for tag in tags_to_write:
-            f.write(struct.pack('<H', tag['tag_id']))  # Tag ID
-            f.write(struct.pack('<H', tag['data_type']))  # Data type
-
-            # Count зависит от типа данных
-            if tag['data_type'] == 10:  # SRATIONAL matrix
-                count = 9  # 3x3 matrix
-                f.write(struct.pack('<L', count))
-                f.write(struct.pack('<L', current_data_offset))
-                current_data_offset += count * 8  # 9 * (4+4 bytes)
-
-            elif tag['data_type'] == 2:  # ASCII string
-                text_len = len(tag['value'].encode('ascii')) + 1  # +null terminator
-                f.write(struct.pack('<L', text_len))
-                if text_len <= 4:
-                    # Короткая строка помещается прямо в директорию
-                    f.write(tag['value'].encode('ascii').ljust(4, b'\0'))
-                else:
-                    f.write(struct.pack('<L', current_data_offset))
-                    current_data_offset += (text_len + 1) // 2 * 2  # Выравнивание
-
-            else:  # SHORT, LONG
-                f.write(struct.pack('<L', 1))  # Count = 1
-                if tag['data_type'] == 3:  # SHORT
-                    f.write(struct.pack('<H', int(tag['value'])))
-                    f.write(struct.pack('<H', 0))  # Padding
-                else:  # LONG
-                    f.write(struct.pack('<L', int(tag['value'])))
-
-        # Next IFD offset (0 = последняя)
-        f.write(struct.pack('<L', 0))
-
-        # === ЗАПИСЫВАЕМ ДАННЫЕ ТЕГОВ ===
-        for tag in tags_to_write:
-            if tag['data_type'] == 10:  # Матрицы
-                tag['write_func'](f, tag['value'])
-            elif tag['data_type'] == 2 and len(tag['value']) > 3:  # Длинные строки
-                tag['write_func'](f, tag['value'])
+    ifd = [(tag['tag_id'], tag['data_type'], tag['value']) for tag in tags_to_write]
+    write_tiff_ifds(filename, [ifd])
 
     print(f"📁 DCP файл записан: {filename}")
 
 
+# === ЧТЕНИЕ TIFF/DCP ===
+
+DCP_MAGIC = 0x4352  # 'RC' - сигнатура Adobe DCP вместо 42
+
+
+def read_tiff_ifds(filename):
+    """
+    Читает все IFD TIFF/DCP файла через mmap.
+
+    Returns:
+        list: [{tag_id: (data_type, count, numpy массив значений)}, ...]
+    """
+    import mmap
+
+    ifds = []
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if mapped[:2] != b'II':
+            raise ValueError(f"{filename}: only little-endian TIFF/DCP is supported")
+        magic, ifd_offset = struct.unpack_from('<HL', mapped, 2)
+        if magic not in (TIFF_MAGIC, DCP_MAGIC):
+            raise ValueError(f"{filename}: not a TIFF/DCP file (magic {magic})")
+
+        visited = set()
+        while ifd_offset and ifd_offset not in visited:
+            visited.add(ifd_offset)
+            entry_count = struct.unpack_from('<H', mapped, ifd_offset)[0]
+            entries = np.frombuffer(mapped, dtype=[('tag', '<u2'), ('type', '<u2'), ('count', '<u4'), ('value', 'V4')],
+                                    count=entry_count, offset=ifd_offset + 2).copy()
+
+            tags = {}
+            for tag_id, data_type, count, inline in entries.tolist():
+                if data_type not in TIFF_TYPE_FORMATS:
+                    continue  # Неизвестный тип - пропускаем тег
+                dtype, per_value = TIFF_TYPE_FORMATS[data_type]
+                item_count = count * per_value
+                nbytes = item_count * np.dtype(dtype).itemsize
+                if nbytes <= 4:
+                    values = np.frombuffer(inline, dtype=dtype, count=item_count)
+                else:
+                    data_offset = struct.unpack('<L', inline)[0]
+                    # copy - массивы не должны держать mmap после закрытия файла
+                    values = np.frombuffer(mapped, dtype=dtype, count=item_count, offset=data_offset).copy()
+                tags[tag_id] = (data_type, count, values)
+            ifds.append(tags)
+
+            ifd_offset = struct.unpack_from('<L', mapped, ifd_offset + 2 + entry_count * 12)[0]
+
+    return ifds
+
+
+def decode_tag_value(data_type, count, values):
+    """Массив значений тега → значение в формате dcp_data"""
+    if data_type == 2:
+        return values.tobytes().split(b'\0', 1)[0].decode('ascii', errors='replace')
+    if data_type in (5, 10):
+        rationals = values.reshape(-1, 2).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = np.where(rationals[:, 1] != 0, rationals[:, 0] / rationals[:, 1], 0.0)
+        return result.reshape(3, 3) if count == 9 else result
+    if data_type in (1, 3, 4, 8, 9) and count == 1:
+        return int(values[0])
+    if data_type in (1, 3, 4, 8, 9):
+        return tuple(int(v) for v in values)
+    return values
+
+
+def read_dcp_profile(filename):
+    """
+    Загружает DCP профиль в структуру dcp_data (ключи DCP_TAG_MAP).
+
+    Теги без соответствия в DCP_TAG_MAP складываются в 'unknown_tags'.
+    """
+    tag_to_key = {tag_id: key for key, (tag_id, _) in DCP_TAG_MAP.items()}
+
+    ifds = read_tiff_ifds(filename)
+    dcp_data = {key: None for key in DCP_TAG_MAP}
+    dcp_data['unknown_tags'] = {}
+    for tags in ifds[:1]:
+        for tag_id, (data_type, count, values) in tags.items():
+            key = tag_to_key.get(tag_id)
+            if key is None:
+                dcp_data['unknown_tags'][tag_id] = (data_type, values)
+            else:
+                dcp_data[key] = decode_tag_value(data_type, count, values)
+
+    return dcp_data
+
+
+def diff_dcp_profiles(profile_a, profile_b, atol=1e-6):
+    """
+    Поля DCP_TAG_MAP, которые различаются в двух профилях.
+
+    Args:
+        profile_a, profile_b: dcp_data или пути к .dcp
+        atol: допуск для матриц и таблиц (SRATIONAL хранит 6 знаков)
+
+    Returns:
+        list: ключи dcp_data с различиями
+    """
+    if isinstance(profile_a, str):
+        profile_a = read_dcp_profile(profile_a)
+    if isinstance(profile_b, str):
+        profile_b = read_dcp_profile(profile_b)
+
+    changed = []
+    for key in DCP_TAG_MAP:
+        a, b = profile_a.get(key), profile_b.get(key)
+        if a is None or b is None:
+            if (a is None) != (b is None):
+                changed.append(key)
+        elif isinstance(a, str) or isinstance(b, str):
+            if a != b:
+                changed.append(key)
+        elif np.shape(a) != np.shape(b) or not np.allclose(np.asarray(a, dtype=np.float64),
+                                                           np.asarray(b, dtype=np.float64), atol=atol):
+            changed.append(key)
+    return changed
+
+
+# Компоненты, которые можно взять из готового профиля вместо пересчета
+DCP_REUSABLE_COMPONENTS = {
+    'matrices_1': ('color_matrix_1', 'forward_matrix_1', 'illuminant_1'),
+    'matrices_2': ('color_matrix_2', 'forward_matrix_2', 'illuminant_2'),
+    'hue_sat': ('hue_sat_map_dims', 'hue_sat_deltas_1', 'hue_sat_deltas_2'),
+    'look_table': ('look_table_dims', 'look_table'),
+}
+
+
+def reusable_profile_fields(base_profile, keep):
+    """
+    Поля готового профиля для компонентов keep (только присутствующие в нем).
+
+    Args:
+        base_profile: путь к .dcp, dcp_data или None
+        keep: имена из DCP_REUSABLE_COMPONENTS
+    """
+    if base_profile is None or not keep:
+        return {}
+    if isinstance(base_profile, str):
+        base_profile = read_dcp_profile(base_profile)
+
+    fields = {}
+    for component in keep:
+        if component not in DCP_REUSABLE_COMPONENTS:
+            raise ValueError(f"Unknown DCP component: {component}")
+        for key in DCP_REUSABLE_COMPONENTS[component]:
+            if base_profile.get(key) is not None:
+                fields[key] = base_profile[key]
+    return fields
+
+
 def save_dcp_as_json(dcp_data, filename):
     """JSON только для отладки и анализа!"""
 
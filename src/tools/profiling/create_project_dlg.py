@@ -3,13 +3,13 @@
 # "22.59403 22.59403 22.59403" | xicclu -ir -pl -s255 your_profile.icc
 # xyz_to_lab(X, Y, Z, wp='D50')
 # xicclu -v0 -ir -pl -s255 FOMEI_Baryta_MONO_290_PIXMA_G540_PPPL_HQ_RB4.icm  < rgb_ref.txt
-import time
 import os
 import shutil
 import re
 import glob
 import datetime
-from typing import Dict, Optional, Tuple
+import tempfile
+from typing import Dict, List, Optional, Tuple
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                              QComboBox, QTextEdit, QPushButton, QFileDialog,
                              QMessageBox, QApplication, QCheckBox)
@@ -298,9 +298,8 @@ class NewProjectDialog(QDialog):
 
     def wait_for_process(self):
         """Wait for process completion without blocking UI."""
-        while self.process_manager.is_running():
-            QApplication.processEvents()  # Обновляем UI
-            time.sleep(0.15)  # 50ms пауза
+        # Локальный event loop до завершения задач - UI работает, без опроса
+        self.process_manager.wait()
 
     def keyPressEvent(self, event):
         """Handle key press events."""
@@ -631,88 +630,141 @@ class NewProjectDialog(QDialog):
                              self.tr("Targen error: {}").format(error))
 
     def run_printtarg(self):
-        """Run printtarg optimization loop."""
+        """
+        Run printtarg layout optimisation: seeds 1..MAX_GENERATIONS, several at a time.
+
+        printtarg writes the same file names for every seed, so each seed runs in its own
+        temporary directory with a copy of the .ti1. The best layout by _calculate_score is
+        kept; the first layout meeting the criteria stops the search. Files of the winning
+        seed are moved into the project directory, no re-run is needed.
+        """
         self.is_process_ok = False
         self.template_name = self.ui.template_combo.currentText()
         self.template = TEMPLATES.get(self.template_name, TEMPLATES["User"])
         self.criteria = self.template["criteria"]
         printtarg_args = self.ui.printtarg_edit.text().strip().split()
         printtarg_path = os.path.join(self.argyll_path, "printtarg")
-        print(f"Starting printtarg optimization (max {MAX_GENERATIONS} attempts)")
+        parallel = self.process_manager.scheduler.max_workers
+        print(f"Starting printtarg optimization (max {MAX_GENERATIONS} attempts, {parallel} in parallel)")
         print(f"Criteria: {self.criteria}")
 
         self.best_result = None
         self.best_score = float('inf')
+        self.current_attempt = 0
+        self._printtarg_stop = False
+        self._printtarg_failed = False
 
-        for self.current_attempt in range(1, MAX_GENERATIONS + 1):
+        ti1_file = f"{self.project_name}.ti1"
+        work_dir = tempfile.mkdtemp(prefix="printtarg_", dir=".")
 
+        def launch_next():
+            if self._printtarg_stop or self.current_attempt >= MAX_GENERATIONS:
+                return
+            self.current_attempt += 1
             seed = self.current_attempt
-            print(f"Generation {self.current_attempt} of {MAX_GENERATIONS}...")
-            self.printtarg_command = [printtarg_path] + printtarg_args + ["-R", str(seed), self.project_name]
+            seed_dir = os.path.join(work_dir, f"seed_{seed:02d}")
+            os.makedirs(seed_dir)
+            shutil.copy2(ti1_file, seed_dir)
+
+            command = [printtarg_path] + printtarg_args + ["-R", str(seed), self.project_name]
+            print(f"Generation {seed} of {MAX_GENERATIONS}...")
+
+            def on_success(return_code, stdout, stderr):
+                self.on_printtarg_success(return_code, stdout, stderr, seed, seed_dir, command)
+                launch_next()
+
+            def on_error(error):
+                self.on_printtarg_error(error, seed)
 
-            self.is_process_ok = False              # assuming failure
             self.process_manager.execute_command(
-                cmd=self.printtarg_command,
-                message=self.tr("Optimizing layout ({}/{})...").format(self.current_attempt, MAX_GENERATIONS),
+                cmd=command,
+                message=self.tr("Optimizing layout ({}/{})...").format(seed, MAX_GENERATIONS),
                 timeout=300,
-                on_success=self.on_printtarg_success,
-                on_error=self.on_printtarg_error
+                on_success=on_success,
+                on_error=on_error,
+                cwd=seed_dir
             )
-            self.wait_for_process()
 
-            if not self.is_process_ok:
-                print(f"Attempt {self.current_attempt}: targen failed")
-                return
+        try:
+            for _ in range(parallel):
+                launch_next()
+            self.wait_for_process()
 
-            if self.best_result["meets_criteria"]:
-                metrics = self.best_result["metrics"]
-                print(f"Attempt {self.current_attempt}: MEETS CRITERIA!")
-                print(f"  Metrics: worst_delta={metrics['worst_delta']:.3f}, direction_delta={metrics['direction_delta']:.3f}")
+            if self._printtarg_failed or not self.best_result:
                 return
 
-        seed = self.current_attempt
-        self.printtarg_command = [printtarg_path] + printtarg_args + ["-R", str(seed), self.project_name]
-
-        self.process_manager.execute_command(
-            cmd=self.printtarg_command,
-            message=self.tr("Optimizing layout ({}/{})...").format(self.current_attempt, MAX_GENERATIONS),
-            timeout=300,
-            on_success=self.on_printtarg_success,
-            on_error=self.on_printtarg_error
-        )
-        self.wait_for_process()
-        return
-
-    def on_printtarg_success(self, return_code: int, stdout: str, stderr: str):
+            self._promote_printtarg_result(self.best_result)
+            metrics = self.best_result["metrics"]
+            print(f"Selected seed {self.best_result['seed']}"
+                  f"{' (MEETS CRITERIA)' if self.best_result['meets_criteria'] else ''}: "
+                  f"worst_delta={metrics['worst_delta']:.3f}, direction_delta={metrics['direction_delta']:.3f}")
+            self.is_process_ok = True
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _stop_printtarg(self):
+        """Stop seed search: no new seeds, running ones are cancelled."""
+        self._printtarg_stop = True
+        self.process_manager.cancel()
+
+    def _promote_printtarg_result(self, result: Dict):
+        """Move files produced by the winning seed into the project directory."""
+        ti1_name = f"{self.project_name}.ti1"
+        for name in os.listdir(result["dir"]):
+            if name == ti1_name:
+                continue
+            shutil.move(os.path.join(result["dir"], name), name)
+        self.printtarg_command = result["command"]
+
+    def on_printtarg_success(self, return_code: int, stdout: str, stderr: str,
+                             seed: int, seed_dir: str, command: List[str]):
         """Handle printtarg attempt completion."""
+        if self._printtarg_stop:
+            return
+
         # Check if ti2 file was created
         ti2_file = f"{self.project_name}.ti2"
-        if not os.path.exists(ti2_file):
-            print(f"Attempt {self.current_attempt}: ti2 file not created")
+        if not os.path.exists(os.path.join(seed_dir, ti2_file)):
+            print(f"Attempt {seed}: ti2 file not created")
+            self._printtarg_failed = True
+            self._stop_printtarg()
             return
 
         # Parse metrics from output
         metrics = self.parse_printtarg_output(stdout)
         if not metrics:
-            print(f"Attempt {self.current_attempt}: failed to parse metrics")
+            print(f"Attempt {seed}: failed to parse metrics")
+            self._printtarg_failed = True
+            self._stop_printtarg()
             return
 
         result = {
                 "ti2": ti2_file,
-                "seed": self.current_attempt,
+                "seed": seed,
                 "metrics": metrics,
                 "meets_criteria": self._meets_criteria(metrics),
-                "score": self._calculate_score(metrics)
+                "score": self._calculate_score(metrics),
+                "dir": seed_dir,
+                "command": command
             }
 
         # Update best result if this is better
         if not self.best_result or result["score"] < self.best_result["score"]:
             self.best_result = result
-        self.is_process_ok = True
+            self.best_score = result["score"]
 
-    def on_printtarg_error(self, error: str):
+        if result["meets_criteria"]:
+            print(f"Attempt {seed}: MEETS CRITERIA!")
+            self.best_result = result
+            self._stop_printtarg()
+
+    def on_printtarg_error(self, error: str, seed: int):
         """Handle printtarg error."""
-        print(f"Attempt {self.current_attempt}: {error}")
+        if self._printtarg_stop:
+            return
+        print(f"Attempt {seed}: {error}")
+        self._printtarg_failed = True
+        self._stop_printtarg()
 
     def parse_printtarg_output(self, output: str) -> Optional[Dict]:
         """Parse printtarg output for metrics."""
@@ -1,3 +1,9 @@
+import os
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from const import GENERIC_ERROR, GENERIC_OK, IMAGE_ROTATED_270
 
@@ -5,6 +11,11 @@ LABEL_PT = 16
 WARNING_PT = 18
 MARKER_PT = 22
 
+PREVIEW_DPI = 96
+PREVIEW_VERSION = 1                         # bump when the preview rendering changes
+PREVIEW_TAG = "flab-DIY-stack preview:"     # ImageDescription prefix carrying the cache key
+TIFF_TAG_IMAGE_DESCRIPTION = 270
+
 def tr(text):
     """Auto-translation function placeholder"""
     # This would be replaced with actual translation logic
@@ -16,7 +27,7 @@ def em_height(size_pt, dpi):
     """
     return int((size_pt * dpi[1] ) // 72 )
 
-def create_color_target_tiff(cht_data, file_name, label, dpi=(72, 72)):
+def create_color_target_tiff(cht_data, file_name, label, dpi=(72, 72), description=None):
     """
     Create colour target TIFF file based on original cht values.
 
@@ -25,6 +36,7 @@ def create_color_target_tiff(cht_data, file_name, label, dpi=(72, 72)):
         file_name: string - full path with filename and extension
         label: string - target name for bottom label
         dpi: tuple (dpi_x, dpi_y) - default (72, 72)
+        description: string - optional TIFF ImageDescription (preview cache key)
     """
     patch_dict = cht_data['patch_dict']
     corner_ref = cht_data['corner_ref']
@@ -43,25 +55,29 @@ def create_color_target_tiff(cht_data, file_name, label, dpi=(72, 72)):
     width_pixels = int(bbox['width'] * scale_factor)
     height_pixels = int(bbox['height'] * scale_factor + em_height(text_space_points, dpi))
 
-    # Create image
-    image = Image.new('RGB', (width_pixels, height_pixels), color='white')
-    # image = Image.new('RGB', (3000, 1500), color='white')
+    # Patches are filled straight into the pixel array, text goes through ImageDraw
+    pixels = np.full((height_pixels, width_pixels, 3), 255, dtype=np.uint8)
+    missing = _fill_target_patches(pixels, patch_dict, scale_factor)
+
+    image = Image.fromarray(pixels, 'RGB')
     draw = ImageDraw.Draw(image)
 
     # Draw functional blocks with proper offsets
-    _draw_target_patches(draw, patch_dict, scale_factor, dpi)
+    _draw_missing_patches(draw, missing, dpi)
     _draw_patch_labels(draw, patch_dict, range_names, scale_factor, dpi)
     _draw_info_text(draw, label, width_pixels, height_pixels, dpi, text_space_points)
 
     # Save with correct DPI in header
+    save_options = {'description': description} if description else {}
     image.save(file_name,
                format='TIFF',
                dpi=dpi,
-               compression='lzw')
+               compression='lzw',
+               **save_options)
 
     print(f"Demo target {width_pixels}x{height_pixels}  {dpi[0]}x{dpi[1]}dpi  saved: {file_name}")
 
-def resize_tiff_to_96dpi(input_path, output_path=None, auto_rotate = False) -> int :
+def resize_tiff_to_96dpi(input_path, output_path=None, auto_rotate = False, description=None) -> int :
     """
     Resizes TIFF file DPI to 96 if current DPI is greater than 96
 
@@ -69,7 +85,9 @@ def resize_tiff_to_96dpi(input_path, output_path=None, auto_rotate = False) -> i
         auto_rotate: rotate image (reserved for future use)
         input_path: path to the source TIFF file
         output_path: path for saving (if None, overwrites the original)
+        description: optional TIFF ImageDescription (preview cache key)
     """
+    save_options = {'description': description} if description else {}
     try:
         with Image.open(input_path) as img:
             # Get current DPI
@@ -100,12 +118,12 @@ def resize_tiff_to_96dpi(input_path, output_path=None, auto_rotate = False) -> i
                 # rotated_image = resized_img.transpose(Image.Transpose.ROTATE_270)  # No loss rotation
                 # IMAGE_ROTATED_270
 
-                resized_img.save(save_path, dpi=(96, 96))
+                resized_img.save(save_path, dpi=(96, 96), **save_options)
 
             else:
                 # If need to save to different location
                 if output_path and output_path != input_path:
-                    img.save(output_path)
+                    img.save(output_path, **save_options)
 
         return GENERIC_OK
     except Exception as e:
@@ -147,48 +165,56 @@ def _calculate_bounding_box(points):
         'height': max(all_y) + min(all_y)   # height with white spaces
     }
 
-def _draw_target_patches(draw, patch_dict, scale_factor, dpi):
+def _fill_target_patches(pixels, patch_dict, scale_factor):
     """
-    Draw target patches on the image.
+    Fill target patches into an RGB pixel array.
 
     Args:
-        draw: PIL ImageDraw object
+        pixels: np.ndarray (H, W, 3) uint8 - image to fill in place
         patch_dict: Dictionary with patch data
         scale_factor: Scale factor for pixel conversion
+
+    Returns:
+        list: [x1, y1, x2, y2] rectangles of patches without expected colour
     """
-    for patch_name, patch_data in patch_dict.items():
-        # Get center coordinates and dimensions
-        center_x, center_y = patch_data['patch_xy']
-        width, height = patch_data['patch_wh']
+    if not patch_dict:
+        return []
 
-        # Convert to pixels with offset
-        center_x_px = int((center_x) * scale_factor)
-        center_y_px = int((center_y) * scale_factor)
-        width_px = int(width * scale_factor)
-        height_px = int(height * scale_factor)
-
-        # Calculate rectangle coordinates (from center)
-        x1 = center_x_px - width_px // 2
-        y1 = center_y_px - height_px // 2
-        x2 = center_x_px + width_px // 2
-        y2 = center_y_px + height_px // 2
-
-        cross = False
-        # Extract color from packed RGB
-        if patch_data['xyz']['X'] == -1:
-            color = (255, 255, 255)  # white
-            draw.rectangle([x1, y1, x2, y2], fill=color, outline=color)
-            color = (255, 0, 0)  # white
-            draw.line([x1, y1, x2, y2], fill=color, width=em_height(6,dpi))
-            draw.line([x1, y2, x2, y1], fill=color, width=em_height(6,dpi))
-
-        else:
-            rgb_packed = patch_data['rgb']
-            r = (rgb_packed >> 16) & 0xFF
-            g = (rgb_packed >> 8) & 0xFF
-            b = rgb_packed & 0xFF
-            color = (r, g, b)
-            draw.rectangle([x1, y1, x2, y2], fill=color, outline=color)
+    patches = list(patch_dict.values())
+    centers = np.array([p['patch_xy'] for p in patches], dtype=np.float32)
+    sizes = np.array([p['patch_wh'] for p in patches], dtype=np.float64)
+    missing = np.array([p['xyz']['X'] == -1 for p in patches])
+    rgb_packed = np.array([p['rgb'] for p in patches], dtype=np.uint32)
+
+    # Convert to pixels, rectangle from center (inclusive, as ImageDraw.rectangle)
+    center_px = (centers * scale_factor).astype(np.int64)
+    half_px = (sizes * scale_factor).astype(np.int64) // 2
+    rects = np.hstack([center_px - half_px, center_px + half_px + 1])
+    np.clip(rects, 0, None, out=rects)
+
+    # Extract color from packed RGB, patches without colour stay white
+    colors = np.stack([(rgb_packed >> 16) & 0xFF, (rgb_packed >> 8) & 0xFF, rgb_packed & 0xFF], axis=1)
+    colors[missing] = 255
+    colors = colors.astype(np.uint8)
+
+    for (x1, y1, x2, y2), color in zip(rects.tolist(), colors):
+        pixels[y1:y2, x1:x2] = color
+
+    return (rects[missing] - [0, 0, 1, 1]).tolist()
+
+def _draw_missing_patches(draw, rects, dpi):
+    """
+    Cross out patches that have no expected colour.
+
+    Args:
+        draw: PIL ImageDraw object
+        rects: list of [x1, y1, x2, y2] rectangles
+        dpi: DPI tuple (dpi_x, dpi_y)
+    """
+    color = (255, 0, 0)  # red
+    for x1, y1, x2, y2 in rects:
+        draw.line([x1, y1, x2, y2], fill=color, width=em_height(6,dpi))
+        draw.line([x1, y2, x2, y1], fill=color, width=em_height(6,dpi))
 
 def _draw_patch_labels(draw, patch_dict, range_names, scale_factor, dpi):
     """
@@ -276,6 +302,133 @@ def _draw_info_text(draw, label, width_pixels, height_pixels, dpi, text_space_po
         current_y += line_heigh * 1.5
 
 
+def image_physical_size(img):
+    """
+    Physical size of an opened PIL image.
+
+    :return:
+        {'width_px', 'height_px', 'dpi_x', 'dpi_y', 'width_mm', 'height_mm'}
+    """
+    width_px, height_px = img.size
+
+    # Try to extract DPI (dots per inch)
+    dpi = img.info.get('dpi', (300, 300))  # default 300 DPI
+    dpi_x, dpi_y = dpi
+
+    # Convert pixels to mm: 1 inch = 25.4 mm
+    width_mm = width_px / dpi_x * 25.4
+    height_mm = height_px / dpi_y * 25.4
+
+    return {
+        "width_px": width_px,
+        "height_px": height_px,
+        "dpi_x": dpi_x,
+        "dpi_y": dpi_y,
+        "width_mm": width_mm,
+        "height_mm": height_mm
+    }
+
+# Source file digests: path -> (mtime_ns, size, sha1)
+_digest_cache = {}
+
+def _file_digest(path):
+    """SHA1 of a file, memoised by modification time and size."""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    cached = _digest_cache.get(key)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+    _digest_cache[key] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+def _read_preview_header(preview_file):
+    """
+    Read cache key and physical size of an existing preview.
+
+    Returns:
+        tuple: (key or None, size dict) or (None, None) if the preview can not be opened
+    """
+    try:
+        with Image.open(preview_file) as img:
+            tags = getattr(img, 'tag_v2', {})
+            description = tags.get(TIFF_TAG_IMAGE_DESCRIPTION, '')
+            key = description[len(PREVIEW_TAG):] if description.startswith(PREVIEW_TAG) else None
+            return key, image_physical_size(img)
+    except (OSError, ValueError):
+        return None, None
+
+def build_target_preview(cht_file, cht_data, preview_file) -> tuple[int, dict]:
+    """
+    Create the preview TIFF for a chart unless an up-to-date one already exists.
+
+    The preview is a 96 dpi copy of the printtarg TIFF next to the cht file or,
+    without it, a rendering of cht_data. It is reused when the source file hash
+    and preview parameters match the key stored in its ImageDescription.
+
+    Args:
+        cht_file: path to the cht file
+        cht_data: parsed cht data (see read_cht.parse_cht_file)
+        preview_file: path of the preview TIFF
+
+    Returns:
+        tuple: (GENERIC_OK, physical size dict) or (GENERIC_ERROR, {})
+    """
+    from TargetsManager import get_tif_file
+
+    cht_path = Path(cht_file)
+    spare_tif_file = get_tif_file(cht_file)
+    if spare_tif_file is not None:
+        source, params = spare_tif_file, f"resize:{PREVIEW_DPI}"
+    else:
+        source, params = cht_path, f"cht:72:{cht_path.stem}"
+
+    try:
+        key = f"{_file_digest(source)}:{params}:v{PREVIEW_VERSION}"
+    except OSError as e:
+        print(tr("Error processing {}: {}").format(source, e))
+        return GENERIC_ERROR, {}
+
+    cached_key, size = _read_preview_header(preview_file)
+    if cached_key == key:
+        return GENERIC_OK, size
+
+    description = PREVIEW_TAG + key
+    if source is spare_tif_file:
+        if resize_tiff_to_96dpi(spare_tif_file, preview_file, description=description) != GENERIC_OK:
+            return GENERIC_ERROR, {}
+    else:
+        create_color_target_tiff(cht_data, preview_file, cht_path.stem, description=description)
+
+    _, size = _read_preview_header(preview_file)
+    if size is None:
+        return GENERIC_ERROR, {}
+    return GENERIC_OK, size
+
+def build_target_previews(jobs, max_workers=None) -> list[tuple[int, dict]]:
+    """
+    Build several chart previews concurrently.
+
+    Args:
+        jobs: list of (cht_file, cht_data, preview_file)
+        max_workers: thread pool size, None for the executor default
+
+    Returns:
+        list: build_target_preview() results in the order of jobs
+    """
+    if len(jobs) < 2:
+        return [build_target_preview(*job) for job in jobs]
+
+    # PIL resize/encode and the numpy fill release the GIL
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda job: build_target_preview(*job), jobs))
+
+
 # Usage
 if __name__ == "__main__":
     # Example
@@ -0,0 +1,195 @@
+import os
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+# Размеры решетки, которые понимают Resolve / Premiere / ffmpeg
+CUBE_SIZES = (17, 33, 65)
+DEFAULT_CUBE_SIZE = 33
+
+# XYZ (D50, PCS) → линейный sRGB, Bradford адаптация D50 → D65
+XYZ_D50_TO_SRGB = np.array([
+    [3.1338561, -1.6168667, -0.4906146],
+    [-0.9787684, 1.9161415, 0.0334540],
+    [0.0719453, -0.2289914, 1.4052427]
+])
+
+# Bradford (XYZ → колбочковые отклики) и белая точка D50 (ICC PCS)
+BRADFORD = np.array([
+    [0.8951, 0.2664, -0.1614],
+    [-0.7502, 1.7135, 0.0367],
+    [0.0389, -0.0685, 1.0296]
+])
+D50_WHITE = np.array([0.9642, 1.0, 0.8249])
+
+Transform = Callable[[np.ndarray], np.ndarray]
+
+
+def cube_lattice(size: int) -> np.ndarray:
+    """
+    Узлы решетки .cube: (size^3, 3) RGB 0..1, красный меняется быстрее всех.
+    """
+    axis = np.linspace(0.0, 1.0, size)
+    blue, green, red = np.meshgrid(axis, axis, axis, indexing='ij')
+    return np.column_stack([red.ravel(), green.ravel(), blue.ravel()])
+
+
+def srgb_encode(linear: np.ndarray) -> np.ndarray:
+    """Линейный sRGB → sRGB с кривой IEC 61966-2-1, с обрезкой 0..1."""
+    linear = np.clip(linear, 0.0, 1.0)
+    return np.where(linear <= 0.0031308, 12.92 * linear, 1.055 * np.power(linear, 1 / 2.4) - 0.055)
+
+
+def xyz_to_srgb(xyz: np.ndarray) -> np.ndarray:
+    """XYZ D50 (Y белого = 1) → sRGB 0..1."""
+    return srgb_encode(xyz @ XYZ_D50_TO_SRGB.T)
+
+
+def icc_cube_transform(profile_file: str, output_profile: Optional[str] = None,
+                       intent: str = 'r', output_intent: str = 'r') -> Transform:
+    """
+    Преобразование RGB профиля в sRGB для запекания: device → PCS по icc_calcs.
+
+    Args:
+        profile_file: RGB ICC профиль (A2B или matrix/TRC)
+        output_profile: matrix/TRC профиль вывода; None - встроенный sRGB
+        intent: intent входного профиля (xicclu -i)
+        output_intent: 'a' - absolute по белой точке выходного профиля
+
+    Raises:
+        IccProfileError: профиль не поддерживается
+    """
+    from icc_calcs import IccProfileError, load_icc_profile
+
+    source = load_icc_profile(profile_file)
+    if source.colour_space != 'RGB':
+        raise IccProfileError(f"Profile colour space {source.colour_space} is not RGB")
+    target = load_icc_profile(output_profile) if output_profile else None
+
+    def transform(rgb):
+        xyz = source.evaluate(rgb, intent, pcs='xyz') / 100.0
+        if target is None:
+            return xyz_to_srgb(xyz)
+        return target.pcs_to_device(xyz, output_intent)
+
+    return transform
+
+
+def _camera_to_xyz_matrix(dcp_data: Dict[str, Any]) -> np.ndarray:
+    """
+    Камера (баланс белого, нейтраль = 1, 1, 1) → XYZ D50 по определениям DNG.
+
+    ForwardMatrix1 используется как есть. ColorMatrix1 (XYZ → камера) обращается,
+    белая точка калибровки приводится к D50 по Bradford.
+    """
+    forward_matrix = dcp_data.get('forward_matrix_1')
+    if forward_matrix is not None:
+        return np.asarray(forward_matrix, dtype=np.float64).reshape(3, 3)
+
+    color_matrix = dcp_data.get('color_matrix_1')
+    if color_matrix is None:
+        raise ValueError("DCP data has neither ForwardMatrix1 nor ColorMatrix1")
+
+    camera_to_xyz = np.linalg.inv(np.asarray(color_matrix, dtype=np.float64).reshape(3, 3))
+    white = camera_to_xyz @ np.ones(3)
+    if white[1] <= 0:
+        raise ValueError("ColorMatrix1 maps camera neutral to non-positive Y")
+    camera_to_xyz /= white[1]
+    white /= white[1]
+
+    cone_ratio = (BRADFORD @ D50_WHITE) / (BRADFORD @ white)
+    adaptation = np.linalg.inv(BRADFORD) @ np.diag(cone_ratio) @ BRADFORD
+    return adaptation @ camera_to_xyz
+
+
+def dcp_cube_transform(dcp_data: Dict[str, Any]) -> Transform:
+    """
+    Преобразование RGB камеры в sRGB по DCP (read_dcp_profile / build_dcp_profile).
+
+    Конвейер DNG: камера → XYZ D50 (_camera_to_xyz_matrix) → линейный ProPhoto →
+    ProfileHueSatMap (HueSatDeltas1) → LookTable → XYZ → sRGB. Тоновая кривая и
+    экспозиция профиля не применяются, ось V таблиц - линейное кодирование.
+
+    Raises:
+        ValueError: нет матриц или таблица не совпадает с размерами
+    """
+    from hue_sat_calcs import DCP_WORKING_MATRIX, apply_hue_sat_map
+
+    camera_to_working = DCP_WORKING_MATRIX @ _camera_to_xyz_matrix(dcp_data)
+    working_to_xyz = np.linalg.inv(DCP_WORKING_MATRIX)
+
+    tables = []
+    for data_key, dims_key in (('hue_sat_deltas_1', 'hue_sat_map_dims'), ('look_table', 'look_table_dims')):
+        data, dims = dcp_data.get(data_key), dcp_data.get(dims_key)
+        if data is None or dims is None:
+            continue
+        dims = tuple(max(int(d), 1) for d in np.ravel(dims))
+        if len(dims) != 3 or np.size(data) != int(np.prod(dims)) * 3:
+            raise ValueError(f"{data_key} has {np.size(data)} values, dims {dims}")
+        tables.append((data, dims))
+
+    def transform(rgb):
+        working = rgb @ camera_to_working.T
+        for data, dims in tables:
+            working = apply_hue_sat_map(working, data, dims)
+        return xyz_to_srgb(working @ working_to_xyz.T)
+
+    return transform
+
+
+def bake_cube(transform: Transform, size: int = DEFAULT_CUBE_SIZE) -> np.ndarray:
+    """
+    Вычислить преобразование на решетке size^3 одним векторным вызовом.
+
+    Returns:
+        (size^3, 3) float64 в порядке .cube
+    """
+    if size < 2:
+        raise ValueError(f"LUT size must be at least 2, got {size}")
+    return np.clip(transform(cube_lattice(size)), 0.0, 1.0)
+
+
+def write_cube_lut(filename: str, table: np.ndarray, title: str = "", precision: int = 6):
+    """
+    Записать 3D LUT в формате .cube (Adobe/Resolve) одной буферизованной записью.
+
+    Args:
+        filename: путь к файлу
+        table: (size^3, 3) значения 0..1, красный меняется быстрее всех
+        title: TITLE заголовка (по умолчанию - имя файла)
+        precision: знаков после запятой
+    """
+    table = np.asarray(table, dtype=np.float64).reshape(-1, 3)
+    size = round(len(table) ** (1.0 / 3.0))
+    if size ** 3 != len(table):
+        raise ValueError(f"LUT has {len(table)} entries, not a cube")
+
+    title = title or os.path.splitext(os.path.basename(filename))[0]
+    header = (f'TITLE "{title}"\n'
+              f'LUT_3D_SIZE {size}\n'
+              f'DOMAIN_MIN 0.0 0.0 0.0\n'
+              f'DOMAIN_MAX 1.0 1.0 1.0\n')
+    row = f'%.{precision}f %.{precision}f %.{precision}f\n'
+    body = (row * len(table)) % tuple(table.ravel().tolist())
+
+    with open(filename, 'w', encoding='ascii', newline='\n') as f:
+        f.write(header + body)
+
+
+def create_cube_lut(filename: str, transform: Transform, size: int = DEFAULT_CUBE_SIZE,
+                    title: str = "") -> np.ndarray:
+    """
+    Запечь преобразование в .cube файл.
+
+    Args:
+        filename: путь к .cube
+        transform: (N, 3) RGB 0..1 → (N, 3) RGB 0..1 (icc_cube_transform, dcp_cube_transform)
+        size: узлов на ось (17, 33, 65)
+        title: TITLE заголовка
+
+    Returns:
+        запеченная таблица (size^3, 3)
+    """
+    table = bake_cube(transform, size)
+    write_cube_lut(filename, table, title)
+    return table
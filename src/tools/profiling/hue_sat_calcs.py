@@ -5,6 +5,15 @@ from typing import Dict, List, Tuple, Union, Optional, Any
 GENERIC_ERROR = -1
 GENERIC_OK = 0
 
+# Рабочее пространство DCP таблиц: XYZ → ProPhoto RGB (D50), гамма 2.2
+DCP_WORKING_MATRIX = np.array([
+    [1.3460, -0.2556, -0.0511],
+    [-0.5446, 1.5082, 0.0205],
+    [0.0000, 0.0000, 1.2123]
+])
+DCP_WORKING_GAMMA = 2.2
+
+
 def select_table_configuration(is_color: bool, is_negative: bool, patches_count: int) :
     """
     Выбирает конфигурацию таблицы согласно ВАШИМ требованиям.
@@ -181,89 +190,46 @@ def create_empty_hue_sat_table(config: Dict[str, Union[int, str]]) -> Dict[str,
     }
 
 
-def populate_hue_sat_table(empty_table: Dict[str, Any], measured_patches: List[Dict]) -> Dict[str, Any]:
+def populate_hue_sat_table(empty_table: Dict[str, Any], measured_patches: List[Dict],
+                           conflict: str = 'first',
+                           cell_mapping: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Dict[str, Any]:
     """
     Заполняет HSV таблицу для DCP профиля.
 
     DCP логика: измеренные RGB камеры → эталонные XYZ → дельты коррекции
     НЕ зависит от целевого устройства вывода!
 
+    Все патчи обрабатываются одним батчем (N, 3).
+
     Args:
         empty_table: Результат create_empty_hue_sat_table()
         measured_patches: [{'RGB': [r,g,b], 'XYZ': [x,y,z]}, ...]
             где RGB = RAW→RGB конвертация камеры
             где XYZ = колориметрически измеренные эталоны
+        conflict: несколько патчей в одной ячейке:
+            'first' - первый патч (по порядку) занимает ячейку
+            'mean'  - дельты патчей ячейки усредняются
+        cell_mapping: готовый результат map_patches_to_cells() для RGB этих патчей
+            (см. HueSatTablePlan) - привязка к ячейкам не пересчитывается
     """
-    import colorsys
-
-    # Извлекаем координатные сетки
-    hue_coords = empty_table['coordinate_map']['hue_coords']
-    sat_coords = empty_table['coordinate_map']['sat_coords']
-    val_coords = empty_table['coordinate_map']['val_coords']
+    if conflict not in ('first', 'mean'):
+        raise ValueError(f"Unknown conflict mode: {conflict}")
 
-    # Работаем с существующими массивами
-    hue_deltas = empty_table['hue_deltas']
-    sat_deltas = empty_table['sat_deltas']
-    val_deltas = empty_table['val_deltas']
     filled_mask = empty_table['filled_mask']
 
     mapped_patches = 0
 
-    for patch in measured_patches:
-        # 🎯 1. RGB КАМЕРЫ (что получилось после матрицы камеры)
-        camera_rgb = np.array(patch['RGB'])
-
-        # 🎯 2. ЭТАЛОННЫЕ XYZ (колориметрически измеренные)
-        reference_xyz = np.array(patch['XYZ'])
-
-        # 🎯 3. Camera RGB → HSV (для индексации в таблице)
-        camera_rgb_norm = camera_rgb / 255.0 if np.max(camera_rgb) > 1.0 else camera_rgb
-        camera_rgb_norm = np.clip(camera_rgb_norm, 0, 1)  # Безопасность
-
-        camera_hsv_raw = colorsys.rgb_to_hsv(camera_rgb_norm[0], camera_rgb_norm[1], camera_rgb_norm[2])
-        camera_hsv = np.array([
-            camera_hsv_raw[0] * 360.0,  # H: 0-360°
-            camera_hsv_raw[1],  # S: 0-1
-            camera_hsv_raw[2]  # V: 0-1
-        ])
-
-        # 🎯 4. Reference XYZ → "правильный" RGB
-        # Для DCP используем СТАНДАРТНОЕ рабочее пространство (обычно ProPhoto/sRGB)
-        reference_rgb = xyz_to_camera_rgb(reference_xyz)
-        reference_rgb_norm = reference_rgb / 255.0 if np.max(reference_rgb) > 1.0 else reference_rgb
-        reference_rgb_norm = np.clip(reference_rgb_norm, 0, 1)
-
-        # 🎯 5. Reference RGB → HSV (целевые значения)
-        reference_hsv_raw = colorsys.rgb_to_hsv(reference_rgb_norm[0], reference_rgb_norm[1], reference_rgb_norm[2])
-        reference_hsv = np.array([
-            reference_hsv_raw[0] * 360.0,
-            reference_hsv_raw[1],
-            reference_hsv_raw[2]
-        ])
-
-        # 🎯 6. Индексация по HSV КАМЕРЫ (не эталона!)
-        h_idx = np.argmin(np.abs(hue_coords - camera_hsv[0]))
-        s_idx = np.argmin(np.abs(sat_coords - camera_hsv[1]))
-        v_idx = np.argmin(np.abs(val_coords - camera_hsv[2]))
-
-        # 🎯 7. Дельты коррекции = (эталон - камера)
-        delta_h = reference_hsv[0] - camera_hsv[0]
-        delta_s = reference_hsv[1] - camera_hsv[1]
-        delta_v = reference_hsv[2] - camera_hsv[2]
-
-        # Обработка циклического Hue
-        if delta_h > 180:
-            delta_h -= 360
-        elif delta_h < -180:
-            delta_h += 360
-
-        # 🎯 8. Записываем коррекцию в таблицу
-        if not filled_mask[h_idx, s_idx, v_idx]:
-            hue_deltas[h_idx, s_idx, v_idx] = delta_h
-            sat_deltas[h_idx, s_idx, v_idx] = delta_s
-            val_deltas[h_idx, s_idx, v_idx] = delta_v
-            filled_mask[h_idx, s_idx, v_idx] = True
-            mapped_patches += 1
+    if measured_patches:
+        # 🎯 1. ЭТАЛОННЫЕ XYZ (колориметрически измеренные)
+        reference_xyz = np.array([patch['XYZ'] for patch in measured_patches], dtype=np.float64)
+
+        # 🎯 2-3. RGB КАМЕРЫ (что получилось после матрицы камеры) → HSV → ячейки таблицы
+        if cell_mapping is None:
+            camera_rgb = np.array([patch['RGB'] for patch in measured_patches], dtype=np.float64)
+            cell_mapping = map_patches_to_cells(empty_table, camera_rgb)
+        camera_hsv, cell_idx = cell_mapping
+
+        mapped_patches = _write_patch_deltas(empty_table, camera_hsv, cell_idx, reference_xyz, conflict)
 
     # Обновляем статистику
     empty_table['config_info']['filled_cells'] = np.sum(filled_mask)
@@ -277,32 +243,456 @@ def populate_hue_sat_table(empty_table: Dict[str, Any], measured_patches: List[D
     return empty_table
 
 
+def map_patches_to_cells(table: Dict[str, Any], camera_rgb: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Привязка патчей к ячейкам таблицы по HSV камеры (не эталона!).
+
+    Args:
+        table: Таблица от create_empty_hue_sat_table()
+        camera_rgb: (N, 3) RGB камеры, 0-1 или 0-255
+
+    Returns:
+        camera_hsv (N, 3) с Hue в градусах, плоские индексы ячеек (N,)
+    """
+    coordinate_map = table['coordinate_map']
+
+    camera_hsv = rgb_to_hsv_array(_normalize_rgb_rows(camera_rgb))
+    camera_hsv[:, 0] *= 360.0
+
+    cell_idx = np.ravel_multi_index((
+        _nearest_bin_index(coordinate_map['hue_coords'], camera_hsv[:, 0]),
+        _nearest_bin_index(coordinate_map['sat_coords'], camera_hsv[:, 1]),
+        _nearest_bin_index(coordinate_map['val_coords'], camera_hsv[:, 2]),
+    ), table['filled_mask'].shape)
+
+    return camera_hsv, cell_idx
+
+
+def _write_patch_deltas(table: Dict[str, Any], camera_hsv: np.ndarray, cell_idx: np.ndarray,
+                        reference_xyz: np.ndarray, conflict: str) -> int:
+    """Пишет дельты (эталон - камера) в незаполненные ячейки, возвращает число использованных патчей."""
+    filled_mask = table['filled_mask']
+
+    # 🎯 4-5. Reference XYZ → "правильный" RGB → HSV (целевые значения)
+    # Для DCP используем СТАНДАРТНОЕ рабочее пространство (обычно ProPhoto/sRGB)
+    reference_hsv = rgb_to_hsv_array(_normalize_rgb_rows(xyz_to_camera_rgb(reference_xyz)))
+    reference_hsv[:, 0] *= 360.0
+
+    # 🎯 6. Дельты коррекции = (эталон - камера), циклический Hue
+    deltas = reference_hsv - camera_hsv
+    deltas[:, 0] = np.where(deltas[:, 0] > 180, deltas[:, 0] - 360,
+                            np.where(deltas[:, 0] < -180, deltas[:, 0] + 360, deltas[:, 0]))
+
+    # 🎯 7. Записываем коррекцию в таблицу (только незаполненные ячейки)
+    flat_mask = filled_mask.reshape(-1)
+    cells, first_idx, inverse, counts = np.unique(cell_idx, return_index=True,
+                                                  return_inverse=True, return_counts=True)
+    is_new = ~flat_mask[cells]
+
+    if conflict == 'first':
+        cell_deltas = deltas[first_idx]
+        mapped_patches = int(np.sum(is_new))
+    else:
+        cell_deltas = np.zeros((len(cells), 3), dtype=np.float64)
+        np.add.at(cell_deltas, inverse.reshape(-1), deltas)
+        cell_deltas /= counts[:, None]
+        mapped_patches = int(np.sum(counts[is_new]))
+
+    new_cells = cells[is_new]
+    for name, comp in (('hue_deltas', 0), ('sat_deltas', 1), ('val_deltas', 2)):
+        table[name].reshape(-1)[new_cells] = cell_deltas[is_new, comp]
+    flat_mask[new_cells] = True
+
+    return mapped_patches
+
+
+def _normalize_rgb_rows(rgb: np.ndarray) -> np.ndarray:
+    """Rows with values above 1 are treated as 0-255, result clipped to 0-1."""
+    rgb = np.where(np.max(rgb, axis=-1, keepdims=True) > 1.0, rgb / 255.0, rgb)
+    return np.clip(rgb, 0, 1)  # Безопасность
+
+
+def rgb_to_hsv_array(rgb: np.ndarray) -> np.ndarray:
+    """
+    Векторизованный colorsys.rgb_to_hsv для массива (..., 3).
+
+    Returns:
+        np.ndarray (..., 3): H, S, V в диапазоне 0-1
+    """
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = np.max(rgb, axis=-1)
+    minc = np.min(rgb, axis=-1)
+    span = maxc - minc
+    is_grey = span == 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sat = np.where(is_grey, 0.0, span / np.where(maxc == 0, 1.0, maxc))
+        safe_span = np.where(is_grey, 1.0, span)
+        rc = (maxc - r) / safe_span
+        gc = (maxc - g) / safe_span
+        bc = (maxc - b) / safe_span
+
+    hue = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    hue = np.where(is_grey, 0.0, (hue / 6.0) % 1.0)
+
+    return np.stack([hue, sat, maxc], axis=-1)
+
+
+def _nearest_bin_index(coords: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Индекс ближайшего узла равномерной сетки coords (как argmin(|coords - value|)).
+
+    Без перехода через 0/360 для Hue, при равенстве расстояний - меньший индекс.
+    """
+    if len(coords) == 1:
+        return np.zeros(len(values), dtype=np.intp)
+
+    step = coords[1] - coords[0]
+    idx = np.ceil((values - coords[0]) / step - 0.5)
+    return np.clip(idx, 0, len(coords) - 1).astype(np.intp)
+
+
 def xyz_to_camera_rgb(xyz):
     """
     XYZ → RGB для DCP профиля.
     Используем стандартное рабочее пространство DCP (обычно близкое к ProPhoto).
+
+    Принимает один XYZ (3,) или массив (N, 3).
     """
     # DCP обычно использует широкое цветовое пространство
     # Матрица ProPhoto RGB (D50 illuminant, что часто используется в DCP)
-    M = np.array([
-        [1.3460, -0.2556, -0.0511],
-        [-0.5446, 1.5082, 0.0205],
-        [0.0000, 0.0000, 1.2123]
-    ])
+    M = DCP_WORKING_MATRIX
 
     # Нормализация XYZ (Y=100 для белой точки)
-    xyz_norm = xyz / 100.0 if np.max(xyz) > 1.0 else xyz
+    xyz = np.asarray(xyz, dtype=np.float64)
+    xyz_norm = np.where(np.max(xyz, axis=-1, keepdims=True) > 1.0, xyz / 100.0, xyz)
 
     # Применяем матрицу
-    rgb_linear = M @ xyz_norm
+    rgb_linear = xyz_norm @ M.T
 
     # Гамма коррекция (обычно простая 2.2 для DCP)
-    rgb_gamma = np.power(np.abs(rgb_linear), 1 / 2.2) * np.sign(rgb_linear)
+    rgb_gamma = np.power(np.abs(rgb_linear), 1 / DCP_WORKING_GAMMA) * np.sign(rgb_linear)
 
     # Возвращаем в диапазоне 0-255 (но без жесткого clipping)
     return rgb_gamma * 255
 
 
+def hsv_to_rgb_array(hsv: np.ndarray) -> np.ndarray:
+    """
+    Векторизованный colorsys.hsv_to_rgb для массива (..., 3), H, S, V в диапазоне 0-1.
+    """
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    sector = (h % 1.0) * 6.0
+    i = np.floor(sector).astype(np.intp) % 6
+    f = sector - np.floor(sector)
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+
+    # Строки: сектор 0..5, столбцы: (r, g, b) как в colorsys
+    choices = np.stack([np.stack([v, t, p], axis=-1), np.stack([q, v, p], axis=-1),
+                        np.stack([p, v, t], axis=-1), np.stack([p, q, v], axis=-1),
+                        np.stack([t, p, v], axis=-1), np.stack([v, p, q], axis=-1)])
+    return np.take_along_axis(choices, i[None, ..., None], axis=0)[0]
+
+
+def apply_hue_sat_map(rgb: np.ndarray, data: np.ndarray, dims: Tuple[int, int, int]) -> np.ndarray:
+    """
+    Применить таблицу ProfileHueSatMap / ProfileLookTable по спецификации DNG.
+
+    Записи таблицы - (сдвиг Hue в градусах, SatScale, ValScale), порядок V, H, S
+    (см. pack_hue_sat_deltas). Интерполяция трилинейная, Hue циклически,
+    ось V - линейное кодирование.
+
+    Args:
+        rgb: (N, 3) линейный ProPhoto RGB
+        data: плоский массив таблицы
+        dims: (hue, sat, val) разбиения (ProfileHueSatMapDims)
+
+    Returns:
+        (N, 3) линейный ProPhoto RGB после коррекции
+    """
+    dim_x, dim_y, dim_z = (max(int(d), 1) for d in dims)
+    cells = np.asarray(data, dtype=np.float64).reshape(dim_z, dim_x, dim_y, 3)
+
+    hsv = rgb_to_hsv_array(np.maximum(rgb, 0.0))
+    hue_position = hsv[:, 0] * dim_x
+    h0 = np.floor(hue_position).astype(np.intp) % dim_x
+    h1 = (h0 + 1) % dim_x
+    fh = hue_position - np.floor(hue_position)
+
+    def axis(values, size):
+        position = np.clip(values, 0.0, 1.0) * (size - 1)
+        low = np.minimum(position.astype(np.intp), max(size - 2, 0))
+        return low, np.minimum(low + 1, size - 1), position - low
+
+    s0, s1, fs = axis(hsv[:, 1], dim_y)
+    v0, v1, fv = axis(hsv[:, 2], dim_z)
+
+    entry = 0.0
+    for h, wh in ((h0, 1.0 - fh), (h1, fh)):
+        for s, ws in ((s0, 1.0 - fs), (s1, fs)):
+            for v, wv in ((v0, 1.0 - fv), (v1, fv)):
+                entry = entry + (wh * ws * wv)[:, None] * cells[v, h, s]
+
+    corrected = np.column_stack([(hsv[:, 0] + entry[:, 0] / 360.0) % 1.0,
+                                 np.clip(hsv[:, 1] * entry[:, 1], 0.0, 1.0),
+                                 np.maximum(hsv[:, 2] * entry[:, 2], 0.0)])
+    return hsv_to_rgb_array(corrected)
+
+
+class HsvNeighbourIndex:
+    """
+    Поиск k ближайших заполненных ячеек HSV таблицы.
+
+    Координаты нормализованы: Hue/360 (с весом hue_weight) - периодическая ось
+    (cKDTree с boxsize), S и V - как есть (0-1). Соседи через шов 0/360°
+    находятся корректно, а Hue не доминирует над S/V.
+    """
+
+    def __init__(self, populated_table: Dict[str, Any], hue_weight: float = 1.0):
+        """
+        Args:
+            populated_table: Результат populate_hue_sat_table()
+            hue_weight: длина периодической оси Hue относительно осей S/V
+        """
+        from scipy.spatial import cKDTree
+
+        coordinate_map = populated_table['coordinate_map']
+        self.hue_coords = coordinate_map['hue_coords']
+        self.sat_coords = coordinate_map['sat_coords']
+        self.val_coords = coordinate_map['val_coords']
+        self.hue_weight = hue_weight
+
+        self.filled_mask = populated_table['filled_mask'].copy()
+        self.known_cells = np.where(self.filled_mask)
+        self.known_points = self.embed_cells(self.known_cells)
+        self.tree = cKDTree(self.known_points, boxsize=[hue_weight, 0, 0]) if len(self.known_points) else None
+
+    def __len__(self):
+        return len(self.known_points)
+
+    def embed(self, hue: np.ndarray, sat: np.ndarray, val: np.ndarray) -> np.ndarray:
+        """HSV (Hue в градусах) → нормализованные координаты индекса (N, 3)."""
+        hue_norm = np.mod(hue, 360.0) / 360.0 * self.hue_weight
+        # mod может вернуть ровно hue_weight из-за округления
+        hue_norm = np.where(hue_norm >= self.hue_weight, 0.0, hue_norm)
+        return np.column_stack([hue_norm, sat, val])
+
+    def embed_cells(self, cells: Tuple[np.ndarray, ...]) -> np.ndarray:
+        """Индексы ячеек (как из np.where) → нормализованные координаты (N, 3)."""
+        return self.embed(self.hue_coords[cells[0]], self.sat_coords[cells[1]], self.val_coords[cells[2]])
+
+    def embed_cylinder_cells(self, cells: Tuple[np.ndarray, ...]) -> np.ndarray:
+        """
+        Ячейки → цилиндрические координаты (N, 4) без шва 0/360° для RBF.
+
+        Hue ложится на окружность с длиной hue_weight, S и V - как есть.
+        """
+        angle = np.deg2rad(self.hue_coords[cells[0]])
+        radius = self.hue_weight / (2.0 * np.pi)
+        return np.column_stack([radius * np.cos(angle), radius * np.sin(angle),
+                                self.sat_coords[cells[1]], self.val_coords[cells[2]]])
+
+    def query(self, points: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k ближайших известных ячеек для точек в координатах индекса.
+
+        Returns:
+            distances (N, k), neighbour_indices (N, k) - индексы в known_points
+        """
+        k = min(k, len(self))
+        distances, neighbour_indices = self.tree.query(points, k=k)
+        return distances.reshape(len(points), k), neighbour_indices.reshape(len(points), k)
+
+    def query_mask(self, mask: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k ближайших известных ячеек для всех ячеек mask (в порядке table[mask])."""
+        return self.query(self.embed_cells(np.where(mask)), k)
+
+    def matches(self, table: Dict[str, Any]) -> bool:
+        """Индекс построен для текущего состояния таблицы."""
+        return (table['coordinate_map']['hue_coords'] is self.hue_coords
+                and np.array_equal(table['filled_mask'], self.filled_mask))
+
+
+def get_hsv_neighbour_index(populated_table: Dict[str, Any]) -> HsvNeighbourIndex:
+    """
+    Индекс соседей таблицы, строится один раз и хранится в populated_table['neighbour_index'].
+
+    Таблицы одного HueSatTablePlan с одинаковой маской заполнения делят один индекс.
+
+    Args:
+        populated_table: Результат populate_hue_sat_table()
+    """
+    index = populated_table.get('neighbour_index')
+    hue_weight = populated_table['algorithm_params'].get('hue_weight', 1.0)
+    if index is None or index.hue_weight != hue_weight or not index.matches(populated_table):
+        plan = populated_table.get('interpolation_plan')
+        key = (hue_weight, populated_table['filled_mask'].tobytes())
+        index = plan.neighbour_indexes.get(key) if plan is not None else None
+        if index is None or not index.matches(populated_table):
+            index = HsvNeighbourIndex(populated_table, hue_weight)
+            if plan is not None:
+                plan.neighbour_indexes[key] = index
+        populated_table['neighbour_index'] = index
+    return index
+
+
+class InterpolationOperator:
+    """
+    Линейный оператор интерполяции пустых ячеек: дельты известных ячеек (n_known, C)
+    → дельты пустых ячеек (n_empty, C) в порядке table[~filled_mask].
+
+    Зависит только от сетки и маски заполнения, не от значений дельт, поэтому один
+    оператор годится для любых эталонов (HueSatDeltas1/2, LookTable).
+    Shepard хранится разреженно (k соседей + веса), RBF - плотной матрицей.
+    """
+
+    def __init__(self, weights: np.ndarray, neighbour_indices: Optional[np.ndarray] = None):
+        self.weights = weights
+        self.neighbour_indices = neighbour_indices
+
+    def apply(self, known_values: np.ndarray) -> np.ndarray:
+        """(n_known, C) → (n_empty, C)"""
+        if self.neighbour_indices is None:
+            return self.weights @ known_values
+
+        result = np.zeros((len(self.weights), known_values.shape[1]))
+        for comp in range(known_values.shape[1]):
+            result[:, comp] = np.sum(self.weights * known_values[self.neighbour_indices, comp], axis=1)
+        return result
+
+
+def _build_shepard_operator(populated_table: Dict[str, Any], k_neighbors: int,
+                            shepard_power: float) -> InterpolationOperator:
+    """Веса Shepard (IDW) по k ближайшим известным ячейкам."""
+    spatial_index = get_hsv_neighbour_index(populated_table)
+    distances, neighbor_indices = spatial_index.query_mask(~populated_table['filled_mask'], k_neighbors)
+
+    # Избегаем деления на ноль для совпадающих точек
+    epsilon = 1e-12
+    safe_distances = np.maximum(distances, epsilon)
+
+    # Веса Shepard: w_i = 1 / d_i^p, нормализованные (сумма = 1 для каждой точки)
+    shepard_weights = 1.0 / (safe_distances ** shepard_power)
+    weight_sums = np.sum(shepard_weights, axis=1, keepdims=True)
+    return InterpolationOperator(shepard_weights / weight_sums, neighbor_indices)
+
+
+def _build_rbf_operator(populated_table: Dict[str, Any], rbf_function: str, smoothing: float,
+                        neighbors: Optional[int], cancel=None) -> Optional[InterpolationOperator]:
+    """
+    Матрица RBF интерполяции: RBF линеен по значениям, поэтому интерполяция
+    единичной матрицы дает оператор для любых дельт (одна факторизация ядра).
+    None, если построение отменено через cancel (см. rbf_interpolate).
+    """
+    spatial_index = get_hsv_neighbour_index(populated_table)
+    known_hsv = spatial_index.embed_cylinder_cells(spatial_index.known_cells)
+    target_hsv = spatial_index.embed_cylinder_cells(np.where(~populated_table['filled_mask']))
+
+    matrix = rbf_interpolate(known_hsv, np.eye(len(known_hsv)), target_hsv,
+                             rbf_function, smoothing, neighbors, cancel)
+    return InterpolationOperator(matrix) if matrix is not None else None
+
+
+_OPERATOR_BUILDERS = {
+    'shepard': _build_shepard_operator,
+    'rbf': _build_rbf_operator,
+}
+
+
+def get_interpolation_operator(populated_table: Dict[str, Any], method: str, params: Tuple,
+                               cancel=None) -> Optional[InterpolationOperator]:
+    """
+    Оператор интерполяции таблицы ('shepard' или 'rbf' с параметрами метода).
+
+    Для таблиц HueSatTablePlan кэшируется в плане по (метод, параметры, маска заполнения).
+    cancel (threading.Event) передается построителю RBF; отмененное построение
+    возвращает None и в кэш не попадает.
+    """
+    options = {'cancel': cancel} if cancel is not None else {}
+    plan = populated_table.get('interpolation_plan')
+    if plan is None:
+        return _OPERATOR_BUILDERS[method](populated_table, *params, **options)
+
+    key = (method, params, populated_table['algorithm_params'].get('hue_weight', 1.0),
+           populated_table['filled_mask'].tobytes())
+    operator = plan.operators.get(key)
+    if operator is None:
+        operator = _OPERATOR_BUILDERS[method](populated_table, *params, **options)
+        if operator is not None:
+            plan.operators[key] = operator
+    return operator
+
+
+class HueSatTablePlan:
+    """
+    Общий план для нескольких таблиц одной сетки (HueSatDeltas1/2, LookTable).
+
+    Сетка (coordinate_map) общая для всех таблиц плана. Привязка патчей к ячейкам
+    кэшируется по RGB камеры, индекс соседей и операторы интерполяции - по маске
+    заполнения: таблицы с той же маской (например, HueSatDeltas1 и LookTable по
+    одним патчам) отличаются только эталонами и стоят одно умножение на оператор.
+    Второй источник света обычно дает другую маску - для него индекс и оператор
+    строятся заново.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Args:
+            config: Словарь конфигурации от select_table_configuration()
+        """
+        self.config = config
+        self.shape = (config['dim_x'], config['dim_y'], config['dim_z'])
+        self.coordinate_map = create_empty_hue_sat_table(config)['coordinate_map']
+        self.cell_mappings = {}
+        self.neighbour_indexes = {}
+        self.operators = {}
+
+    def create_table(self) -> Dict[str, Any]:
+        """Пустая таблица плана (общая coordinate_map)."""
+        table = create_empty_hue_sat_table(self.config)
+        table['coordinate_map'] = self.coordinate_map
+        table['interpolation_plan'] = self
+        return table
+
+    def populate(self, measured_patches: List[Dict], conflict: str = 'first') -> Dict[str, Any]:
+        """populate_hue_sat_table() с кэшированной привязкой патчей к ячейкам."""
+        table = self.create_table()
+        cell_mapping = None
+        if measured_patches:
+            camera_rgb = np.array([patch['RGB'] for patch in measured_patches], dtype=np.float64)
+            key = camera_rgb.tobytes()
+            cell_mapping = self.cell_mappings.get(key)
+            if cell_mapping is None:
+                cell_mapping = map_patches_to_cells(table, camera_rgb)
+                self.cell_mappings[key] = cell_mapping
+        return populate_hue_sat_table(table, measured_patches, conflict, cell_mapping)
+
+    def interpolate(self, measured_patches: List[Dict], method: str = 'hybrid',
+                    conflict: str = 'first', parallel: bool = False) -> Dict[str, Any]:
+        """
+        Заполненная и интерполированная таблица для набора патчей.
+
+        Args:
+            measured_patches: [{'RGB': [r,g,b], 'XYZ': [x,y,z]}, ...]
+            method: 'shepard', 'rbf' или 'hybrid'
+            conflict: см. populate_hue_sat_table()
+            parallel: для 'hybrid' - Shepard и RBF одновременно
+        """
+        interpolators = {
+            'shepard': interpolate_color_correction_sheppard,
+            'rbf': interpolate_color_correction_rbf,
+            'hybrid': interpolate_color_correction_hybrid,
+        }
+        if method not in interpolators:
+            raise ValueError(f"Unknown interpolation method: {method}")
+        table = self.populate(measured_patches, conflict)
+        if method == 'hybrid':
+            return interpolate_color_correction_hybrid(table, parallel=parallel)
+        return interpolators[method](table)
+
+
 def interpolate_color_correction_sheppard(populated_table: Dict[str, Any]) -> Dict[str, Any]:
     """
     Универсальная интерполяция с использованием Shepard + конфигурационные параметры.
@@ -319,19 +709,12 @@ def interpolate_color_correction_sheppard(populated_table: Dict[str, Any]) -> Di
     Returns:
         Полностью заполненная HSV таблица с интерполированными значениями
     """
-    from scipy.spatial import KDTree
-
     # Извлекаем структуры данных
     hue_deltas = populated_table['hue_deltas']
     sat_deltas = populated_table['sat_deltas']
     val_deltas = populated_table['val_deltas']
     filled_mask = populated_table['filled_mask']
 
-    coordinate_map = populated_table['coordinate_map']
-    hue_coords = coordinate_map['hue_coords']
-    sat_coords = coordinate_map['sat_coords']
-    val_coords = coordinate_map['val_coords']
-
     # НОВОЕ: Извлекаем параметры из конфигурации
     algorithm_params = populated_table['algorithm_params']
     correction_limits = populated_table['correction_limits']
@@ -349,16 +732,8 @@ def interpolate_color_correction_sheppard(populated_table: Dict[str, Any]) -> Di
         print("❌ Insufficient data for interpolation (need ≥4 points)")
         return populated_table
 
-    # 1. Собираем известные точки и коррекции (векторизованно)
-    filled_indices = np.where(filled_mask)
-    n_known = len(filled_indices[0])
-
-    # HSV координаты известных точек
-    known_hsv = np.column_stack([
-        hue_coords[filled_indices[0]],
-        sat_coords[filled_indices[1]],
-        val_coords[filled_indices[2]]
-    ])
+    # 1. Собираем известные коррекции (векторизованно)
+    n_known = int(np.sum(filled_mask))
 
     # HSV коррекции
     known_corrections = np.column_stack([
@@ -369,68 +744,31 @@ def interpolate_color_correction_sheppard(populated_table: Dict[str, Any]) -> Di
 
     print(f"   Known points: {n_known}")
 
-    # 2. Создаем KDTree для быстрого поиска соседей
-    spatial_index = KDTree(known_hsv)
-
-    # 3. Находим все пустые ячейки для интерполяции
+    # 2. Находим все пустые ячейки для интерполяции
     empty_mask = ~filled_mask
-    empty_indices = np.where(empty_mask)
-    n_empty = len(empty_indices[0])
+    n_empty = int(np.sum(empty_mask))
 
     if n_empty == 0:
         print("✅ All cells already filled")
         return populated_table
 
-    # HSV координаты пустых точек
-    target_hsv = np.column_stack([
-        hue_coords[empty_indices[0]],
-        sat_coords[empty_indices[1]],
-        val_coords[empty_indices[2]]
-    ])
-
     print(f"   Target points: {n_empty}")
 
-    # 4. НОВОЕ: Параметры интерполяции из конфигурации
+    # 3. НОВОЕ: Параметры интерполяции из конфигурации
     k_neighbors = min(algorithm_params['k_neighbors'], n_known)  # Не больше чем есть точек
     shepard_power = algorithm_params['shepard_power']
 
     print(f"   Using {k_neighbors} neighbors, Shepard power={shepard_power}")
 
-    # 5. Векторизованный поиск k ближайших соседей
-    distances, neighbor_indices = spatial_index.query(target_hsv, k=k_neighbors)
+    # 4. Веса Shepard по k соседям с периодическим Hue (кэшируются в HueSatTablePlan)
+    operator = get_interpolation_operator(populated_table, 'shepard', (k_neighbors, shepard_power))
 
-    # Обработка случая одного соседа (distances может быть 1D)
-    if k_neighbors == 1:
-        distances = distances.reshape(-1, 1)
-        neighbor_indices = neighbor_indices.reshape(-1, 1)
-
-    # 6. Векторизованный расчет весов Shepard
-    # Избегаем деления на ноль для совпадающих точек
-    epsilon = 1e-12
-    safe_distances = np.maximum(distances, epsilon)
-
-    # Веса Shepard: w_i = 1 / d_i^p
-    shepard_weights = 1.0 / (safe_distances ** shepard_power)
-
-    # Нормализация весов (сумма = 1 для каждой точки)
-    weight_sums = np.sum(shepard_weights, axis=1, keepdims=True)
-    normalized_weights = shepard_weights / weight_sums
-
-    # 7. Векторизованная интерполяция для каждой компоненты
-    interpolated_corrections = np.zeros((n_empty, 3))
-
-    for comp in range(3):  # H, S, V компоненты
-        # Берем значения соседей для текущей компоненты
-        neighbor_values = known_corrections[neighbor_indices, comp]  # shape: (n_empty, k_neighbors)
-
-        # Взвешенная сумма
-        interpolated_corrections[:, comp] = np.sum(
-            normalized_weights * neighbor_values, axis=1
-        )
+    # 5. Векторизованная интерполяция всех компонент
+    interpolated_corrections = operator.apply(known_corrections)
 
     print("✅ Shepard interpolation completed")
 
-    # 8. НОВОЕ: Применяем ограничения из конфигурации
+    # 6. НОВОЕ: Применяем ограничения из конфигурации
     hue_limits = correction_limits['hue']
     sat_limits = correction_limits['sat']
     val_limits = correction_limits['val']
@@ -439,7 +777,7 @@ def interpolate_color_correction_sheppard(populated_table: Dict[str, Any]) -> Di
     interpolated_corrections[:, 1] = np.clip(interpolated_corrections[:, 1], sat_limits[0], sat_limits[1])
     interpolated_corrections[:, 2] = np.clip(interpolated_corrections[:, 2], val_limits[0], val_limits[1])
 
-    # 9. Заполняем результирующие массивы
+    # 7. Заполняем результирующие массивы
     result_hue_deltas = hue_deltas.copy()
     result_sat_deltas = sat_deltas.copy()
     result_val_deltas = val_deltas.copy()
@@ -449,14 +787,14 @@ def interpolate_color_correction_sheppard(populated_table: Dict[str, Any]) -> Di
     result_sat_deltas[empty_mask] = interpolated_corrections[:, 1]
     result_val_deltas[empty_mask] = interpolated_corrections[:, 2]
 
-    # 10. Создаем результирующую таблицу
+    # 8. Создаем результирующую таблицу
     result_table = populated_table.copy()
     result_table['hue_deltas'] = result_hue_deltas
     result_table['sat_deltas'] = result_sat_deltas
     result_table['val_deltas'] = result_val_deltas
     result_table['filled_mask'] = np.ones_like(filled_mask, dtype=bool)  # Все заполнено
 
-    # 11. Обновляем метаданные
+    # 9. Обновляем метаданные
     result_table['config_info']['interpolation_method'] = f'shepard_{scenario}'
     result_table['config_info']['filled_cells'] = n_hue * n_sat * n_val
     result_table['config_info']['fill_ratio'] = 1.0
@@ -479,8 +817,78 @@ def interpolate_color_correction_sheppard(populated_table: Dict[str, Any]) -> Di
     return result_table
 
 
+# Имена функций scipy.interpolate.Rbf → ядра RBFInterpolator
+_RBF_KERNELS = {
+    'multiquadric': 'multiquadric',
+    'inverse': 'inverse_multiquadric',
+    'inverse_multiquadric': 'inverse_multiquadric',
+    'gaussian': 'gaussian',
+    'linear': 'linear',
+    'cubic': 'cubic',
+    'quintic': 'quintic',
+    'thin_plate': 'thin_plate_spline',
+    'thin_plate_spline': 'thin_plate_spline',
+}
+
+# Ядра RBFInterpolator, которым нужен параметр формы epsilon
+_RBF_SHAPED_KERNELS = ('multiquadric', 'inverse_multiquadric', 'inverse_quadratic', 'gaussian')
+
+# Целевых точек на один вызов интерполятора, между вызовами проверяется отмена
+RBF_CANCEL_CHUNK = 2048
+
+
+def rbf_interpolate(known_points: np.ndarray, known_values: np.ndarray, target_points: np.ndarray,
+                    function: str = 'thin_plate', smoothing: float = 0.0,
+                    neighbors: Optional[int] = None, cancel=None) -> Optional[np.ndarray]:
+    """
+    RBF интерполяция сразу всех компонент (одна факторизация ядра).
+
+    Args:
+        known_points: (N, D) координаты известных точек
+        known_values: (N, C) значения (например, дельты H/S/V)
+        target_points: (M, D) координаты целевых точек
+        function: имя функции как в scipy.interpolate.Rbf или ядро RBFInterpolator
+        smoothing: регуляризация
+        neighbors: локальный режим - число ближайших соседей на точку (None - глобально)
+        cancel: threading.Event - проверяется до факторизации и между кусками по
+            RBF_CANCEL_CHUNK точек (саму факторизацию прервать нельзя)
+
+    Returns:
+        np.ndarray (M, C) или None, если вычисление отменено
+    """
+    from scipy.interpolate import RBFInterpolator
+
+    if cancel is not None and cancel.is_set():
+        return None
+
+    kernel = _RBF_KERNELS.get(function, function)
+    options = {}
+    if kernel in _RBF_SHAPED_KERNELS:
+        # epsilon как у Rbf по умолчанию: средний шаг между узлами
+        edges = np.ptp(known_points, axis=0)
+        edges = edges[edges > 0]
+        avg_step = np.power(np.prod(edges) / len(known_points), 1.0 / len(edges)) if len(edges) else 1.0
+        options['epsilon'] = 1.0 / avg_step
+
+    if neighbors is not None and neighbors >= len(known_points):
+        neighbors = None
+
+    interpolator = RBFInterpolator(known_points, known_values, kernel=kernel,
+                                   smoothing=smoothing, neighbors=neighbors, **options)
+    if cancel is None:
+        return interpolator(target_points)
+
+    result = np.empty((len(target_points),) + np.shape(known_values)[1:])
+    for start in range(0, len(target_points), RBF_CANCEL_CHUNK):
+        if cancel.is_set():
+            return None
+        result[start:start + RBF_CANCEL_CHUNK] = interpolator(target_points[start:start + RBF_CANCEL_CHUNK])
+    return result
+
+
 def interpolate_color_correction_rbf(populated_table: Dict[str, Any],
-                                     fallback_for_shepard: bool = False) -> Dict[str, Any]:
+                                     fallback_for_shepard: bool = False,
+                                     neighbors: Optional[int] = None, cancel=None) -> Dict[str, Any]:
     """
     Универсальная RBF интерполяция с конфигурационными параметрами.
 
@@ -492,16 +900,19 @@ def interpolate_color_correction_rbf(populated_table: Dict[str, Any],
     - Использует RBF параметры из конфигурации
     - Универсальные ограничения для всех сценариев
     - Регуляризация для численной стабильности
-    - Векторизованные операции
+    - Одна факторизация ядра на все три компоненты (RBFInterpolator)
+    - Цилиндрические координаты HSV - без шва 0/360°
 
     Args:
         populated_table: Результат populate_hue_sat_table() с заполненными измерениями
         fallback_for_shepard: True если используется как fallback после Shepard
+        neighbors: локальный RBF по k соседям (по умолчанию algorithm_params['rbf_neighbors'])
+        cancel: threading.Event для остановки (см. rbf_interpolate)
 
     Returns:
-        Полностью заполненная HSV таблица с RBF интерполированными значениями
+        Полностью заполненная HSV таблица с RBF интерполированными значениями;
+        при отмене - populated_table без изменений
     """
-    from scipy.interpolate import Rbf
     import warnings
 
     # Извлекаем структуры данных
@@ -510,11 +921,6 @@ def interpolate_color_correction_rbf(populated_table: Dict[str, Any],
     val_deltas = populated_table['val_deltas']
     filled_mask = populated_table['filled_mask']
 
-    coordinate_map = populated_table['coordinate_map']
-    hue_coords = coordinate_map['hue_coords']
-    sat_coords = coordinate_map['sat_coords']
-    val_coords = coordinate_map['val_coords']
-
     # НОВОЕ: Извлекаем параметры из конфигурации
     algorithm_params = populated_table['algorithm_params']
     correction_limits = populated_table['correction_limits']
@@ -535,15 +941,11 @@ def interpolate_color_correction_rbf(populated_table: Dict[str, Any],
         return populated_table
 
     # 1. Собираем известные точки и коррекции (векторизованно)
-    filled_indices = np.where(filled_mask)
-    n_known = len(filled_indices[0])
-
-    # HSV координаты известных точек
-    known_hsv = np.column_stack([
-        hue_coords[filled_indices[0]],
-        sat_coords[filled_indices[1]],
-        val_coords[filled_indices[2]]
-    ])
+    spatial_index = get_hsv_neighbour_index(populated_table)
+    n_known = len(spatial_index)
+
+    # Цилиндрические HSV координаты известных точек
+    known_hsv = spatial_index.embed_cylinder_cells(spatial_index.known_cells)
 
     # HSV коррекции
     known_corrections = np.column_stack([
@@ -563,51 +965,35 @@ def interpolate_color_correction_rbf(populated_table: Dict[str, Any],
         print("✅ All cells already filled")
         return populated_table
 
-    # HSV координаты пустых точек
-    target_hsv = np.column_stack([
-        hue_coords[empty_indices[0]],
-        sat_coords[empty_indices[1]],
-        val_coords[empty_indices[2]]
-    ])
+    # Цилиндрические HSV координаты пустых точек
+    target_hsv = spatial_index.embed_cylinder_cells(empty_indices)
 
     print(f"   Target points: {n_empty}")
 
     # 3. НОВОЕ: Параметры RBF из конфигурации
     rbf_function = algorithm_params['rbf_function']
     smoothing = algorithm_params['rbf_smoothing']
+    if neighbors is None:
+        neighbors = algorithm_params.get('rbf_neighbors')
 
-    print(f"   RBF function: {rbf_function}, smoothing: {smoothing}")
-
-    # 4. Создаем RBF интерполяторы для каждой компоненты
-    interpolated_corrections = np.zeros((n_empty, 3))
+    print(f"   RBF function: {rbf_function}, smoothing: {smoothing}, neighbors: {neighbors or 'all'}")
 
+    # 4. Один RBF интерполятор для всех трех компонент
+    # Для таблиц HueSatTablePlan - матрица оператора, общая для всех таблиц плана
     # Подавляем предупреждения RBF о плохой обусловленности
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", category=RuntimeWarning)
 
         try:
-            for comp in range(3):  # H, S, V компоненты
-                component_name = ['Hue', 'Saturation', 'Value'][comp]
-                print(f"   Processing {component_name}...")
-
-                # Создаем RBF интерполятор для текущей компоненты
-                rbf_interpolator = Rbf(
-                    known_hsv[:, 0],  # H координаты
-                    known_hsv[:, 1],  # S координаты
-                    known_hsv[:, 2],  # V координаты
-                    known_corrections[:, comp],  # Значения коррекций
-                    function=rbf_function,
-                    smooth=smoothing
-                )
-
-                # Векторизованная интерполяция для всех целевых точек
-                interpolated_values = rbf_interpolator(
-                    target_hsv[:, 0],  # H целевых точек
-                    target_hsv[:, 1],  # S целевых точек
-                    target_hsv[:, 2]  # V целевых точек
-                )
-
-                interpolated_corrections[:, comp] = interpolated_values
+            if cancel is not None and cancel.is_set():
+                interpolated_corrections = None
+            elif populated_table.get('interpolation_plan') is not None:
+                operator = get_interpolation_operator(populated_table, 'rbf', (rbf_function, smoothing, neighbors),
+                                                      cancel)
+                interpolated_corrections = operator.apply(known_corrections) if operator is not None else None
+            else:
+                interpolated_corrections = rbf_interpolate(known_hsv, known_corrections, target_hsv,
+                                                           rbf_function, smoothing, neighbors, cancel)
 
         except Exception as e:
             print(f"❌ RBF interpolation failed: {e}")
@@ -617,6 +1003,10 @@ def interpolate_color_correction_rbf(populated_table: Dict[str, Any],
             mean_corrections = np.mean(known_corrections, axis=0)
             interpolated_corrections = np.tile(mean_corrections, (n_empty, 1))
 
+    if interpolated_corrections is None:
+        print("   RBF cancelled")
+        return populated_table
+
     print("✅ RBF interpolation completed")
 
     # 5. НОВОЕ: Применяем ограничения из конфигурации
@@ -676,6 +1066,7 @@ def interpolate_color_correction_rbf(populated_table: Dict[str, Any],
     result_table['config_info']['interpolated_cells'] = n_empty
     result_table['config_info']['rbf_function'] = rbf_function
     result_table['config_info']['rbf_smoothing'] = smoothing
+    result_table['config_info']['rbf_neighbors'] = neighbors
 
     # НОВОЕ: Записываем примененные ограничения
     result_table['config_info']['applied_limits'] = {
@@ -695,7 +1086,7 @@ def interpolate_color_correction_rbf(populated_table: Dict[str, Any],
     return result_table
 
 
-def interpolate_color_correction_hybrid(populated_table: Dict[str, Any]) -> Dict[str, Any]:
+def interpolate_color_correction_hybrid(populated_table: Dict[str, Any], parallel: bool = False) -> Dict[str, Any]:
     """
     Гибридный Shepard + RBF интерполятор с конфигурационными параметрами.
 
@@ -704,32 +1095,104 @@ def interpolate_color_correction_hybrid(populated_table: Dict[str, Any]) -> Dict
     2. Оценивает качество результата используя пороги из конфигурации
     3. Если качество плохое - переключается на RBF
 
+    В режиме parallel Shepard и RBF считаются одновременно в пуле потоков
+    (NumPy/SciPy отпускают GIL), время ограничено более медленным методом.
+    Если Shepard проходит проверку, RBF останавливается через threading.Event между
+    кусками вычисления; начатая факторизация ядра дорабатывает в фоне, ее результат отбрасывается.
+
     Args:
         populated_table: Результат populate_hue_sat_table()
+        parallel: считать оба метода параллельно
 
     Returns:
         Результат лучшего из методов
     """
     # НОВОЕ: Извлекаем параметры из конфигурации
     algorithm_params = populated_table['algorithm_params']
-    quality_thresholds = populated_table['quality_thresholds']
     scenario = algorithm_params['scenario']
 
-    print(f"🔄 Hybrid Shepard+RBF [{scenario.upper()}]:")
+    print(f"🔄 Hybrid Shepard+RBF [{scenario.upper()}]{' parallel' if parallel else ''}:")
+
+    if parallel:
+        return _interpolate_hybrid_parallel(populated_table)
 
     # 1. Пробуем Shepard интерполяцию
     print("   Step 1: Trying Shepard interpolation...")
     shepard_result = interpolate_color_correction_sheppard(populated_table)
 
     # 2. Проверяем качество Shepard результата
-    filled_mask = populated_table['filled_mask']
-    empty_mask = ~filled_mask
-    n_empty = np.sum(empty_mask)
-
-    if n_empty == 0:
+    if not np.any(~populated_table['filled_mask']):
         print("   All cells already filled - using Shepard result")
         return shepard_result
 
+    quality_issues = _shepard_quality_issues(populated_table, shepard_result)
+
+    # 3. Решение о методе
+    if len(quality_issues) == 0:
+        print("   Step 2: Shepard quality OK - using Shepard result")
+        shepard_result['config_info']['quality_check'] = "passed"
+        return shepard_result
+    else:
+        _print_quality_issues(quality_issues)
+        print("   Step 3: Switching to RBF fallback...")
+
+        # Используем RBF как fallback
+        rbf_result = interpolate_color_correction_rbf(populated_table, fallback_for_shepard=True)
+        rbf_result['config_info']['quality_check'] = f"shepard_failed: {'; '.join(quality_issues)}"
+        rbf_result['config_info']['hybrid_decision'] = "rbf_chosen"
+
+        return rbf_result
+
+
+def _interpolate_hybrid_parallel(populated_table: Dict[str, Any]) -> Dict[str, Any]:
+    """Shepard и RBF одновременно, выбор по quality_thresholds."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Общий индекс соседей строим до запуска потоков
+    get_hsv_neighbour_index(populated_table)
+
+    def own_copy(table):
+        # У каждого метода свой config_info - они пишут метаданные одновременно
+        return dict(table, config_info=dict(table['config_info']))
+
+    cancel_rbf = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        print("   Step 1: Running Shepard and RBF concurrently...")
+        shepard_future = executor.submit(interpolate_color_correction_sheppard, own_copy(populated_table))
+        rbf_future = executor.submit(interpolate_color_correction_rbf, own_copy(populated_table),
+                                     fallback_for_shepard=True, cancel=cancel_rbf)
+
+        shepard_result = shepard_future.result()
+        if not np.any(~populated_table['filled_mask']):
+            print("   All cells already filled - using Shepard result")
+            return shepard_result
+
+        quality_issues = _shepard_quality_issues(populated_table, shepard_result)
+        if len(quality_issues) == 0:
+            print("   Step 2: Shepard quality OK - using Shepard result, RBF cancelled")
+            shepard_result['config_info']['quality_check'] = "passed"
+            return shepard_result
+
+        _print_quality_issues(quality_issues)
+        print("   Step 3: Using concurrent RBF result...")
+        rbf_result = rbf_future.result()
+        rbf_result['config_info']['quality_check'] = f"shepard_failed: {'; '.join(quality_issues)}"
+        rbf_result['config_info']['hybrid_decision'] = "rbf_chosen"
+        return rbf_result
+
+    finally:
+        # RBF не нужен (или уже готов): не начатый отменяется, начатый выходит на ближайшей проверке
+        cancel_rbf.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _shepard_quality_issues(populated_table: Dict[str, Any], shepard_result: Dict[str, Any]) -> List[str]:
+    """Проверка Shepard результата по quality_thresholds, список найденных проблем."""
+    quality_thresholds = populated_table['quality_thresholds']
+    empty_mask = ~populated_table['filled_mask']
+
     # Простая метрика качества: проверяем распределение значений
     shepard_hue_values = shepard_result['hue_deltas'][empty_mask]
     shepard_sat_values = shepard_result['sat_deltas'][empty_mask]
@@ -769,76 +1232,131 @@ def interpolate_color_correction_hybrid(populated_table: Dict[str, Any]) -> Dict
     if extreme_values_ratio > extreme_threshold:
         quality_issues.append(f"Extreme values: {extreme_values_ratio * 100:.1f}%")
 
-    # 3. Решение о методе
-    if len(quality_issues) == 0:
-        print("   Step 2: Shepard quality OK - using Shepard result")
-        shepard_result['config_info']['quality_check'] = "passed"
-        return shepard_result
-    else:
-        print(f"   Step 2: Shepard quality issues detected:")
-        for issue in quality_issues:
-            print(f"            - {issue}")
-        print("   Step 3: Switching to RBF fallback...")
+    return quality_issues
 
-        # Используем RBF как fallback
-        rbf_result = interpolate_color_correction_rbf(populated_table, fallback_for_shepard=True)
-        rbf_result['config_info']['quality_check'] = f"shepard_failed: {'; '.join(quality_issues)}"
-        rbf_result['config_info']['hybrid_decision'] = "rbf_chosen"
 
-        return rbf_result
+def _print_quality_issues(quality_issues: List[str]):
+    print(f"   Step 2: Shepard quality issues detected:")
+    for issue in quality_issues:
+        print(f"            - {issue}")
+
+
+DCP_FLOAT_DTYPE = np.dtype('<f4')  # DCP/TIFF little-endian FLOAT
 
 
-def generate_hue_sat_deltas_data(interpolated_table: Dict[str, Any]) -> np.ndarray:
+def pack_hue_sat_deltas(hue_deltas: np.ndarray, sat_deltas: np.ndarray, val_deltas: np.ndarray,
+                        out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, int]:
+    """
+    Упаковывает три куба дельт в плоский float32 массив в порядке Adobe DCP
+    (V внешний, затем H, S внутренний, тройка значений H/S/V на ячейку).
+
+    NaN/Inf заменяются на 0.0 прямо в результирующем буфере.
+
+    Args:
+        hue_deltas, sat_deltas, val_deltas: Кубы (H, S, V) одинаковой формы
+        out: Необязательный плоский буфер float32 длиной H*S*V*3 (например,
+             участок буфера DCP writer'а) - данные пишутся прямо в него
+
+    Returns:
+        (flat, invalid_count): плоский float32 массив и число замененных значений
+    """
+    shape = np.shape(hue_deltas)
+    if np.shape(sat_deltas) != shape or np.shape(val_deltas) != shape:
+        raise ValueError(f"Delta cubes shape mismatch: {shape}, {np.shape(sat_deltas)}, {np.shape(val_deltas)}")
+
+    if out is None:
+        out = np.empty(int(np.prod(shape)) * 3, dtype=DCP_FLOAT_DTYPE)
+    elif out.size != int(np.prod(shape)) * 3:
+        raise ValueError(f"Output buffer has {out.size} values, expected {int(np.prod(shape)) * 3}")
+
+    # (V, H, S, 3) вид на тот же буфер - порядок C совпадает с порядком Adobe,
+    # кубы (H, S, V) транспонируются при записи
+    cells = out.reshape((shape[2], shape[0], shape[1], 3))
+    cells[..., 0] = np.transpose(hue_deltas, (2, 0, 1))
+    cells[..., 1] = np.transpose(sat_deltas, (2, 0, 1))
+    cells[..., 2] = np.transpose(val_deltas, (2, 0, 1))
+
+    invalid = ~np.isfinite(out)
+    invalid_count = int(np.count_nonzero(invalid))
+    if invalid_count:
+        out[invalid] = 0.0
+
+    return out, invalid_count
+
+
+def _delta_to_scale(delta: np.ndarray, coords: np.ndarray, axis: int) -> np.ndarray:
+    """
+    Аддитивная дельта S или V → множитель DNG в ячейке: (coord + delta) / coord.
+
+    Args:
+        delta: (H, S, V) дельты
+        coords: координаты ячеек по оси axis (sat_coords / val_coords)
+        axis: 1 - насыщенность, 2 - яркость
+
+    Returns:
+        (H, S, V) множители >= 0; при coord = 0 множитель ни на что не влияет - 1.0
+    """
+    shape = [1, 1, 1]
+    shape[axis] = -1
+    coord = np.asarray(coords, dtype=np.float64).reshape(shape)
+    nonzero = coord > 0
+    scale = np.maximum(coord + delta, 0.0) / np.where(nonzero, coord, 1.0)
+    return np.where(nonzero, scale, 1.0)
+
+
+def generate_hue_sat_deltas_data(interpolated_table: Dict[str, Any], out: Optional[np.ndarray] = None,
+                                 table_name: str = 'HueSatDeltas1') -> np.ndarray:
     """
     Генерирует данные для записи в DCP тег HueSatDeltas1 (ID 50708).
 
     Формат Adobe DCP: массив float32 значений в порядке:
-    [hue0_sat0_val0_delta_h, hue0_sat0_val0_delta_s, hue0_sat0_val0_delta_v,
-     hue0_sat0_val1_delta_h, hue0_sat0_val1_delta_s, hue0_sat0_val1_delta_v, ...]
+    [val0_hue0_sat0_hue_shift, val0_hue0_sat0_sat_scale, val0_hue0_sat0_val_scale,
+     val0_hue0_sat1_hue_shift, val0_hue0_sat1_sat_scale, val0_hue0_sat1_val_scale, ...]
+
+    Сдвиг Hue - в градусах, SatScale и ValScale - множители (1.0 - без изменений).
+    Аддитивные дельты таблицы ограничиваются correction_limits и переводятся в множители
+    по координате ячейки (см. _delta_to_scale), NaN/Inf - отсутствие коррекции.
+
+    Размер сетки не ограничен - те же данные подходят для HueSatDeltas2 и LookTable
+    (36x8x16 и больше).
 
     Args:
         interpolated_table: Результат interpolate_color_correction_*() с заполненными данными
+        out: Необязательный плоский float32 буфер, в который данные пишутся напрямую
+        table_name: Имя тега для логов (HueSatDeltas1/HueSatDeltas2/LookTable)
 
     Returns:
         np.ndarray: Плоский массив float32 для записи в DCP
     """
-
-    # Извлекаем интерполированные дельты
     hue_deltas = interpolated_table['hue_deltas']
-    sat_deltas = interpolated_table['sat_deltas']
-    val_deltas = interpolated_table['val_deltas']
-
-    # Получаем размеры сетки
     dim_x, dim_y, dim_z = hue_deltas.shape
 
-    print(f"📊 Generating HueSatDeltas1 data:")
+    print(f"📊 Generating {table_name} data:")
     print(f"   Grid dimensions: {dim_x}H × {dim_y}S × {dim_z}V")
     print(f"   Total cells: {dim_x * dim_y * dim_z}")
 
-    # Создаем плоский массив в Adobe DCP порядке
-    # Adobe порядок: для каждой HSV ячейки [delta_h, delta_s, delta_v]
-    total_values = dim_x * dim_y * dim_z * 3  # 3 значения на ячейку
-    dcp_data = np.zeros(total_values, dtype=np.float32)
-
-    # Заполняем в правильном порядке (H внешний, V внутренний)
-    index = 0
-    for h in range(dim_x):  # Hue (внешний цикл)
-        for s in range(dim_y):  # Saturation
-            for v in range(dim_z):  # Value (внутренний цикл)
-                # Записываем тройку [delta_h, delta_s, delta_v]
-                dcp_data[index] = hue_deltas[h, s, v]  # Delta Hue
-                dcp_data[index + 1] = sat_deltas[h, s, v]  # Delta Saturation
-                dcp_data[index + 2] = val_deltas[h, s, v]  # Delta Value
-                index += 3
+    # Дельты → значения DNG: NaN/Inf - нет коррекции, затем ограничения конфигурации
+    cubes = [interpolated_table[name] for name in ('hue_deltas', 'sat_deltas', 'val_deltas')]
+    invalid_count = sum(int(np.count_nonzero(~np.isfinite(cube))) for cube in cubes)
+    limits = interpolated_table['correction_limits']
+    hue_shift, sat_delta, val_delta = (
+        np.clip(np.nan_to_num(cube, nan=0.0, posinf=0.0, neginf=0.0), *limits[name])
+        for cube, name in zip(cubes, ('hue', 'sat', 'val')))
+
+    coordinate_map = interpolated_table['coordinate_map']
+    sat_scale = _delta_to_scale(sat_delta, coordinate_map['sat_coords'], axis=1)
+    val_scale = _delta_to_scale(val_delta, coordinate_map['val_coords'], axis=2)
+
+    dcp_data, _ = pack_hue_sat_deltas(hue_shift, sat_scale, val_scale, out=out)
 
     # Проверяем диапазоны (Adobe DCP спецификация)
-    hue_range = (np.min(dcp_data[0::3]), np.max(dcp_data[0::3]))
-    sat_range = (np.min(dcp_data[1::3]), np.max(dcp_data[1::3]))
-    val_range = (np.min(dcp_data[2::3]), np.max(dcp_data[2::3]))
+    triples = dcp_data.reshape(-1, 3)
+    low = triples.min(axis=0)
+    high = triples.max(axis=0)
 
-    print(f"   Hue deltas range: [{hue_range[0]:.2f}, {hue_range[1]:.2f}]")
-    print(f"   Sat deltas range: [{sat_range[0]:.3f}, {sat_range[1]:.3f}]")
-    print(f"   Val deltas range: [{val_range[0]:.3f}, {val_range[1]:.3f}]")
+    print(f"   Hue shift range: [{low[0]:.2f}, {high[0]:.2f}]")
+    print(f"   Sat scale range: [{low[1]:.3f}, {high[1]:.3f}]")
+    print(f"   Val scale range: [{low[2]:.3f}, {high[2]:.3f}]")
 
     # Получаем информацию о сценарии для логов
     scenario = interpolated_table['algorithm_params']['scenario']
@@ -847,15 +1365,12 @@ def generate_hue_sat_deltas_data(interpolated_table: Dict[str, Any]) -> np.ndarr
 
     print(f"   Scenario: {scenario}")
     print(f"   Method: {interpolation_method}")
-    print(f"   Data size: {len(dcp_data)} values ({len(dcp_data) * 4} bytes)")
+    print(f"   Data size: {dcp_data.size} values ({dcp_data.nbytes} bytes)")
 
-    # Проверяем на NaN и Inf
-    invalid_count = np.sum(~np.isfinite(dcp_data))
     if invalid_count > 0:
-        print(f"⚠️  Warning: {invalid_count} invalid values (NaN/Inf) found - replacing with 0.0")
-        dcp_data[~np.isfinite(dcp_data)] = 0.0
+        print(f"⚠️  Warning: {invalid_count} invalid values (NaN/Inf) found - replaced with 0.0")
 
-    print("✅ HueSatDeltas1 data generated successfully")
+    print(f"✅ {table_name} data generated successfully")
 
     return dcp_data
 
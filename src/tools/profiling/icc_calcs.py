@@ -0,0 +1,459 @@
+import os
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# xicclu -i: intent → A2B теги в порядке предпочтения
+ICC_INTENT_TAGS = {
+    'p': ('A2B0',),
+    'r': ('A2B1', 'A2B0'),
+    's': ('A2B2', 'A2B0'),
+    'a': ('A2B1', 'A2B0'),
+}
+
+ICC_D50 = np.array([0.9642, 1.0, 0.8249])
+
+# Число параметров parametricCurveType по типу функции
+ICC_PARA_PARAMS = {0: 1, 1: 3, 2: 4, 3: 5, 4: 7}
+
+# Точек на кривую при численном обращении TRC
+TRC_INVERSE_SAMPLES = 4096
+
+# Кодирование PCS: 16 бит legacy Lab (lut16) - 0xFF00 = 100 L*, XYZ - 0x8000 = 1.0
+LAB16_LEGACY_SCALE = 65535.0 / 65280.0
+XYZ16_SCALE = 65535.0 / 32768.0
+
+Stage = Callable[[np.ndarray], np.ndarray]
+
+
+class IccProfileError(ValueError):
+    """Профиль не читается или содержит неподдерживаемые теги."""
+
+
+def _s15f16(data, offset: int, count: int) -> np.ndarray:
+    return np.frombuffer(data, dtype='>i4', count=count, offset=offset) / 65536.0
+
+
+def _u16(data, offset: int, count: int) -> np.ndarray:
+    return np.frombuffer(data, dtype='>u2', count=count, offset=offset) / 65535.0
+
+
+def _u8(data, offset: int, count: int) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8, count=count, offset=offset) / 255.0
+
+
+def xyz_to_lab(xyz: np.ndarray, white: np.ndarray = ICC_D50) -> np.ndarray:
+    """XYZ (1.0 шкала) → Lab, построчно для (N, 3)."""
+    t = xyz / white
+    delta = 6.0 / 29.0
+    f = np.where(t > delta ** 3, np.cbrt(t), t / (3 * delta ** 2) + 4.0 / 29.0)
+    return np.column_stack([116.0 * f[:, 1] - 16.0,
+                            500.0 * (f[:, 0] - f[:, 1]),
+                            200.0 * (f[:, 1] - f[:, 2])])
+
+
+def lab_to_xyz(lab: np.ndarray, white: np.ndarray = ICC_D50) -> np.ndarray:
+    """Lab → XYZ (1.0 шкала), построчно для (N, 3)."""
+    fy = (lab[:, 0] + 16.0) / 116.0
+    f = np.column_stack([fy + lab[:, 1] / 500.0, fy, fy - lab[:, 2] / 200.0])
+    delta = 6.0 / 29.0
+    return np.where(f > delta, f ** 3, 3 * delta ** 2 * (f - 4.0 / 29.0)) * white
+
+
+# --- Кривые ---
+
+def _table_curve(table: np.ndarray) -> Stage:
+    grid = np.linspace(0.0, 1.0, len(table))
+    return lambda x: np.interp(x, grid, table)
+
+
+def _parametric_curve(function_type: int, params: np.ndarray) -> Stage:
+    g = params[0]
+    if function_type == 0:
+        return lambda x: np.power(np.clip(x, 0.0, None), g)
+
+    a, b = params[1], params[2]
+    c = params[3] if function_type >= 2 else 0.0
+    if function_type in (1, 2):
+        threshold = -b / a
+        return lambda x: np.where(x >= threshold, np.power(np.clip(a * x + b, 0.0, None), g) + c, c)
+
+    d = params[4]
+    e = params[5] if function_type == 4 else 0.0
+    f = params[6] if function_type == 4 else 0.0
+    return lambda x: np.where(x >= d, np.power(np.clip(a * x + b, 0.0, None), g) + e, c * x + f)
+
+
+def _read_curve(data, offset: int) -> Tuple[Stage, int]:
+    """
+    curveType / parametricCurveType по смещению.
+
+    Returns:
+        (кривая [0, 1] → [0, 1], размер элемента в байтах без выравнивания)
+    """
+    sig = bytes(data[offset:offset + 4])
+    if sig == b'curv':
+        count = struct.unpack_from('>I', data, offset + 8)[0]
+        if count == 0:
+            curve = lambda x: x
+        elif count == 1:
+            gamma = struct.unpack_from('>H', data, offset + 12)[0] / 256.0
+            curve = lambda x: np.power(np.clip(x, 0.0, None), gamma)
+        else:
+            curve = _table_curve(_u16(data, offset + 12, count))
+        return curve, 12 + 2 * count
+
+    if sig == b'para':
+        function_type = struct.unpack_from('>H', data, offset + 8)[0]
+        if function_type not in ICC_PARA_PARAMS:
+            raise IccProfileError(f"Unsupported parametric curve type {function_type}")
+        n_params = ICC_PARA_PARAMS[function_type]
+        return _parametric_curve(function_type, _s15f16(data, offset + 12, n_params)), 12 + 4 * n_params
+
+    raise IccProfileError(f"Unsupported curve type {sig!r}")
+
+
+def _read_curve_set(data, offset: int, count: int) -> List[Stage]:
+    """Последовательность кривых lutAtoB (каждая выровнена на 4 байта)."""
+    curves = []
+    for _ in range(count):
+        curve, size = _read_curve(data, offset)
+        curves.append(curve)
+        offset += (size + 3) & ~3
+    return curves
+
+
+def _curves_stage(curves: List[Stage]) -> Stage:
+    return lambda x: np.column_stack([curve(x[:, i]) for i, curve in enumerate(curves)])
+
+
+# --- CLUT ---
+
+def clut_interpolator(grid: Tuple[int, ...], table: np.ndarray, interpolation: str) -> Stage:
+    """
+    Интерполяция многомерной таблицы: (N, len(grid)) [0, 1] → (N, outputs).
+
+    table - (prod(grid), outputs), первый вход меняется медленнее всех (порядок ICC).
+    'tetrahedral' - симплексная интерполяция (n + 1 узлов), 'trilinear' - мультилинейная (2^n).
+    """
+    grid = np.asarray(grid)
+    n_inputs = len(grid)
+    strides = np.ones(n_inputs, dtype=np.intp)
+    for i in range(n_inputs - 2, -1, -1):
+        strides[i] = strides[i + 1] * grid[i + 1]
+
+    def locate(x):
+        position = np.clip(x, 0.0, 1.0) * (grid - 1)
+        cell = np.minimum(position.astype(np.intp), np.maximum(grid - 2, 0))
+        return cell @ strides, position - cell
+
+    if interpolation == 'trilinear':
+        corners = [np.array([(k >> (n_inputs - 1 - i)) & 1 for i in range(n_inputs)]) for k in range(2 ** n_inputs)]
+
+        def evaluate(x):
+            base, frac = locate(x)
+            result = 0.0
+            for corner in corners:
+                weight = np.prod(np.where(corner, frac, 1.0 - frac), axis=1)
+                result = result + weight[:, None] * table[base + corner @ strides]
+            return result
+
+        return evaluate
+
+    if interpolation != 'tetrahedral':
+        raise ValueError(f"Unknown interpolation: {interpolation}")
+
+    def evaluate(x):
+        base, frac = locate(x)
+        # Обход вершин симплекса по убыванию дробных частей
+        order = np.argsort(-frac, axis=1, kind='stable')
+        sorted_frac = np.take_along_axis(frac, order, axis=1)
+        index = base
+        previous = table[index]
+        result = previous.copy()
+        for k in range(n_inputs):
+            index = index + strides[order[:, k]]
+            current = table[index]
+            result += sorted_frac[:, k, None] * (current - previous)
+            previous = current
+        return result
+
+    return evaluate
+
+
+# --- Профиль ---
+
+class IccProfile:
+    """
+    ICC профиль для вычисления device → PCS (A2B теги или matrix/TRC) над (N, channels) массивами.
+
+    Поддерживаются lut8 (mft1), lut16 (mft2), lutAtoB (mAB ) и matrix/TRC (rXYZ.., rTRC..).
+    Собранные конвейеры кэшируются по (intent, interpolation).
+    """
+
+    def __init__(self, data: bytes, filename: Optional[str] = None):
+        self.filename = filename
+        self.data = data
+        if len(data) < 132 or data[36:40] != b'acsp':
+            raise IccProfileError("Not an ICC profile")
+
+        self.version = data[8]
+        self.device_class = data[12:16].decode('ascii', 'replace')
+        self.colour_space = data[16:20].decode('ascii', 'replace').strip()
+        self.pcs = data[20:24].decode('ascii', 'replace').strip()
+        self.illuminant = _s15f16(data, 68, 3)
+
+        tag_count = struct.unpack_from('>I', data, 128)[0]
+        self.tags: Dict[str, Tuple[int, int]] = {}
+        for i in range(tag_count):
+            sig, offset, size = struct.unpack_from('>4sII', data, 132 + 12 * i)
+            self.tags[sig.decode('ascii', 'replace')] = (offset, size)
+
+        self._pipelines: Dict[Tuple[str, str], Tuple[Stage, str]] = {}
+        self._inverse: Optional[Stage] = None
+
+    def _tag(self, sig: str) -> memoryview:
+        offset, size = self.tags[sig]
+        return memoryview(self.data)[offset:offset + size]
+
+    def _xyz_tag(self, sig: str) -> np.ndarray:
+        data = self._tag(sig)
+        if bytes(data[:4]) != b'XYZ ':
+            raise IccProfileError(f"Tag {sig} is not XYZType")
+        return _s15f16(data, 8, 3)
+
+    @property
+    def media_white(self) -> np.ndarray:
+        return self._xyz_tag('wtpt') if 'wtpt' in self.tags else self.illuminant
+
+    # --- Сборка конвейера ---
+
+    def _has_matrix_trc(self) -> bool:
+        return all(sig in self.tags for sig in ('rXYZ', 'gXYZ', 'bXYZ', 'rTRC', 'gTRC', 'bTRC'))
+
+    def _matrix_trc_pipeline(self) -> Tuple[Stage, str]:
+        matrix = np.column_stack([self._xyz_tag(sig) for sig in ('rXYZ', 'gXYZ', 'bXYZ')])
+        curves = _curves_stage([_read_curve(self._tag(sig), 0)[0] for sig in ('rTRC', 'gTRC', 'bTRC')])
+        return (lambda x: curves(x) @ matrix.T), 'XYZ'
+
+    def _inverse_matrix_trc_pipeline(self) -> Stage:
+        """PCS XYZ → device для matrix/TRC: обратная матрица и численно обращенные TRC."""
+        if not self._has_matrix_trc():
+            raise IccProfileError("Only matrix/TRC profiles can be used as output (no B2A support)")
+        matrix = np.column_stack([self._xyz_tag(sig) for sig in ('rXYZ', 'gXYZ', 'bXYZ')])
+        inverse = np.linalg.inv(matrix)
+
+        grid = np.linspace(0.0, 1.0, TRC_INVERSE_SAMPLES)
+        inverse_curves = []
+        for sig in ('rTRC', 'gTRC', 'bTRC'):
+            # Монотонная огибающая - np.interp требует неубывающие x
+            values = np.maximum.accumulate(_read_curve(self._tag(sig), 0)[0](grid))
+            inverse_curves.append(lambda y, values=values: np.interp(y, values, grid))
+        curves = _curves_stage(inverse_curves)
+        return lambda xyz: curves(np.clip(xyz @ inverse.T, 0.0, 1.0))
+
+    def _lut_pipeline(self, data: memoryview, interpolation: str) -> Tuple[Stage, str]:
+        """lut8/lut16: входные кривые → CLUT → выходные кривые (матрица только для XYZ входа)."""
+        is_lut16 = bytes(data[:4]) == b'mft2'
+        n_in, n_out, n_grid = data[8], data[9], data[10]
+        if is_lut16:
+            n_in_entries, n_out_entries = struct.unpack_from('>HH', data, 48)
+            read, offset = _u16, 52
+        else:
+            n_in_entries = n_out_entries = 256
+            read, offset = _u8, 48
+
+        width = 2 if is_lut16 else 1
+        input_curves = []
+        for _ in range(n_in):
+            input_curves.append(_table_curve(read(data, offset, n_in_entries)))
+            offset += n_in_entries * width
+
+        n_clut = n_grid ** n_in
+        clut = read(data, offset, n_clut * n_out).reshape(n_clut, n_out)
+        offset += n_clut * n_out * width
+
+        output_curves = []
+        for _ in range(n_out):
+            output_curves.append(_table_curve(read(data, offset, n_out_entries)))
+            offset += n_out_entries * width
+
+        stages = [_curves_stage(input_curves), clut_interpolator((n_grid,) * n_in, clut, interpolation),
+                  _curves_stage(output_curves)]
+        encoding = 'lab16_legacy' if is_lut16 else 'lab8'
+        return _chain(stages), encoding
+
+    def _lut_atob_pipeline(self, data: memoryview, interpolation: str) -> Tuple[Stage, str]:
+        """lutAtoB: A кривые → CLUT → M кривые → матрица → B кривые."""
+        n_in, n_out = data[8], data[9]
+        b_offset, matrix_offset, m_offset, clut_offset, a_offset = struct.unpack_from('>5I', data, 12)
+
+        stages = []
+        if a_offset:
+            stages.append(_curves_stage(_read_curve_set(data, a_offset, n_in)))
+        if clut_offset:
+            grid = tuple(data[clut_offset:clut_offset + n_in])
+            precision = data[clut_offset + 16]
+            n_clut = int(np.prod(grid))
+            read = _u16 if precision == 2 else _u8
+            clut = read(data, clut_offset + 20, n_clut * n_out).reshape(n_clut, n_out)
+            stages.append(clut_interpolator(grid, clut, interpolation))
+        elif n_in != n_out:
+            raise IccProfileError("lutAtoB without CLUT must have equal input/output channels")
+        if m_offset:
+            stages.append(_curves_stage(_read_curve_set(data, m_offset, n_out)))
+        if matrix_offset:
+            values = _s15f16(data, matrix_offset, 12)
+            matrix, bias = values[:9].reshape(3, 3), values[9:]
+            stages.append(lambda x: x @ matrix.T + bias)
+        if b_offset:
+            stages.append(_curves_stage(_read_curve_set(data, b_offset, n_out)))
+        return _chain(stages), 'pcs_v4'
+
+    def pipeline(self, intent: str = 'r', interpolation: str = 'tetrahedral') -> Tuple[Stage, str]:
+        """
+        Конвейер device [0, 1] → PCS для intent (xicclu -i: p, r, s, a).
+
+        Returns:
+            (stage, encoding): encoding - 'XYZ' (значения PCS) или кодирование
+            выхода LUT ('lab16_legacy', 'lab8', 'pcs_v4'), см. _decode_pcs
+        """
+        key = (intent, interpolation)
+        if key in self._pipelines:
+            return self._pipelines[key]
+
+        if intent not in ICC_INTENT_TAGS:
+            raise ValueError(f"Unknown intent: {intent}")
+
+        pipeline = None
+        for sig in ICC_INTENT_TAGS[intent]:
+            if sig not in self.tags:
+                continue
+            data = self._tag(sig)
+            kind = bytes(data[:4])
+            if kind in (b'mft1', b'mft2'):
+                pipeline = self._lut_pipeline(data, interpolation)
+            elif kind == b'mAB ':
+                pipeline = self._lut_atob_pipeline(data, interpolation)
+            else:
+                raise IccProfileError(f"Unsupported {sig} tag type {kind!r}")
+            break
+
+        if pipeline is None:
+            if not self._has_matrix_trc():
+                raise IccProfileError("Profile has neither A2B tags nor matrix/TRC")
+            pipeline = self._matrix_trc_pipeline()
+
+        self._pipelines[key] = pipeline
+        return pipeline
+
+    def _decode_pcs(self, values: np.ndarray, encoding: str) -> Tuple[np.ndarray, str]:
+        """Выход конвейера → (XYZ 1.0 шкала или Lab, 'XYZ' / 'Lab')."""
+        if encoding == 'XYZ':
+            return values, 'XYZ'
+        if self.pcs == 'XYZ':
+            return values * XYZ16_SCALE, 'XYZ'
+        scale = LAB16_LEGACY_SCALE if encoding == 'lab16_legacy' else 1.0
+        return np.column_stack([values[:, 0] * 100.0 * scale,
+                                values[:, 1] * 255.0 * scale - 128.0,
+                                values[:, 2] * 255.0 * scale - 128.0]), 'Lab'
+
+    def evaluate(self, device: np.ndarray, intent: str = 'r', pcs: str = 'lab',
+                 interpolation: str = 'tetrahedral') -> np.ndarray:
+        """
+        Device значения → PCS (аналог xicclu -f f -i<intent> -p<l|x>).
+
+        Args:
+            device: (N, channels) в диапазоне 0..1
+            intent: 'p', 'r', 's' или 'a' (absolute - масштабирование на белую точку носителя)
+            pcs: 'lab' - Lab D50, 'xyz' - XYZ (Y белого = 100, как xicclu -px)
+            interpolation: 'tetrahedral' или 'trilinear' для CLUT
+
+        Returns:
+            (N, 3) float64
+        """
+        device = np.atleast_2d(np.asarray(device, dtype=np.float64))
+        stage, encoding = self.pipeline(intent, interpolation)
+        values, space = self._decode_pcs(stage(np.clip(device, 0.0, 1.0)), encoding)
+
+        if intent == 'a' or pcs == 'xyz':
+            xyz = values if space == 'XYZ' else lab_to_xyz(values, self.illuminant)
+            if intent == 'a':
+                xyz = xyz * (self.media_white / self.illuminant)
+            return xyz * 100.0 if pcs == 'xyz' else xyz_to_lab(xyz, self.illuminant)
+
+        return values if space == 'Lab' else xyz_to_lab(values, self.illuminant)
+
+    def pcs_to_device(self, xyz: np.ndarray, intent: str = 'r') -> np.ndarray:
+        """
+        PCS XYZ (1.0 шкала) → device 0..1, только matrix/TRC профили (выходной профиль).
+
+        Args:
+            xyz: (N, 3) XYZ в PCS
+            intent: 'a' - absolute (масштабирование с белой точки носителя), иначе relative
+
+        Raises:
+            IccProfileError: профиль без matrix/TRC
+        """
+        if self._inverse is None:
+            self._inverse = self._inverse_matrix_trc_pipeline()
+        xyz = np.atleast_2d(np.asarray(xyz, dtype=np.float64))
+        if intent == 'a':
+            xyz = xyz * (self.illuminant / self.media_white)
+        return self._inverse(xyz)
+
+
+def _chain(stages: List[Stage]) -> Stage:
+    def evaluate(x):
+        for stage in stages:
+            x = stage(x)
+        return x
+    return evaluate
+
+
+# Профили: path -> (mtime_ns, size, IccProfile)
+_icc_cache = {}
+
+
+def clear_icc_cache():
+    """Drop all cached ICC profiles."""
+    _icc_cache.clear()
+
+
+def load_icc_profile(filename: str) -> IccProfile:
+    """
+    Прочитать ICC профиль, с кэшем по времени изменения и размеру файла.
+
+    Raises:
+        OSError: файл не читается
+        IccProfileError: файл не ICC профиль
+    """
+    stat = os.stat(filename)
+    key = os.path.abspath(filename)
+    cached = _icc_cache.get(key)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(filename, 'rb') as f:
+        profile = IccProfile(f.read(), filename)
+    _icc_cache[key] = (stat.st_mtime_ns, stat.st_size, profile)
+    return profile
+
+
+def evaluate_icc(filename: str, device: np.ndarray, scale: float = 1.0, intent: str = 'r',
+                 pcs: str = 'lab', interpolation: str = 'tetrahedral') -> np.ndarray:
+    """
+    Вычислить device → PCS по профилю в процессе (замена xicclu -s<scale> -i<intent> -p<pcs>).
+
+    Args:
+        filename: путь к ICC профилю
+        device: (N, channels) device значения в шкале scale
+        scale: максимум device значений (xicclu -s, например 255)
+        intent, pcs, interpolation: см. IccProfile.evaluate
+
+    Returns:
+        (N, 3) Lab или XYZ
+    """
+    device = np.asarray(device, dtype=np.float64) / scale
+    return load_icc_profile(filename).evaluate(device, intent, pcs, interpolation)
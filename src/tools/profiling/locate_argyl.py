@@ -1,5 +1,7 @@
 import os
 import sys
+import json
+import shutil
 from pathlib import Path
 import glob
 from PySide6.QtWidgets import QApplication, QFileDialog, QMessageBox
@@ -11,7 +13,199 @@ def tr(text):
     return text
 
 
+# Argyll tools and reference files resolved into the registry
+ARGYLL_TOOLS = ("targen", "printtarg", "scanin", "txt2ti3", "colprof", "cctiff", "xicclu")
+ARGYLL_REFERENCE_FILES = ("sRGB.icm",)
+
+ARGYLL_REGISTRY_VERSION = 1
+CONFIG_DIR_NAME = "flab-DIY-stack"
+ARGYLL_REGISTRY_FILE = "argyll_tools.json"
+
+# Registry loaded from the user config: {'argyll_dir', 'tools', 'references'}
+_registry = None
+
+
+def _tool_filename(name):
+    return name + ".exe" if sys.platform == "win32" else name
+
+
+def get_user_config_dir():
+    """Per-user configuration directory (APPDATA / ~/Library/Application Support / XDG_CONFIG_HOME)"""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or str(Path.home() / "AppData" / "Roaming")
+    elif sys.platform == "darwin":
+        base = str(Path.home() / "Library" / "Application Support")
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or str(Path.home() / ".config")
+    return os.path.join(base, CONFIG_DIR_NAME)
+
+
+def _registry_path():
+    return os.path.join(get_user_config_dir(), ARGYLL_REGISTRY_FILE)
+
+
+def _file_entry(path):
+    """{'path', 'mtime_ns'} for an existing file, else None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"path": os.path.abspath(path), "mtime_ns": stat.st_mtime_ns}
+
+
+def _entry_valid(entry):
+    """Entry still points to the same file (one stat, no directory scans)"""
+    if not entry:
+        return False
+    try:
+        return os.stat(entry["path"]).st_mtime_ns == entry["mtime_ns"]
+    except (OSError, KeyError, TypeError):
+        return False
+
+
+def _load_registry():
+    global _registry
+    if _registry is not None:
+        return _registry
+    _registry = {}
+    try:
+        with open(_registry_path(), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == ARGYLL_REGISTRY_VERSION:
+            _registry = data
+    except (OSError, ValueError):
+        pass
+    return _registry
+
+
+def _save_registry(registry):
+    global _registry
+    _registry = registry
+    path = _registry_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(registry, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(tr("Could not save Argyll tool registry: {}").format(e))
+
+
+def register_argyll_directory(argyll_dir):
+    """
+    Resolve all Argyll tools and reference files of an installation and store them in the
+    user config.
+
+    Args:
+        argyll_dir: Argyll bin directory
+
+    Returns:
+        dict: registry {'version', 'argyll_dir', 'tools': {name: entry}, 'references': {name: entry}}
+    """
+    argyll_dir = os.path.abspath(argyll_dir)
+    ref_dir = os.path.join(os.path.dirname(argyll_dir), "ref")
+
+    tools = {}
+    for name in ARGYLL_TOOLS:
+        entry = _file_entry(os.path.join(argyll_dir, _tool_filename(name)))
+        if entry:
+            tools[name] = entry
+
+    references = {}
+    for name in ARGYLL_REFERENCE_FILES:
+        entry = _file_entry(os.path.join(ref_dir, name))
+        if entry:
+            references[name] = entry
+
+    registry = {
+        "version": ARGYLL_REGISTRY_VERSION,
+        "argyll_dir": argyll_dir,
+        "tools": tools,
+        "references": references
+    }
+    _save_registry(registry)
+    return registry
+
+
+def clear_argyll_registry():
+    """Forget resolved locations; the next lookup scans again."""
+    global _registry
+    _registry = None
+    try:
+        os.remove(_registry_path())
+    except OSError:
+        pass
+
+
+def _registered_argyll_directory():
+    """Argyll directory from the registry if its targen is unchanged"""
+    registry = _load_registry()
+    if registry.get("argyll_dir") and _entry_valid(registry.get("tools", {}).get("targen")):
+        return registry["argyll_dir"]
+    return None
+
+
+def _refresh_registry():
+    """Rescan installation locations and rebuild the registry (None if Argyll not found)"""
+    argyll_dir = _scan_argyll_directory()
+    if argyll_dir:
+        return register_argyll_directory(argyll_dir)
+    return None
+
+
+def _lookup(section, name):
+    """
+    Registry entry path; rescans only if the entry is stale or the registered
+    installation is gone (a file the installation simply lacks does not trigger a scan).
+    """
+    entry = _load_registry().get(section, {}).get(name)
+    if _entry_valid(entry):
+        return entry["path"]
+
+    if entry is None and _registered_argyll_directory() is not None:
+        return None
+
+    registry = _refresh_registry()
+    if registry and name in registry[section]:
+        return registry[section][name]["path"]
+    return None
+
+
+def get_argyll_tool(name):
+    """
+    Full path of an Argyll tool from the registry.
+
+    Stale or missing entries trigger one rescan; tools outside the registered installation
+    fall back to PATH lookup.
+
+    Returns:
+        str or None
+    """
+    return _lookup("tools", name) or shutil.which(name)
+
+
+def get_argyll_reference(name="sRGB.icm"):
+    """
+    Full path of an Argyll reference file (<argyll>/ref/<name>) from the registry.
+
+    Returns:
+        str or None
+    """
+    return _lookup("references", name)
+
+
 def _find_argyll_directory():
+    """Argyll directory from the tool registry, scanning install locations only when it is stale"""
+    argyll_dir = _registered_argyll_directory()
+    if argyll_dir:
+        return argyll_dir
+
+    registry = _refresh_registry()
+    return registry["argyll_dir"] if registry else None
+
+
+def _scan_argyll_directory():
     """Search for Argyll directory cross-platform"""
 
     # Determine executable file by platform
@@ -131,6 +325,7 @@ def get_argyll_directory():
             )
             continue
 
+        register_argyll_directory(str(argyll_path))
         return str(argyll_path)
 
 # Usage
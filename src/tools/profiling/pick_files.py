@@ -68,6 +68,14 @@ open_filters = {
     'raw': {
         'open_caption': "Select a raw image...",
         'filter': get_raw_filters_string()
+    },
+    'lut_source': {
+        'open_caption': "Pick a profile to bake into LUT",
+        'filter': "ICC Profiles (*.icc *.icm);;DCP Profiles (*.dcp)"
+    },
+    'cube': {
+        'save_caption': "Save .cube LUT as...",
+        'filter': "Cube LUT files (*.cube)"
     }
 
 }
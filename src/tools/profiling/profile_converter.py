@@ -0,0 +1,366 @@
+import glob
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import tifffile
+
+from icc_calcs import IccProfileError, clut_interpolator, load_icc_profile
+
+# Узлов на ось device link таблицы (33^3 ≈ 36k вычислений профиля)
+DEVICE_LINK_GRID = 33
+
+# Строк изображения на одну порцию обработки
+TILE_ROWS = 256
+
+# Default command template configuration (cctiff)
+DEFAULT_COMMAND_CONFIG = {
+    "executable": "cctiff",
+    "base_args": ["-v", "-p", "-f", "T", "-N"],
+    "profile_args": ["-i", "r"],
+    "srgb_args": ["-i", "a"],
+    "timeout": 300
+}
+
+# Статусы файлов в отчете convert_tiff_batch
+STATUS_DONE = 'done'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+# (completed, total, source, status)
+ProgressCallback = Callable[[int, int, str, str], None]
+
+
+class ConversionCancelled(Exception):
+    """Конвертация прервана через cancel_event."""
+
+
+def output_filename(source_file: str, profile_file: str) -> str:
+    """Имя результата: <source>_<profile>.tif"""
+    source_name = os.path.splitext(os.path.basename(source_file))[0]
+    profile_name = os.path.splitext(os.path.basename(profile_file))[0]
+    return f"{source_name}_{profile_name}.tif"
+
+
+def _partial_path(output_path: str) -> str:
+    """Временный файл рядом с результатом; расширение сохраняется для cctiff."""
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.part{ext or '.tif'}"
+
+
+def expand_sources(sources: Union[str, Iterable[str]]) -> List[str]:
+    """
+    Список файлов и/или glob шаблонов → отсортированные существующие пути без повторов.
+
+    Args:
+        sources: путь, шаблон ('roll_01/*.tif') или их последовательность
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+
+    found = []
+    seen = set()
+    for pattern in sources:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            key = os.path.abspath(path)
+            if key not in seen and os.path.isfile(path):
+                seen.add(key)
+                found.append(path)
+    return found
+
+
+def is_up_to_date(output_path: str, *inputs: str) -> bool:
+    """Результат существует и не старше ни одного из входных файлов."""
+    try:
+        output_mtime = os.stat(output_path).st_mtime_ns
+        return all(os.stat(path).st_mtime_ns <= output_mtime for path in inputs)
+    except OSError:
+        return False
+
+
+# --- Device link ---
+
+# (input, output, intents, grid) -> (ключ файлов, интерполятор)
+_device_link_cache = {}
+
+
+def clear_device_link_cache():
+    """Drop all cached device link tables."""
+    _device_link_cache.clear()
+
+
+def _file_key(filename: str) -> Tuple[int, int]:
+    stat = os.stat(filename)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def build_device_link(input_profile: str, output_profile: str, input_intent: str = 'r',
+                      output_intent: str = 'a', grid: int = DEVICE_LINK_GRID):
+    """
+    Свести пару профилей в 3D таблицу device → device (аналог cctiff -i<in> in.icm -i<out> out.icm).
+
+    Таблица считается один раз на пару профилей (кэш по mtime/размеру файлов),
+    дальше каждый пиксель - тетраэдральная интерполяция без вызова конвейеров ICC.
+
+    Args:
+        input_profile: RGB профиль сканера/бумаги (A2B или matrix/TRC)
+        output_profile: matrix/TRC профиль вывода (sRGB)
+        input_intent: intent входного профиля (xicclu -i)
+        output_intent: 'a' - absolute по белой точке выходного профиля, иначе relative
+        grid: узлов на ось
+
+    Returns:
+        функция (N, 3) device 0..1 → (N, 3) device 0..1
+
+    Raises:
+        IccProfileError: профиль не поддерживается (например, выход без matrix/TRC)
+    """
+    key = (os.path.abspath(input_profile), os.path.abspath(output_profile), input_intent, output_intent, grid)
+    files = (_file_key(input_profile), _file_key(output_profile))
+    cached = _device_link_cache.get(key)
+    if cached is not None and cached[0] == files:
+        return cached[1]
+
+    source = load_icc_profile(input_profile)
+    target = load_icc_profile(output_profile)
+    if source.colour_space != 'RGB':
+        raise IccProfileError(f"Input profile colour space {source.colour_space} is not RGB")
+
+    # Узлы в порядке ICC: первый канал меняется медленнее всех
+    axis = np.linspace(0.0, 1.0, grid)
+    nodes = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1).reshape(-1, 3)
+    xyz = source.evaluate(nodes, input_intent, pcs='xyz') / 100.0
+    table = target.pcs_to_device(xyz, output_intent)
+
+    interpolator = clut_interpolator((grid,) * 3, table, 'tetrahedral')
+    _device_link_cache[key] = (files, interpolator)
+    return interpolator
+
+
+# --- Применение к TIFF ---
+
+def _open_image(path: str) -> np.ndarray:
+    """TIFF как (H, W, C): memmap для несжатых файлов, иначе чтение целиком."""
+    try:
+        image = tifffile.memmap(path, mode='r')
+    except ValueError:
+        image = tifffile.imread(path)
+
+    # Планарное хранение (C, H, W) - вид без копирования
+    if image.ndim == 3 and image.shape[0] in (3, 4) and image.shape[-1] not in (3, 4):
+        image = np.moveaxis(image, 0, -1)
+    if image.ndim != 3 or image.shape[-1] < 3:
+        raise ValueError(f"Expected RGB image, got shape {image.shape}")
+    return image
+
+
+def _value_range(dtype: np.dtype) -> float:
+    if np.issubdtype(dtype, np.integer):
+        return float(np.iinfo(dtype).max)
+    return 1.0
+
+
+def apply_device_link(source_path: str, output_path: str, transform,
+                      tile_rows: int = TILE_ROWS,
+                      cancel_event: Optional[threading.Event] = None):
+    """
+    Применить device link к TIFF полосами по tile_rows строк.
+
+    Вход и выход отображаются в память, поэтому пиковое потребление -
+    одна полоса в float64. Каналы сверх RGB (альфа) копируются без изменений.
+    Результат пишется во временный файл и переименовывается по завершении.
+
+    Raises:
+        ConversionCancelled: установлен cancel_event
+    """
+    image = _open_image(source_path)
+    height, width, channels = image.shape
+    max_value = _value_range(image.dtype)
+
+    partial_path = _partial_path(output_path)
+    output = tifffile.memmap(partial_path, shape=(height, width, channels), dtype=image.dtype,
+                             photometric='rgb', extrasamples=[2] * (channels - 3) or None)
+    try:
+        for top in range(0, height, tile_rows):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ConversionCancelled(source_path)
+
+            strip = image[top:top + tile_rows]
+            rgb = strip[..., :3].reshape(-1, 3) / max_value
+            result = transform(rgb) * max_value
+            if np.issubdtype(image.dtype, np.integer):
+                result = np.clip(np.rint(result), 0, max_value)
+
+            output[top:top + tile_rows, :, :3] = result.reshape(strip.shape[:2] + (3,))
+            if channels > 3:
+                output[top:top + tile_rows, :, 3:] = strip[..., 3:]
+
+        output.flush()
+    except BaseException:
+        del output
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    # Закрыть отображение до переименования (Windows)
+    del output
+    os.replace(partial_path, output_path)
+
+
+def build_cctiff_command(source_file: str, profile_file: str, srgb_profile: str, output_path: str,
+                         command_config: Dict[str, Any]) -> List[str]:
+    """
+    Команда cctiff по конфигурации ConvertToProfileDialog.
+
+    Returns:
+        список аргументов для subprocess
+    """
+    from locate_argyl import get_argyll_tool
+
+    executable = command_config.get("executable", "cctiff")
+    # Bare tool name - full path from the Argyll tool registry
+    if not os.path.dirname(executable):
+        executable = get_argyll_tool(executable) or executable
+
+    cmd = [executable]
+    cmd.extend(command_config.get("base_args", []))
+    cmd.extend(command_config.get("profile_args", ["-i", "r"]))
+    cmd.append(profile_file)
+    cmd.extend(command_config.get("srgb_args", ["-i", "a"]))
+    cmd.append(srgb_profile)
+    cmd.append(source_file)
+    cmd.append(output_path)
+    return cmd
+
+
+def _intent_arg(args: Sequence[str], default: str) -> str:
+    """Значение '-i x' из аргументов cctiff."""
+    args = list(args)
+    if "-i" in args and args.index("-i") + 1 < len(args):
+        return args[args.index("-i") + 1]
+    return default
+
+
+def _convert_external(jobs: List[Tuple[str, str]], profile_file: str, srgb_profile: str,
+                      command_config: Dict[str, Any], report, cancel_event) -> None:
+    """Запасной путь: cctiff через общий планировщик фоновых задач."""
+    from background_process import get_job_scheduler
+
+    scheduler = get_job_scheduler()
+    timeout = command_config.get("timeout", 300)
+    submitted = {}
+    for source, output_path in jobs:
+        cmd = build_cctiff_command(source, profile_file, srgb_profile, _partial_path(output_path), command_config)
+        job = scheduler.submit(cmd, timeout=timeout, name=os.path.basename(source))
+        submitted[job.future] = (job, source, output_path)
+
+    remaining = set(submitted)
+    cancelled = False
+    while remaining:
+        done, remaining = wait(remaining, timeout=0.2, return_when=FIRST_COMPLETED)
+        if not cancelled and cancel_event is not None and cancel_event.is_set():
+            cancelled = True
+            for job, _, _ in submitted.values():
+                job.cancel()
+
+        for future in done:
+            job, source, output_path = submitted[future]
+            partial_path = _partial_path(output_path)
+            try:
+                return_code, stdout, stderr = future.result()
+                if return_code != 0:
+                    raise RuntimeError(f"cctiff failed with return code {return_code}: {stderr.strip()}")
+                os.replace(partial_path, output_path)
+                report(source, output_path, STATUS_DONE)
+            except Exception as e:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                report(source, output_path, STATUS_CANCELLED if cancelled else STATUS_FAILED, str(e))
+
+
+def convert_tiff_batch(sources: Union[str, Iterable[str]], profile_file: str, srgb_profile: str,
+                       output_dir: str, command_config: Optional[Dict[str, Any]] = None,
+                       workers: Optional[int] = None, progress: Optional[ProgressCallback] = None,
+                       cancel_event: Optional[threading.Event] = None, resume: bool = True,
+                       tile_rows: int = TILE_ROWS) -> List[Dict[str, Any]]:
+    """
+    Применить профиль + sRGB к набору TIFF параллельно.
+
+    Основной путь - в процессе: device link таблица по паре профилей и
+    тетраэдральная интерполяция полосами по memory-mapped файлам, файлы
+    обрабатываются пулом потоков (numpy отпускает GIL). Если профиль не
+    поддерживается icc_calcs, файлы уходят в cctiff через планировщик задач.
+
+    Повторный запуск пропускает готовые результаты (не старше исходника и
+    профилей), недописанные файлы (*.part.tif) пересоздаются.
+
+    Args:
+        sources: файлы и/или glob шаблоны
+        profile_file: входной профиль (бумага/сканер)
+        srgb_profile: выходной профиль
+        output_dir: папка результатов
+        command_config: конфигурация cctiff (intents и запасной путь), см. DEFAULT_COMMAND_CONFIG
+        workers: размер пула (по умолчанию min(4, cpu))
+        progress: callback(completed, total, source, status), вызывается из рабочих потоков
+        cancel_event: установка прерывает обработку между полосами
+        resume: пропускать актуальные результаты
+        tile_rows: строк в полосе
+
+    Returns:
+        [{'source', 'output', 'status', 'error'}] в порядке источников
+    """
+    command_config = command_config or DEFAULT_COMMAND_CONFIG
+    files = expand_sources(sources)
+    total = len(files)
+    results: Dict[str, Dict[str, Any]] = {}
+    lock = threading.Lock()
+
+    def report(source: str, output_path: str, status: str, error: Optional[str] = None):
+        with lock:
+            results[source] = {'source': source, 'output': output_path, 'status': status, 'error': error}
+            completed = len(results)
+        if status == STATUS_FAILED:
+            print(f"Conversion failed: {source}: {error}")
+        if progress is not None:
+            progress(completed, total, source, status)
+
+    pending = []
+    for source in files:
+        output_path = os.path.join(output_dir, output_filename(source, profile_file))
+        if resume and is_up_to_date(output_path, source, profile_file, srgb_profile):
+            report(source, output_path, STATUS_SKIPPED)
+        else:
+            pending.append((source, output_path))
+
+    try:
+        transform = build_device_link(
+            profile_file, srgb_profile,
+            input_intent=_intent_arg(command_config.get("profile_args", []), 'r'),
+            output_intent=_intent_arg(command_config.get("srgb_args", []), 'a'))
+    except IccProfileError as e:
+        print(f"In-process conversion unavailable ({e}), using cctiff")
+        _convert_external(pending, profile_file, srgb_profile, command_config, report, cancel_event)
+        return [results[source] for source in files]
+
+    def convert_one(source: str, output_path: str):
+        if cancel_event is not None and cancel_event.is_set():
+            report(source, output_path, STATUS_CANCELLED)
+            return
+        try:
+            apply_device_link(source, output_path, transform, tile_rows, cancel_event)
+            report(source, output_path, STATUS_DONE)
+        except ConversionCancelled:
+            report(source, output_path, STATUS_CANCELLED)
+        except Exception as e:
+            report(source, output_path, STATUS_FAILED, str(e))
+
+    workers = workers or min(4, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tiff-convert") as pool:
+        for future in [pool.submit(convert_one, source, output_path) for source, output_path in pending]:
+            future.result()
+
+    return [results[source] for source in files]
@@ -1,3 +1,5 @@
+import os
+from functools import lru_cache
 from const import GENERIC_OK, GENERIC_ERROR
 
 def tr(text):
@@ -8,10 +10,10 @@ def tr(text):
 import numpy as np
 
 def parse_cht_file(filename):
-    status, result = read_cht_file(filename)
+    status, columns = read_cht_columns(filename)
     if status != GENERIC_OK:
         return status, []
-    rez, cht_data = prepare_cht_data(result['patches'], result['corner'])
+    rez, cht_data = prepare_cht_columns(columns)
     return rez, cht_data
 
 def prepare_cht_data(patches, corner):
@@ -25,36 +27,59 @@ def prepare_cht_data(patches, corner):
     Returns:
         data: Dictionary with patch and grid data
     """
+    names = list(patches.keys())
+    origins = np.array([p['patch_point'] for p in patches.values()], dtype=np.float64).reshape(-1, 2)
+    sizes = np.array([p['patch_size'] for p in patches.values()], dtype=np.float64).reshape(-1, 2)
+    xyz_dicts = [p['xyz'] for p in patches.values()]
+    xyz = np.array([[d['X'], d['Y'], d['Z']] for d in xyz_dicts], dtype=np.float64).reshape(-1, 3)
+
+    return _build_cht_data(names, origins, sizes, xyz, xyz_dicts, corner,
+                           find_corner_patches(names, origins))
+
+
+def prepare_cht_columns(columns):
+    """
+    Calculate display data from the columnar output of read_cht_columns().
+
+    Args:
+        columns: dict with 'names', 'origins', 'sizes', 'xyz', 'corner' and 'range_names'
+
+    Returns:
+        data: Dictionary with patch and grid data
+    """
+    xyz_dicts = [{'X': x, 'Y': y, 'Z': z} for x, y, z in columns['xyz'].tolist()]
+    corner = [list(p) for p in columns['corner']]
+
+    return _build_cht_data(columns['names'], columns['origins'], columns['sizes'], columns['xyz'],
+                           xyz_dicts, corner, list(columns['range_names']))
+
+
+def _build_cht_data(names, origins, sizes, xyz, xyz_dicts, corner, range_names):
+    """Compute UV and preview colours for all patches at once and assemble cht_data."""
 
     # Извлекаем углы рамки
     corner_points = corner
 
-    patch_dict = {}
-
-    for patch_name, patch_data in patches.items():
-        # Расчет центра патча (patch_xy) - смещение на половину размера
-        patch_point = patch_data['patch_point']
-        patch_size = patch_data['patch_size']
+    # Расчет центров патчей (patch_xy) - смещение на половину размера
+    patch_xy = (origins + sizes / 2).astype(np.float32)
 
-        center_x = patch_point[0] + patch_size[0] / 2
-        center_y = patch_point[1] + patch_size[1] / 2
-        patch_xy = np.array([center_x, center_y], dtype=np.float32)
+    # UV for the patch centre points and patch sizes
+    uv = _calculate_uv_coordinates_batch(patch_xy, corner_points)
+    uv_wh = _calculate_uv_coordinates_batch(sizes, corner_points)
 
-        # Calculate UV for the patch center point
-        uv = _calculate_uv_coordinates(patch_xy, corner_points)
-        uv_wh = _calculate_uv_coordinates(patch_size, corner_points)
-        # Преобразование XYZ в RGB
-        xyz_data = patch_data['xyz']
-        rgb_packed = _xyz_to_rgb(xyz_data)
+    # Преобразование XYZ в RGB
+    rgb_packed = _xyz_to_rgb_batch(xyz).tolist()
 
-        # Формирование данных патча
+    # Формирование данных патча
+    patch_dict = {}
+    for idx, patch_name in enumerate(names):
         patch_dict[patch_name] = {
-            'xyz': xyz_data,
-            'rgb': rgb_packed,
-            'uv': uv,
-            'uv_wh': uv_wh,
-            'patch_xy': patch_xy,
-            'patch_wh': (patch_size[0], patch_size[1]),
+            'xyz': xyz_dicts[idx],
+            'rgb': rgb_packed[idx],
+            'uv': uv[idx],
+            'uv_wh': uv_wh[idx],
+            'patch_xy': patch_xy[idx],
+            'patch_wh': (float(sizes[idx, 0]), float(sizes[idx, 1])),
             'analysis_result': None,
             'array_idx': 0,  # пока заглушка
         }
@@ -62,7 +87,7 @@ def prepare_cht_data(patches, corner):
     return GENERIC_OK, {
         'patch_dict': patch_dict,
         'corner_ref': corner_points,
-        'range_names': _find_corner_patches(patches),
+        'range_names': range_names,
         'patch_scale': 100,
 
         'corner_demo': np.array([], dtype=np.float32),      # reper pints for the demo image
@@ -87,82 +112,144 @@ def read_cht_file(filename):
             - status: GENERIC_OK or GENERIC_ERROR
             - data: Dictionary with 'patches' and 'corner' keys
     """
+    status, columns = read_cht_columns(filename)
+    if status != GENERIC_OK:
+        return (GENERIC_ERROR, {})
+
+    patches = {}
+    for name, point, size, xyz in zip(columns['names'], columns['origins'].tolist(),
+                                      columns['sizes'].tolist(), columns['xyz'].tolist()):
+        patches[name] = {
+            'patch_point': point,
+            'patch_size': size,
+            'xyz': {'X': xyz[0], 'Y': xyz[1], 'Z': xyz[2]},
+        }
+
+    result = {
+        'patches': patches,
+        'corner': [list(p) for p in columns['corner']]
+    }
+
+    return (GENERIC_OK, result)
+
+
+# Parsed CHT files: path -> (mtime_ns, size, columns)
+_cht_cache = {}
+
+
+def clear_cht_cache():
+    """Drop all cached CHT parse results."""
+    _cht_cache.clear()
+
+
+def read_cht_columns(filename):
+    """
+    Parse CHT file into columnar patch arrays, cached by file modification time.
+
+    Args:
+        filename (str): Path to the CHT file to parse
+
+    Returns:
+        tuple[int, dict]: (status, columns), columns holding:
+            - 'names': list[str] - patch names in chart order
+            - 'origins': np.ndarray (N, 2) float64 - patch top-left points
+            - 'sizes': np.ndarray (N, 2) float64 - patch width/height
+            - 'xyz': np.ndarray (N, 3) float64 - expected XYZ, -1 for missing patches
+            - 'corner': tuple of 4 (x, y) fiducial corners
+            - 'range_names': list[str] - corner patches (see find_corner_patches)
+
+    Note:
+        Cached arrays are shared between callers and are read-only.
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError as e:
+        print(tr("Error parsing CHT file: %s") % str(e))
+        return (GENERIC_ERROR, {})
+
+    key = os.path.abspath(filename)
+    cached = _cht_cache.get(key)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return (GENERIC_OK, cached[2])
+
     try:
         with open(filename, 'r', encoding='utf-8') as file:
             content = file.read()
 
-        # Parse BOXES section
-        boxes_data = _parse_boxes_section(content)
-        if not boxes_data:
-            print(tr("Error: Failed to parse BOXES section"))
-            return (GENERIC_ERROR, {})
-
-        # Parse EXPECTED section
-        expected_colours = _parse_expected_section(content)
-        if not expected_colours:
-            print(tr("Error: Failed to parse EXPECTED section"))
-            return (GENERIC_ERROR, {})
-
-        # Extract corner coordinates from F line
-        corner = None
-        patches = {}
-
-        for box_def in boxes_data:
-            if box_def['type'] == 'F':
-                corner = _extract_corner_coordinates(box_def)
-            elif box_def['type'] in ['X', 'Y']:
-                # Generate patches from X/Y definitions
-                generated_patches = _generate_patches_from_box(box_def)
-
-                # Validate that all patches have expected colours
-                for patch_name, patch_data in generated_patches.items():
-                    if patch_name not in expected_colours:
-                        print(tr("Error: Missing expected colour for patch: %s") % patch_name)
-                        expected_colours[patch_name] = {'colour_space': 'XYZ', 'xyz':{'X': -1, 'Y': -1, 'Z': -1}}
-                        # return (GENERIC_ERROR, {})
-
-                    # Add XYZ colour data
-                    patch_data['xyz'] = expected_colours[patch_name]['xyz']
-                    patches[patch_name] = patch_data
-
-        # Validate corner data
-        if corner is None:
-            print(tr("Error: Missing fiducial marks (F line) in BOXES section"))
-            return (GENERIC_ERROR, {})
-
-        if len(patches) == 0:
-            print(tr("Error: No patches found in BOXES section"))
-            return (GENERIC_ERROR, {})
-
-        result = {
-            'patches': patches,
-            'corner': corner
-        }
-
-        return (GENERIC_OK, result)
+        status, columns = _parse_cht_content(content)
 
     except Exception as e:
         print(tr("Error parsing CHT file: %s") % str(e))
         return (GENERIC_ERROR, {})
 
+    if status == GENERIC_OK:
+        _cht_cache[key] = (stat.st_mtime_ns, stat.st_size, columns)
 
-def _calculate_uv_coordinates(point, corner_points):
-    """Calculate UV coordinates using linear scaling within rectangle bounds."""
+    return (status, columns)
 
-    # Найдем bounding box углов
-    xs = [p[0] for p in corner_points]
-    ys = [p[1] for p in corner_points]
-    min_x, max_x = min(xs), max(xs)
-    min_y, max_y = min(ys), max(ys)
 
-    # Нормализуем координаты центра патча
-    u = (point[0] - min_x) / (max_x - min_x) if max_x != min_x else 0.0
-    v = (point[1] - min_y) / (max_y - min_y) if max_y != min_y else 0.0
+def _parse_cht_content(content):
+    """Build the columnar patch arrays from CHT text."""
+    corner, boxes, expected = _tokenize_cht(content)
 
-    return np.array([u, v], dtype=np.float32)
+    if not boxes and corner is None:
+        print(tr("Error: Failed to parse BOXES section"))
+        return (GENERIC_ERROR, {})
 
+    exp_labels, exp_xyz = expected
+    if not exp_labels:
+        print(tr("Error: Failed to parse EXPECTED section"))
+        return (GENERIC_ERROR, {})
+
+    # Validate corner data
+    if corner is None:
+        print(tr("Error: Missing fiducial marks (F line) in BOXES section"))
+        return (GENERIC_ERROR, {})
+
+    # Generate patches from X/Y definitions
+    names = []
+    origin_parts = []
+    size_parts = []
+    for box_def in boxes:
+        box_names, box_origins = _expand_box(box_def)
+        names.extend(box_names)
+        origin_parts.append(box_origins)
+        size_parts.append(np.broadcast_to(np.array(box_def[5:7], dtype=np.float64), box_origins.shape))
+
+    if len(names) == 0:
+        print(tr("Error: No patches found in BOXES section"))
+        return (GENERIC_ERROR, {})
+
+    origins = np.concatenate(origin_parts)
+    sizes = np.concatenate(size_parts)
+
+    # A repeated name keeps its first position and the last definition
+    if len(set(names)) != len(names):
+        last = {name: idx for idx, name in enumerate(names)}
+        keep = [last[name] for name in dict.fromkeys(names)]
+        names = [names[idx] for idx in keep]
+        origins = origins[keep]
+        sizes = sizes[keep]
+
+    # Attach expected colours, the last EXPECTED row wins for repeated labels
+    exp_index = {label: idx for idx, label in enumerate(exp_labels)}
+    rows = np.array([exp_index.get(name, -1) for name in names], dtype=np.intp)
+    xyz = np.vstack([exp_xyz, np.full((1, 3), -1.)])[rows]
+    for idx in np.flatnonzero(rows < 0):
+        print(tr("Error: Missing expected colour for patch: %s") % names[idx])
+
+    for arr in (origins, sizes, xyz):
+        arr.flags.writeable = False
+
+    return (GENERIC_OK, {
+        'names': names,
+        'origins': origins,
+        'sizes': sizes,
+        'xyz': xyz,
+        'corner': corner,
+        'range_names': find_corner_patches(names, origins),
+    })
 
-import numpy as np
 
 _matrix_srgb = np.array([
     [3.2406, -1.5372, -0.4986],
@@ -176,350 +263,236 @@ _matrix_adobe = np.array([
     [0.0134, -0.1184, 1.0154]
 ], dtype=np.float64)
 
-def _xyz_to_rgb(xyz, is_srgb=True):
+
+def _calculate_uv_coordinates_batch(points, corner_points):
     """
-    Convert XYZ to RGB for monitor display (numpy version)
-    Args:
-        xyz: dict with keys 'X', 'Y', 'Z' or array [X, Y, Z] (normalised)
-        is_srgb: bool, True for sRGB (default), False for Adobe RGB
+    UV coordinates of (N, 2) points: linear scaling within the corners' bounding box.
+
     Returns:
-        int: QRgb value (0xFFRRGGBB)
+        np.ndarray (N, 2) float32
     """
-    xyz_array = np.array([xyz['X'], xyz['Y'], xyz['Z']], dtype=np.float64)
-    xyz_normalized = xyz_array / 100.0
+    corner_arr = np.asarray(corner_points, dtype=np.float64)
+    lo = corner_arr.min(axis=0)
+    span = corner_arr.max(axis=0) - lo
 
-    if is_srgb:
-        rgb = _matrix_srgb @ xyz_normalized
-        rgb = np.where(rgb <= 0.0031308, 12.92 * rgb, 1.055 * np.power(rgb, 1/2.4) - 0.055)
-    else:
-        rgb = _matrix_adobe @ xyz_normalized
-        rgb = np.where(rgb > 0, np.power(rgb, 1/2.2), 0)
+    uv = np.zeros((len(points), 2), dtype=np.float64)
+    valid = span != 0
+    uv[:, valid] = (points[:, valid] - lo[valid]) / span[valid]
+    return uv.astype(np.float32)
 
-    # Single line: clipping → 8-bit → packing
-    rgb_8bit = np.round(np.clip(rgb, 0, 1) * 255).astype(int)
 
-    # Pack into QRgb (0xFFRRGGBB)
-    return (255 << 24) | (rgb_8bit[0] << 16) | (rgb_8bit[1] << 8) | rgb_8bit[2]
-
-def _find_corner_patches(patches):
+def _xyz_to_rgb_batch(xyz, is_srgb=True):
     """
-    Find 4 corner patches from patches dictionary.
+    Convert (N, 3) XYZ (0..100) to monitor RGB for display.
 
     Args:
-        patches: dict with patch data {'A1': {'patch_point': [x, y], 'patch_size': [w, h], ...}, ...}
+        xyz: (N, 3) XYZ array
+        is_srgb: True for sRGB (default), False for Adobe RGB
 
     Returns:
-        list: [top_left_name, top_right_name, bottom_left_name, bottom_right_name]
+        np.ndarray (N,) uint32: QRgb values (0xFFRRGGBB)
     """
-    if not patches:
-        return []
+    xyz_normalized = np.asarray(xyz, dtype=np.float64) / 100.0
 
-    min_x = min_y = float('inf')
-    max_x = max_y = float('-inf')
-
-    patch_points = {}
+    with np.errstate(invalid='ignore'):
+        if is_srgb:
+            rgb = xyz_normalized @ _matrix_srgb.T
+            rgb = np.where(rgb <= 0.0031308, 12.92 * rgb, 1.055 * np.power(rgb, 1/2.4) - 0.055)
+        else:
+            rgb = xyz_normalized @ _matrix_adobe.T
+            rgb = np.where(rgb > 0, np.power(rgb, 1/2.2), 0)
 
-    for patch_name, patch_data in patches.items():
-        x, y = patch_data['patch_point']
-        patch_points[patch_name] = (x, y)
+    # Clipping → 8-bit → packing
+    rgb_8bit = np.round(np.clip(rgb, 0, 1) * 255).astype(np.uint32)
 
-        # Обновляем границы
-        min_x = min(min_x, x)
-        max_x = max(max_x, x)
-        min_y = min(min_y, y)
-        max_y = max(max_y, y)
+    return np.uint32(0xFF000000) | (rgb_8bit[:, 0] << 16) | (rgb_8bit[:, 1] << 8) | rgb_8bit[:, 2]
 
-    corner_patches = []
-    corners = [
-        (min_x, min_y),  # top_left
-        (max_x, min_y),  # top_right
-        (min_x, max_y),  # bottom_left
-        (max_x, max_y)  # bottom_right
-    ]
 
-    for corner_x, corner_y in corners:
-        closest_patch = None
-        min_distance = float('inf')
+def find_corner_patches(names, origins):
+    """
+    Find 4 corner patches: the patches closest to the corners of the origins bounding box.
 
-        for patch_name, (x, y) in patch_points.items():
-            distance = ((x - corner_x) ** 2 + (y - corner_y) ** 2) ** 0.5
+    Args:
+        names: list[str] - patch names
+        origins: np.ndarray (N, 2) - patch top-left points
 
-            if distance < min_distance:
-                min_distance = distance
-                closest_patch = patch_name
+    Returns:
+        list: [top_left_name, top_right_name, bottom_left_name, bottom_right_name]
+    """
+    if len(names) == 0:
+        return []
 
-        corner_patches.append(closest_patch)
+    (min_x, min_y), (max_x, max_y) = origins.min(axis=0), origins.max(axis=0)
+    corners = np.array([
+        [min_x, min_y],  # top_left
+        [max_x, min_y],  # top_right
+        [min_x, max_y],  # bottom_left
+        [max_x, max_y]   # bottom_right
+    ])
 
-    return corner_patches
+    distance = np.sum((origins[None, :, :] - corners[:, None, :]) ** 2, axis=2)
+    return [names[idx] for idx in np.argmin(distance, axis=1)]
 
-def _parse_boxes_section(content):
-    lines = content.split('\n')
-    boxes_data = []
 
-    for i, line in enumerate(lines):
-        if line.startswith('BOXES'):
-            # Найдена строка BOXES
-            parts = line.split()
-            if len(parts) >= 2:
-                try:
-                    n = int(parts[1])  # Количество патчей (для информации)
+_BOX_TYPES = ('D', 'F', 'X', 'Y')
 
-                    # Читаем строки до тех пор, пока они содержат валидные данные
-                    j = 1
-                    while i + j < len(lines):
-                        box_line = lines[i + j].strip()
 
-                        # Пропускаем пустые строки
-                        if not box_line:
-                            j += 1
-                            continue
+def _tokenize_cht(content):
+    """
+    Single pass over CHT text.
 
-                        box_parts = box_line.split()
-                        if len(box_parts) == 0:
-                            j += 1
-                            continue
+    Returns:
+        tuple: (corner, boxes, (expected_labels, expected_xyz))
+            - corner: tuple of 4 (x, y) from the F line or None
+            - boxes: list of X/Y tuples (type, x_start, x_end, y_start, y_end, w, h, xo, yo, xi, yi)
+            - expected_labels: list[str], expected_xyz: np.ndarray (M, 3)
+    """
+    lines = content.split('\n')
+    n_lines = len(lines)
 
-                        box_type = box_parts[0]
+    corner = None
+    boxes = []
+    exp_labels = []
+    exp_values = []
+    boxes_done = expected_done = False
 
-                        # Проверяем, что строка начинается с валидного типа
-                        if box_type not in ['D', 'F', 'X', 'Y']:
-                            # Встретили строку, которая не относится к BOXES - выходим
-                            break
+    i = 0
+    while i < n_lines:
+        line = lines[i]
+        i += 1
 
-                        # Обрабатываем валидные типы
+        if not boxes_done and line.startswith('BOXES'):
+            parts = line.split()
+            if len(parts) < 2 or not _is_int(parts[1]):
+                continue
+            boxes_done = True
+
+            # Read lines while they hold box definitions, blank lines are skipped
+            while i < n_lines:
+                box_parts = lines[i].split()
+                if box_parts:
+                    box_type = box_parts[0]
+                    if box_type not in _BOX_TYPES:
+                        break
+                    try:
                         if box_type == 'F':
                             # F _ _ x0 y0 x1 y1 x2 y2 x3 y3
-                            try:
-                                coords = [float(x) for x in box_parts[3:11]]
-                                boxes_data.append({
-                                    'type': 'F',
-                                    'coordinates': coords
-                                })
-                            except (ValueError, IndexError):
-                                pass
-
+                            # Order: top-left, top-right, bottom-right, bottom-left
+                            coords = [float(x) for x in box_parts[3:11]]
+                            if len(coords) == 8:
+                                corner = tuple(zip(coords[0::2], coords[1::2]))
                         elif box_type == 'X':
-                            # X: X lxs lxe lys lye w h xo yo xi yi
-                            try:
-                                box_def = {
-                                    'type': 'X',
-                                    'x_start': box_parts[1],  # lxs
-                                    'x_end': box_parts[2],  # lxe
-                                    'y_start': box_parts[3],  # lys
-                                    'y_end': box_parts[4],  # lye
-                                    'width': float(box_parts[5]),
-                                    'height': float(box_parts[6]),
-                                    'x_origin': float(box_parts[7]),
-                                    'y_origin': float(box_parts[8]),
-                                    'x_increment': float(box_parts[9]),
-                                    'y_increment': float(box_parts[10])
-                                }
-                                boxes_data.append(box_def)
-                            except (ValueError, IndexError):
-                                pass
-
+                            # X lxs lxe lys lye w h xo yo xi yi
+                            boxes.append(('X', box_parts[1], box_parts[2], box_parts[3], box_parts[4],
+                                          *[float(x) for x in box_parts[5:11]]))
                         elif box_type == 'Y':
-                            # Y: Y lys lye lxs lxe w h xo yo xi yi
-                            try:
-                                box_def = {
-                                    'type': 'Y',
-                                    'x_start': box_parts[3],  # lxs в позиции 3
-                                    'x_end': box_parts[4],  # lxe в позиции 4
-                                    'y_start': box_parts[1],  # lys в позиции 1
-                                    'y_end': box_parts[2],  # lye в позиции 2
-                                    'width': float(box_parts[5]),
-                                    'height': float(box_parts[6]),
-                                    'x_origin': float(box_parts[7]),
-                                    'y_origin': float(box_parts[8]),
-                                    'x_increment': float(box_parts[9]),
-                                    'y_increment': float(box_parts[10])
-                                }
-                                boxes_data.append(box_def)
-                            except (ValueError, IndexError):
-                                pass
-
-                        # D строки игнорируем, но продолжаем чтение
-                        j += 1
-
-                    break
-                except ValueError:
-                    continue
-
-    return boxes_data
-
-def _parse_expected_section(content):
-    """Parse EXPECTED section and return colour data."""
-    lines = content.split('\n')
-    colours = {}
-
-    for i, line in enumerate(lines):
-        if line.startswith('EXPECTED'):
-            # Найдена строка EXPECTED
+                            # Y lys lye lxs lxe w h xo yo xi yi
+                            boxes.append(('Y', box_parts[3], box_parts[4], box_parts[1], box_parts[2],
+                                          *[float(x) for x in box_parts[5:11]]))
+                        # D lines are ignored
+                    except (ValueError, IndexError):
+                        pass
+                i += 1
+
+        elif not expected_done and line.startswith('EXPECTED'):
             parts = line.split()
-            if len(parts) >= 3:
-                try:
-                    colour_space = parts[1]  # XYZ или LAB
-                    n = int(parts[2])  # Количество строк
-
-                    # Читаем следующие N строк
-                    for j in range(1, n + 1):
-                        if i + j < len(lines):
-                            colour_line = lines[i + j].strip()
-                            if colour_line:
-                                colour_parts = colour_line.split()
-                                if len(colour_parts) >= 4:
-                                    label = colour_parts[0]
-                                    try:
-                                        x, y, z = float(colour_parts[1]), float(colour_parts[2]), float(colour_parts[3])
-                                        colours[label] = {
-                                            'xyz': {'X': x, 'Y': y, 'Z': z},
-                                            'colour_space': colour_space
-                                        }
-                                    except ValueError:
-                                        continue
-                    break
-                except ValueError:
-                    continue
-
-    return colours
-
-
-def _extract_corner_coordinates(box_def):
-    """Extract corner coordinates from F-type box definition."""
-    coords = box_def['coordinates']
-    # F _ _ x0 y0 x1 y1 x2 y2 x3 y3
-    # Order: top-left, top-right, bottom-right, bottom-left
-    # [[0, 0], [1, 0], [1, 1], [0, 1]]
-    return [
-        [coords[0], coords[1]],  # x0, y0 - top-left
-        [coords[2], coords[3]],  # x1, y1 - top-right
-        [coords[4], coords[5]],  # x2, y2 - bottom-right
-        [coords[6], coords[7]],  # x3, y3 - bottom-left
-    ]
-
-
-def _generate_patches_from_box(box_def):
-    if box_def['type'] == 'Y':
-        return _generate_patches_from_box_y(box_def)
-    elif box_def['type'] == 'X':
-        return _generate_patches_from_box_x(box_def)
-    else:
-        return {}
-
-
-def _generate_patches_from_box_y(box_def):
-    """Generate patches from X box definition - горизонтальное направление."""
-    patches = {}
-
-    # Generate label sequences
-    x_labels = _generate_label_sequence(box_def['x_start'], box_def['x_end'])
-    y_labels = _generate_label_sequence(box_def['y_start'], box_def['y_end'])
-
-    # Handle null labels
-    if box_def['x_start'] == '_' or box_def['x_end'] == '_':
-        x_labels = ['_']
-    if box_def['y_start'] == '_' or box_def['y_end'] == '_':
-        y_labels = ['_']
-
-    # X TYPE: Сначала проходим все Y-метки для одной X-метки, потом следующую X-метку
-    # Порядок генерации: A1, A2, A3, A4, A5, A6, B1, B2, B3, B4, B5, B6, ...
-    # НО координаты: A1, A2, A3... должны расти по X (горизонтально)!
-    for x_idx, x_label in enumerate(x_labels):
-        for y_idx, y_label in enumerate(y_labels):
-            # X тип: y_increment используется для движения по X (горизонтально)!
-            # x_increment используется для движения по Y (вертикально)!
-            patch_x = box_def['x_origin'] + (y_idx * box_def['y_increment'])  # Y-индекс для X координаты!
-            patch_y = box_def['y_origin'] + (x_idx * box_def['x_increment'])  # X-индекс для Y координаты!
-
-            # Create patch name (always XY format)
-            if x_label == '_':
-                patch_name = y_label if y_label != '_' else 'PATCH'
-            elif y_label == '_':
-                patch_name = x_label
-            else:
-                patch_name = f"{x_label}{y_label}"
-
-            patch_data = {
-                'patch_point': [patch_x, patch_y],
-                'patch_size': [box_def['width'], box_def['height']]
-            }
-
-            patches[patch_name] = patch_data
+            if len(parts) < 3 or not _is_int(parts[2]):
+                continue
+            expected_done = True
+
+            # Read the next N lines: label X Y Z (the values are stored as XYZ for LAB charts too)
+            n = int(parts[2])
+            for colour_line in lines[i:i + n]:
+                colour_parts = colour_line.split()
+                if len(colour_parts) >= 4:
+                    try:
+                        values = (float(colour_parts[1]), float(colour_parts[2]), float(colour_parts[3]))
+                    except ValueError:
+                        continue
+                    exp_labels.append(colour_parts[0])
+                    exp_values.append(values)
+            i += n
+
+    exp_xyz = np.array(exp_values, dtype=np.float64).reshape(-1, 3)
+    return corner, boxes, (exp_labels, exp_xyz)
+
+
+def _is_int(text):
+    try:
+        int(text)
+    except ValueError:
+        return False
+    return True
 
-    return patches
 
+def _expand_box(box_def):
+    """
+    Expand an X/Y box definition into patch names and top-left points.
 
-def _generate_patches_from_box_x(box_def):
-    """Generate patches from Y box definition - вертикальное направление."""
-    patches = {}
+    Returns:
+        tuple: (names, origins (N, 2) float64)
+    """
+    box_type, x_start, x_end, y_start, y_end, _, _, x_origin, y_origin, x_increment, y_increment = box_def
+    names, nx, ny = _box_labels(x_start, x_end, y_start, y_end)
+
+    # Names run over all Y-labels for one X-label, then the next X-label
+    x_idx, y_idx = np.divmod(np.arange(nx * ny, dtype=np.float64), ny)
+    origins = np.empty((nx * ny, 2), dtype=np.float64)
+    if box_type == 'Y':
+        # y_increment moves along X (horizontal), x_increment along Y (vertical)
+        origins[:, 0] = x_origin + y_idx * y_increment
+        origins[:, 1] = y_origin + x_idx * x_increment
+    else:
+        origins[:, 0] = x_origin + x_idx * y_increment
+        origins[:, 1] = y_origin + y_idx * x_increment
 
-    # Generate label sequences
-    x_labels = _generate_label_sequence(box_def['x_start'], box_def['x_end'])
-    y_labels = _generate_label_sequence(box_def['y_start'], box_def['y_end'])
+    return names, origins
 
-    # Handle null labels
-    if box_def['x_start'] == '_' or box_def['x_end'] == '_':
-        x_labels = ['_']
-    if box_def['y_start'] == '_' or box_def['y_end'] == '_':
-        y_labels = ['_']
 
-    # Y TYPE: Инкременты могут быть интерпретированы по-другому
-    # Нужно поменять местами использование инкрементов
-    for x_idx, x_label in enumerate(x_labels):
-        for y_idx, y_label in enumerate(y_labels):
-            # Y тип: возможно инкременты нужно использовать наоборот
-            patch_x = box_def['x_origin'] + (x_idx * box_def['y_increment'])  # Поменяли!
-            patch_y = box_def['y_origin'] + (y_idx * box_def['x_increment'])  # Поменяли!
+@lru_cache(maxsize=1024)
+def _box_labels(x_start, x_end, y_start, y_end):
+    """Patch names of a box in generation order, with the X and Y label counts."""
+    x_labels = _generate_label_sequence(x_start, x_end)
+    y_labels = _generate_label_sequence(y_start, y_end)
 
+    names = []
+    for x_label in x_labels:
+        for y_label in y_labels:
             # Create patch name (always XY format)
             if x_label == '_':
-                patch_name = y_label if y_label != '_' else 'PATCH'
+                names.append(y_label if y_label != '_' else 'PATCH')
             elif y_label == '_':
-                patch_name = x_label
+                names.append(x_label)
             else:
-                patch_name = f"{x_label}{y_label}"
-
-            patch_data = {
-                'patch_point': [patch_x, patch_y],
-                'patch_size': [box_def['width'], box_def['height']]
-            }
+                names.append(f"{x_label}{y_label}")
 
-            patches[patch_name] = patch_data
+    return tuple(names), len(x_labels), len(y_labels)
 
-    return patches
 
+@lru_cache(maxsize=1024)
 def _generate_label_sequence(start_label, end_label):
     """Generate sequence of labels from start to end."""
     if start_label == '_' or end_label == '_':
-        return ['_']
-
-    labels = []
+        return ('_',)
 
     # Handle numeric labels with leading zeros
     if start_label.isdigit() and end_label.isdigit():
-        start_num = int(start_label)
-        end_num = int(end_label)
         width = len(start_label)  # Preserve leading zeros
-        for i in range(start_num, end_num + 1):
-            labels.append(str(i).zfill(width))
+        return tuple(str(i).zfill(width) for i in range(int(start_label), int(end_label) + 1))
 
     # Handle single alphabetic labels
-    elif (start_label.isalpha() and end_label.isalpha() and
-          len(start_label) == 1 and len(end_label) == 1):
-        start_ord = ord(start_label.upper())
-        end_ord = ord(end_label.upper())
-        for i in range(start_ord, end_ord + 1):
-            labels.append(chr(i))
+    if (start_label.isalpha() and end_label.isalpha() and
+            len(start_label) == 1 and len(end_label) == 1):
+        return tuple(chr(i) for i in range(ord(start_label.upper()), ord(end_label.upper()) + 1))
 
     # Handle alphanumeric labels (e.g., GS00-GS23)
-    elif len(start_label) > 1 and len(end_label) > 1:
+    if len(start_label) > 1 and len(end_label) > 1:
         # Find common prefix
         prefix_len = 0
-        for i in range(min(len(start_label), len(end_label))):
-            if start_label[i] == end_label[i]:
-                prefix_len += 1
-            else:
+        for a, b in zip(start_label, end_label):
+            if a != b:
                 break
+            prefix_len += 1
 
         if prefix_len > 0:
             prefix = start_label[:prefix_len]
@@ -527,22 +500,12 @@ def _generate_label_sequence(start_label, end_label):
             end_suffix = end_label[prefix_len:]
 
             if start_suffix.isdigit() and end_suffix.isdigit():
-                start_num = int(start_suffix)
-                end_num = int(end_suffix)
                 width = len(start_suffix)
-                for i in range(start_num, end_num + 1):
-                    labels.append(f"{prefix}{str(i).zfill(width)}")
-            else:
-                # Single label fallback
-                labels.append(start_label)
-        else:
-            labels.append(start_label)
-
-    else:
-        # Single label fallback
-        labels.append(start_label)
+                return tuple(f"{prefix}{str(i).zfill(width)}"
+                             for i in range(int(start_suffix), int(end_suffix) + 1))
 
-    return labels
+    # Single label fallback
+    return (start_label,)
 
 
 # Test function
@@ -0,0 +1,153 @@
+import re
+from functools import lru_cache
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+
+STANDARD_OBSERVER = 'CIE 1931 2 Degree Standard Observer'
+
+# '3000K', '5500 K' - источник по цветовой температуре
+CCT_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*K\s*$', re.IGNORECASE)
+
+# Ниже этой температуры - черное тело, выше - CIE D-серия (как CIE 15 для CCT источников)
+D_SERIES_MIN_CCT = 4000.0
+
+SPECTRAL_COLUMN_PATTERN = re.compile(r'^SPEC_(\d+(?:\.\d+)?)$')
+
+# Illuminant: имя CIE ('D50', 'A', 'FL11'...), CCT ('3000K') или SPD на длинах волн полос (tuple)
+Illuminant = Union[str, Tuple[float, ...]]
+
+
+def spectral_columns(column_names: Sequence[str]) -> Tuple[Tuple[str, ...], np.ndarray]:
+    """
+    Колонки SPEC_* в порядке длины волны.
+
+    Returns:
+        (names, wavelengths): имена колонок и длины волн (nm, float64)
+    """
+    found = []
+    for name in column_names:
+        match = SPECTRAL_COLUMN_PATTERN.match(name)
+        if match:
+            found.append((float(match.group(1)), name))
+    found.sort()
+    return tuple(name for _, name in found), np.array([wl for wl, _ in found], dtype=np.float64)
+
+
+def _illuminant_spd(illuminant: Illuminant, wavelengths: np.ndarray) -> np.ndarray:
+    """Относительное SPD источника на длинах волн полос."""
+    if not isinstance(illuminant, str):
+        spd = np.asarray(illuminant, dtype=np.float64)
+        if spd.shape != wavelengths.shape:
+            raise ValueError(f"Illuminant SPD has {spd.size} values, expected {wavelengths.size}")
+        return spd
+
+    import colour
+
+    match = CCT_PATTERN.match(illuminant)
+    if match:
+        cct = float(match.group(1))
+        if cct < D_SERIES_MIN_CCT:
+            sd = colour.sd_blackbody(cct)
+        else:
+            xy = colour.temperature.CCT_to_xy_CIE_D(cct)
+            sd = colour.sd_CIE_illuminant_D_series(xy)
+    elif illuminant in colour.SDS_ILLUMINANTS:
+        sd = colour.SDS_ILLUMINANTS[illuminant]
+    else:
+        raise ValueError(f"Unknown illuminant: {illuminant}")
+
+    return np.interp(wavelengths, sd.wavelengths, sd.values, left=0.0, right=0.0)
+
+
+def _band_widths(wavelengths: np.ndarray) -> np.ndarray:
+    """Ширина полос (nm) для неравномерной сетки - половина расстояния до соседей."""
+    if wavelengths.size < 2:
+        return np.ones_like(wavelengths)
+    return np.gradient(wavelengths)
+
+
+@lru_cache(maxsize=64)
+def _spectral_weights(wavelengths: Tuple[float, ...], illuminant: Illuminant,
+                      observer: str) -> np.ndarray:
+    import colour
+
+    wl = np.array(wavelengths, dtype=np.float64)
+    cmfs = colour.MSDS_CMFS[observer]
+    cmf = np.column_stack([np.interp(wl, cmfs.wavelengths, cmfs.values[:, i], left=0.0, right=0.0)
+                           for i in range(3)])
+
+    weights = (_illuminant_spd(illuminant, wl) * _band_widths(wl))[:, None] * cmf
+    norm = weights[:, 1].sum()
+    if norm <= 0:
+        raise ValueError("Illuminant has no energy in the measured band range")
+
+    # Идеальный отражатель → Y = 100
+    weights *= 100.0 / norm
+    weights.flags.writeable = False
+    return weights
+
+
+def spectral_weights(wavelengths: Sequence[float], illuminant: Illuminant = 'D50',
+                     observer: str = STANDARD_OBSERVER) -> np.ndarray:
+    """
+    Весовая таблица спектр → XYZ для раскладки полос: XYZ = reflectance @ weights.
+
+    Таблицы кэшируются по (длины волн, источник, наблюдатель), повторный вызов -
+    без интерполяции CMF.
+
+    Args:
+        wavelengths: длины волн полос (nm)
+        illuminant: имя CIE источника, CCT ('3000K') или SPD на wavelengths
+        observer: имя наблюдателя из colour.MSDS_CMFS
+
+    Returns:
+        (bands, 3) float64, только чтение; сумма строк - белая точка источника (Y = 100)
+    """
+    wavelengths = tuple(float(wl) for wl in wavelengths)
+    if not isinstance(illuminant, str):
+        illuminant = tuple(float(value) for value in illuminant)
+    return _spectral_weights(wavelengths, illuminant, observer)
+
+
+def spectral_to_xyz(reflectance: np.ndarray, wavelengths: Sequence[float],
+                    illuminant: Illuminant = 'D50',
+                    observer: str = STANDARD_OBSERVER) -> np.ndarray:
+    """
+    Спектры отражения → XYZ одним матричным умножением.
+
+    Args:
+        reflectance: (N, bands) отражение 0..1
+        wavelengths: длины волн полос (nm)
+        illuminant: см. spectral_weights
+        observer: см. spectral_weights
+
+    Returns:
+        (N, 3) XYZ, Y идеального белого = 100
+    """
+    return np.asarray(reflectance, dtype=np.float64) @ spectral_weights(wavelengths, illuminant, observer)
+
+
+def spectral_to_xyz_multi(reflectance: np.ndarray, wavelengths: Sequence[float],
+                          illuminants: Sequence[Illuminant],
+                          observer: str = STANDARD_OBSERVER) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    XYZ патчей сразу для нескольких источников: (N, bands) x (I, bands, 3).
+
+    Returns:
+        (xyz, whites): (I, N, 3) XYZ и (I, 3) белые точки источников
+    """
+    weights = np.stack([spectral_weights(wavelengths, illuminant, observer) for illuminant in illuminants])
+    xyz = np.einsum('nb,ibc->inc', np.asarray(reflectance, dtype=np.float64), weights, optimize=True)
+    return xyz, weights.sum(axis=1)
+
+
+def illuminant_white(wavelengths: Sequence[float], illuminant: Illuminant = 'D50',
+                     observer: str = STANDARD_OBSERVER) -> np.ndarray:
+    """Белая точка источника (XYZ, Y = 100), согласованная с весовой таблицей."""
+    return spectral_weights(wavelengths, illuminant, observer).sum(axis=0)
+
+
+def clear_spectral_cache():
+    """Drop all cached spectral weight tables."""
+    _spectral_weights.cache_clear()
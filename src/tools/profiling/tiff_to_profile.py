@@ -2,29 +2,30 @@ import os
 import sys
 import shutil
 import subprocess
+import threading
 import traceback
 from typing import Dict, Any, Optional, List
 from background_process import BackgroundProcessManager
+from locate_argyl import get_argyll_reference
+from profile_converter import (DEFAULT_COMMAND_CONFIG, STATUS_DONE, STATUS_FAILED, STATUS_SKIPPED,
+                               build_cctiff_command, convert_tiff_batch, output_filename)
 
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                              QLineEdit, QPushButton, QMessageBox, QFileDialog,
                              QApplication, QProgressDialog, QProgressBar)
 from PySide6.QtGui import QMovie
 
-from PySide6.QtCore import Qt, QCoreApplication
+from PySide6.QtCore import Qt, QCoreApplication, QObject, Signal
 from const import GENERIC_OK, GENERIC_CANCEL
 
 DIALOG_WIDTH = 640
 DIALOG_HEIGHT = 240
 
-# Default command template configuration
-DEFAULT_COMMAND_CONFIG = {
-    "executable": "cctiff",
-    "base_args": ["-v", "-p", "-f", "T", "-N"],
-    "profile_args": ["-i", "r"],
-    "srgb_args": ["-i", "a"],
-    "timeout": 300
-}
+
+class BatchSignals(QObject):
+    """Доставка прогресса пакетной конвертации из рабочих потоков в UI поток."""
+    progress = Signal(int, int, str, str)
+    finished = Signal(object)
 
 
 class ConvertToProfileDialog(QDialog):
@@ -44,6 +45,7 @@ class ConvertToProfileDialog(QDialog):
 
         super().__init__(parent)
         self.output_file = ""
+        self.output_files: List[str] = []
         self.command_config = command_config or DEFAULT_COMMAND_CONFIG.copy()
         self.setup_ui()
 
@@ -106,10 +108,13 @@ class ConvertToProfileDialog(QDialog):
         # Action buttons
         button_layout = QHBoxLayout()
         self.convert_btn = QPushButton(self.tr("Convert"))
+        self.batch_btn = QPushButton(self.tr("Batch..."))
         self.cancel_btn = QPushButton(self.tr("Cancel"))
         self.convert_btn.clicked.connect(self.convert)
+        self.batch_btn.clicked.connect(self.convert_batch)
         self.cancel_btn.clicked.connect(self.reject)
         button_layout.addWidget(self.convert_btn)
+        button_layout.addWidget(self.batch_btn)
         button_layout.addWidget(self.cancel_btn)
         layout.addLayout(button_layout)
 
@@ -132,6 +137,11 @@ class ConvertToProfileDialog(QDialog):
         )
 
         self.convert_btn.setEnabled(is_valid)
+        # Пакетный режим выбирает исходники сам
+        self.batch_btn.setEnabled(
+            bool(profile_file) and os.path.exists(profile_file) and
+            bool(output_dir) and os.path.exists(output_dir)
+        )
 
     def browse_profile(self):
         """Browse for paper profile file."""
@@ -161,11 +171,15 @@ class ConvertToProfileDialog(QDialog):
 
     def find_srgb_profile(self) -> Optional[str]:
         """
-        Find sRGB.icm profile relative to cctiff installation.
+        Find sRGB.icm profile: Argyll tool registry first, then relative to cctiff installation.
 
         Returns:
             Path to sRGB.icm profile or None if not found
         """
+        srgb_path = get_argyll_reference("sRGB.icm")
+        if srgb_path:
+            return srgb_path
+
         executable = self.command_config.get("executable", "cctiff")
         cctiff_path = shutil.which(executable)
         if not cctiff_path:
@@ -192,10 +206,7 @@ class ConvertToProfileDialog(QDialog):
         Returns:
             Generated output filename
         """
-        source_name = os.path.splitext(os.path.basename(source_file))[0]
-        profile_name = os.path.splitext(os.path.basename(profile_file))[0]
-        output_name = f"{source_name}_{profile_name}.tif"
-        return output_name
+        return output_filename(source_file, profile_file)
 
     def build_command(self, source_file: str, profile_file: str, srgb_profile: str, output_path: str) -> List[str]:
         """
@@ -210,27 +221,7 @@ class ConvertToProfileDialog(QDialog):
         Returns:
             Command list ready for subprocess
         """
-        cmd = [self.command_config.get("executable", "cctiff")]
-
-        # Add base arguments
-        base_args = self.command_config.get("base_args", [])
-        cmd.extend(base_args)
-
-        # Add profile arguments
-        profile_args = self.command_config.get("profile_args", ["-i", "r"])
-        cmd.extend(profile_args)
-        cmd.append(profile_file)
-
-        # Add sRGB arguments
-        srgb_args = self.command_config.get("srgb_args", ["-i", "a"])
-        cmd.extend(srgb_args)
-        cmd.append(srgb_profile)
-
-        # Add source and output files
-        cmd.append(source_file)
-        cmd.append(output_path)
-
-        return cmd
+        return build_cctiff_command(source_file, profile_file, srgb_profile, output_path, self.command_config)
 
     def convert(self):
         """Execute the colour profile conversion."""
@@ -263,6 +254,91 @@ class ConvertToProfileDialog(QDialog):
             on_error=lambda error: self.on_conversion_error(error)
         )
 
+    def convert_batch(self):
+        """Apply the profile to several TIFF files (e.g. a scanned roll) in parallel."""
+        profile_file = self.profile_edit.text().strip()
+        output_dir = self.output_dir_edit.text().strip()
+
+        source_dir = os.path.dirname(self.source_edit.text().strip())
+        sources, _ = QFileDialog.getOpenFileNames(
+            self, self.tr("Select Source Files"), source_dir,
+            self.tr("TIFF Files (*.tif *.tiff);;All Files (*)")
+        )
+        if not sources:
+            return
+
+        srgb_profile = self.find_srgb_profile()
+        if not srgb_profile:
+            executable = self.command_config.get("executable", "cctiff")
+            QMessageBox.critical(self, self.tr("Error"),
+                                 self.tr("Could not find sRGB.icm profile.\n"
+                                         "Make sure Argyll CMS is installed and {0} is in PATH.").format(executable))
+            return
+
+        progress_dialog = QProgressDialog(self.tr("Converting images..."), self.tr("Cancel"), 0, len(sources), self)
+        progress_dialog.setWindowTitle(self.tr("Batch Conversion"))
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+        progress_dialog.setValue(0)
+
+        cancel_event = threading.Event()
+        progress_dialog.canceled.connect(cancel_event.set)
+
+        signals = BatchSignals(self)
+        signals.progress.connect(
+            lambda completed, total, source, status: self.on_batch_progress(progress_dialog, completed, source))
+        signals.finished.connect(lambda results: self.on_batch_finished(progress_dialog, results))
+
+        def run():
+            try:
+                results = convert_tiff_batch(
+                    sources, profile_file, srgb_profile, output_dir,
+                    command_config=self.command_config,
+                    progress=signals.progress.emit,
+                    cancel_event=cancel_event)
+            except Exception as e:
+                traceback.print_exc()
+                results = e
+            signals.finished.emit(results)
+
+        self.batch_btn.setEnabled(False)
+        self.convert_btn.setEnabled(False)
+        threading.Thread(target=run, name="tiff-batch", daemon=True).start()
+
+    def on_batch_progress(self, progress_dialog: QProgressDialog, completed: int, source: str):
+        """Update batch progress (UI thread)."""
+        if not progress_dialog.wasCanceled():
+            progress_dialog.setLabelText(self.tr("Converted: {0}").format(os.path.basename(source)))
+            progress_dialog.setValue(completed)
+
+    def on_batch_finished(self, progress_dialog: QProgressDialog, results):
+        """Summarise batch results (UI thread)."""
+        progress_dialog.reset()
+        progress_dialog.deleteLater()
+        self.validate_fields()
+
+        if isinstance(results, Exception):
+            QMessageBox.critical(self, self.tr("Error"), self.tr("Error: {0}").format(results))
+            return
+
+        done = [r for r in results if r['status'] in (STATUS_DONE, STATUS_SKIPPED)]
+        failed = [r for r in results if r['status'] == STATUS_FAILED]
+        for result in results:
+            print(f"{result['status']}: {result['source']} -> {result['output']}")
+
+        message = self.tr("Converted {0} of {1} files.").format(len(done), len(results))
+        if failed:
+            message += "\n" + self.tr("Failed: {0}").format(
+                ", ".join(os.path.basename(r['source']) for r in failed))
+            QMessageBox.warning(self, self.tr("Batch Conversion"), message)
+        else:
+            QMessageBox.information(self, self.tr("Batch Conversion"), message)
+
+        if done and len(done) == len(results):
+            self.output_files = [r['output'] for r in done]
+            self.output_file = self.output_files[0]
+            self.accept()
+
     def on_conversion_success(self, return_code: int, stdout: str, stderr: str, output_path: str):
         """Handle successful conversion."""
         # Output results
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули профилирования импортируются по имени (как при запуске из src/tools/profiling)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'tools', 'profiling'))
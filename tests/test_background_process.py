@@ -0,0 +1,112 @@
+import os
+import stat
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from background_process import JobScheduler, ToolSession, get_tool_session
+
+# Эхо-инструмент: одна строка на входе - одна строка на выходе
+ECHO_CMD = [sys.executable, '-u', '-c', 'import sys\nfor line in sys.stdin:\n    print(line.strip(), flush=True)']
+
+
+def test_zip_consumer_keeps_session_alive():
+    session = get_tool_session(ECHO_CMD)
+    lines = ['1 2 3', '4 5 6']
+
+    for _ in range(2):
+        results = [result for _, result in zip(lines, session.stream(lines, timeout=10))]
+        assert results == [(1.0, 2.0, 3.0), (4.0, 5.0, 6.0)]
+
+    assert session.is_alive()
+    assert get_tool_session(ECHO_CMD) is session
+
+
+def test_abandoned_stream_cancels_session():
+    session = ToolSession(ECHO_CMD).start()
+    stream = session.stream(['1', '2', '3'], timeout=10)
+    assert next(stream) == (1.0,)
+    stream.close()
+    assert not session.is_alive()
+
+
+def test_failed_dependency_notifies_before_dependents():
+    scheduler = JobScheduler(max_workers=2)
+    order = []
+    last_done = threading.Event()
+
+    def submit(code, name, depends_on=(), on_finished=None):
+        # stdin явно: под pytest sys.stdin не имеет fileno и Popen падает сразу
+        return scheduler.submit([sys.executable, '-c', code], depends_on=depends_on, name=name,
+                                stdin_handle=subprocess.DEVNULL,
+                                on_finished=on_finished or (lambda job: order.append(job.name)))
+
+    failing = submit('import sys, time; time.sleep(0.2); sys.exit(1)', 'failing')
+    dependent = submit('pass', 'dependent', [failing])
+    submit('pass', 'last', [dependent], lambda job: (order.append(job.name), last_done.set()))
+
+    assert last_done.wait(10)
+    assert order == ['failing', 'dependent', 'last']
+    assert dependent.error == "dependency failing did not succeed"
+    scheduler.shutdown()
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="fake xicclu is a POSIX script")
+def test_update_lab_data_reuses_xicclu_session(tmp_path, monkeypatch):
+    pytest.importorskip('pyparsing')
+    import color_ref_readers
+    import icc_calcs
+    import locate_argyl
+
+    # Как xicclu: профиль (здесь - смещение L) читается один раз при запуске
+    xicclu = tmp_path / 'xicclu'
+    xicclu.write_text(f"#!{sys.executable} -u\n"
+                      "import sys\n"
+                      "offset = float(open(sys.argv[-1]).read())\n"
+                      "for line in sys.stdin:\n"
+                      "    r, g, b = (float(v) for v in line.split())\n"
+                      "    print(r / 2.55 - offset, g - 128, b - 128, flush=True)\n")
+    xicclu.chmod(xicclu.stat().st_mode | stat.S_IEXEC)
+
+    def unsupported(*args, **kwargs):
+        raise icc_calcs.IccProfileError("unsupported tag")
+
+    monkeypatch.setattr(icc_calcs, 'evaluate_icc', unsupported)
+    monkeypatch.setattr(locate_argyl, 'get_argyll_tool', lambda name: str(xicclu))
+
+    profile = tmp_path / 'paper.icc'
+    profile.write_text('0')
+    cmd = [str(xicclu), '-v0', '-ir', '-pl', '-s255', str(profile)]
+
+    def lab_of_white():
+        ti3_data = [{'rgb_reference': (255, 128, 0)}, {'rgb_reference': (0, 0, 255)}]
+        color_ref_readers.update_lab_data(ti3_data, str(profile))
+        assert ti3_data[1]['lab_reference_m'][1:] == (-128.0, 127.0)
+        return ti3_data[0]['lab_reference_m']
+
+    sessions = []
+    for _ in range(2):
+        assert lab_of_white() == (100.0, 0.0, -128.0)
+        sessions.append(get_tool_session(cmd, input_files=[str(profile)]))
+    assert sessions[0] is sessions[1]
+    assert sessions[0].is_alive()
+
+    # Профиль пересобран под тем же именем - сессия перезапускается
+    profile.write_text('10.0')
+    assert lab_of_white() == (90.0, 0.0, -128.0)
+    assert not sessions[0].is_alive()
+
+
+def test_tool_session_restarts_when_input_file_changes(tmp_path):
+    profile = tmp_path / 'profile.icc'
+    profile.write_text('a')
+    session = get_tool_session(ECHO_CMD + [str(profile)], input_files=[str(profile)])
+    assert get_tool_session(ECHO_CMD + [str(profile)], input_files=[str(profile)]) is session
+
+    profile.write_text('changed')
+    restarted = get_tool_session(ECHO_CMD + [str(profile)], input_files=[str(profile)])
+    assert restarted is not session
+    assert not session.is_alive()
+    assert restarted.request(['1 2'], timeout=10) == [(1.0, 2.0)]
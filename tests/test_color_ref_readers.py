@@ -0,0 +1,114 @@
+import pytest
+
+pytest.importorskip('pyparsing')
+
+from color_ref_readers import clear_reference_cache, parse_cgats_file, read_cgats_table
+
+# Ожидаемые значения - вывод legacy построчного парсера на тех же файлах
+
+ARGYLL_TI3 = """CTI3
+
+DESCRIPTOR "Argyll Calibration Target chart information 3"
+KEYWORD "SAMPLE_LOC"
+
+NUMBER_OF_FIELDS 11
+BEGIN_DATA_FORMAT
+SAMPLE_ID SAMPLE_LOC RGB_R RGB_G RGB_B XYZ_X XYZ_Y XYZ_Z LAB_L LAB_A LAB_B
+END_DATA_FORMAT
+
+NUMBER_OF_SETS 5
+BEGIN_DATA
+1 A1 100.0 0.0 0.0 41.24 21.26 1.93 53.24 80.09 67.20
+2 A2 0.0 100.0 0.0 35.76 71.52 11.92 87.73 -86.18 83.18
+3 "B1" 0.0 0.0 100.0 18.05 7.22 95.05 32.30 79.19 -107.86
+0 00 0.0 0.0 0.0 0.0 0.0 0.0 0.0 0.0 0.0
+4 B2 50.0 50.0 50.0 20.34 21.40 23.30 53.39 0.0 0.0
+END_DATA
+"""
+
+XRITE_COMMA_TXT = """CGATS.17
+ORIGINATOR "X-Rite"
+NUMBER_OF_FIELDS 4
+BEGIN_DATA_FORMAT
+SAMPLE_NAME Lab_L Lab_a Lab_b
+END_DATA_FORMAT
+NUMBER_OF_SETS 3
+BEGIN_DATA
+"A1" 52,39 -19,76 -1,84
+"A2" 88,73 26,56 -18,65
+"A3" 41.87 -42.28 27.79
+END_DATA
+"""
+
+RAGGED_TI3 = """CTI3
+BEGIN_DATA_FORMAT
+SAMPLE_ID SAMPLE_LOC RGB_R RGB_G RGB_B LAB_L LAB_A LAB_B
+END_DATA_FORMAT
+BEGIN_DATA
+1 A1 10 20 30 50 1 2
+2 A2 11 21
+
+3 A3 12 22 32 x 3 4 extra
+4 A4 13 23 33 60,5 5 6
+END_DATA
+"""
+
+
+@pytest.fixture
+def cgats_file(tmp_path):
+    clear_reference_cache()
+
+    def write(text, name='target.ti3'):
+        path = tmp_path / name
+        path.write_text(text, encoding='utf-8')
+        return str(path)
+
+    yield write
+    clear_reference_cache()
+
+
+def test_argyll_columns_and_technical_rows(cgats_file):
+    patches = list(parse_cgats_file(cgats_file(ARGYLL_TI3))['patches'])
+    assert patches == [
+        {'patch_id': 'A1', 'sample_loc': '1', 'rgb_reference': [100.0, 0.0, 0.0],
+         'xyz_target': [41.24, 21.26, 1.93], 'lab_target': [53.24, 80.09, 67.2]},
+        {'patch_id': 'A2', 'sample_loc': '2', 'rgb_reference': [0.0, 100.0, 0.0],
+         'xyz_target': [35.76, 71.52, 11.92], 'lab_target': [87.73, -86.18, 83.18]},
+        {'patch_id': 'B1', 'sample_loc': '3', 'rgb_reference': [0.0, 0.0, 100.0],
+         'xyz_target': [18.05, 7.22, 95.05], 'lab_target': [32.3, 79.19, -107.86]},
+        {'patch_id': 'B2', 'sample_loc': '4', 'rgb_reference': [50.0, 50.0, 50.0],
+         'xyz_target': [20.34, 21.4, 23.3], 'lab_target': [53.39, 0.0, 0.0]},
+    ]
+
+
+def test_comma_decimal_lab(cgats_file):
+    patches = list(parse_cgats_file(cgats_file(XRITE_COMMA_TXT, 'target.txt'))['patches'])
+    assert patches == [
+        {'patch_id': 'A1', 'lab_target': [52.39, -19.76, -1.84]},
+        {'patch_id': 'A2', 'lab_target': [88.73, 26.56, -18.65]},
+        {'patch_id': 'A3', 'lab_target': [41.87, -42.28, 27.79]},
+    ]
+
+
+def test_short_rows_and_unparsable_lab(cgats_file):
+    # Короткая строка пропускается, лишнее значение отбрасывается, нечисловой Lab - без lab_target
+    patches = list(parse_cgats_file(cgats_file(RAGGED_TI3))['patches'])
+    assert patches == [
+        {'patch_id': 'A1', 'sample_loc': '1', 'rgb_reference': [10.0, 20.0, 30.0], 'lab_target': [50.0, 1.0, 2.0]},
+        {'patch_id': 'A3', 'sample_loc': '3', 'rgb_reference': [12.0, 22.0, 32.0]},
+        {'patch_id': 'A4', 'sample_loc': '4', 'rgb_reference': [13.0, 23.0, 33.0], 'lab_target': [60.5, 5.0, 6.0]},
+    ]
+
+
+@pytest.mark.parametrize('columns, row', [
+    ('RGB_R RGB_G RGB_B', '1 2 x'),
+    ('XYZ_X XYZ_Y XYZ_Z', '- 2 3'),
+])
+def test_non_numeric_rgb_xyz_raises(cgats_file, columns, row):
+    path = cgats_file(f"CTI3\nBEGIN_DATA_FORMAT\nSAMPLE_ID SAMPLE_LOC {columns}\nEND_DATA_FORMAT\n"
+                      f"BEGIN_DATA\n1 A1 1 2 3\n2 A2 {row}\nEND_DATA\n")
+    with pytest.raises(ValueError, match="patch A2"):
+        parse_cgats_file(path)
+
+    table = read_cgats_table(path)
+    assert table.patch_names == ('A1', 'A2')